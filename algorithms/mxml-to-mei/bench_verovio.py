@@ -0,0 +1,80 @@
+"""
+Compare the latency of converting MusicXML to MEI with the verovio toolkit in this process
+(`run_mxml_to_mei_toolkit`) and with the verovio command (`run_mxml_to_mei_verovio`).
+
+Converts each file in a directory (by default the fixtures next to this script) with both
+engines and reports the median time per file. The toolkit is created before timing starts,
+like in the worker processes of `convert_ce_nodes`; the time to create it is reported separately.
+
+    python bench_verovio.py [directory] -r 5
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from mxml_to_mei import get_verovio_toolkit, run_mxml_to_mei_toolkit, run_mxml_to_mei_verovio, \
+    uncompress_mxl_to_xml
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def read_musicxml(path):
+    if path.endswith(".mxl"):
+        return uncompress_mxl_to_xml(path)
+    with open(path) as fp:
+        return fp.read()
+
+
+def convert_with_command(data):
+    """The verovio command path of `convert_mxml_to_mei_file`: write the input, run verovio, read the output"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inputname = os.path.join(tmpdir, "input.xml")
+        with open(inputname, "w") as fp:
+            fp.write(data)
+        return run_mxml_to_mei_verovio(inputname, os.path.join(tmpdir, "output.mei"))
+
+
+def median_time(function, data, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function(data)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", nargs="?", default=FIXTURES, help="Directory of MusicXML files")
+    parser.add_argument("-r", type=int, default=5, help="Number of conversions of each file")
+    args = parser.parse_args()
+
+    files = sorted(f for f in os.listdir(args.directory) if f.endswith((".xml", ".musicxml", ".mxl")))
+    engines = {}
+    start = time.perf_counter()
+    get_verovio_toolkit()
+    print(f"toolkit startup: {(time.perf_counter() - start) * 1000:.1f} ms")
+    engines["toolkit"] = run_mxml_to_mei_toolkit
+    if shutil.which("verovio"):
+        engines["command"] = convert_with_command
+    else:
+        print("verovio command not found, only timing the toolkit")
+
+    print(f"{'file':40}" + "".join(f"{name + ' (ms)':>16}" for name in engines))
+    totals = {name: [] for name in engines}
+    for filename in files:
+        data = read_musicxml(os.path.join(args.directory, filename))
+        row = f"{filename:40}"
+        for name, function in engines.items():
+            seconds = median_time(function, data, args.r)
+            totals[name].append(seconds)
+            row += f"{seconds * 1000:16.1f}"
+        print(row)
+    print(f"{'mean':40}" + "".join(f"{statistics.mean(t) * 1000:16.1f}" for t in totals.values()))
+
+
+if __name__ == "__main__":
+    main()
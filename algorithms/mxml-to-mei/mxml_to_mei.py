@@ -12,11 +12,17 @@ TODO: Need to check that the file doesn't already exist before creating it
 TODO: Duplicate imslp access methods in other algorithms. Can these be factored out?
 """
 
+import concurrent.futures
+import functools
 import io
+import multiprocessing
 import os
+import queue
+import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import zipfile
 from typing import Tuple
 from urllib.parse import urlparse, urlunparse
@@ -32,20 +38,30 @@ import trompace.queries.application as queries_application
 from trompace.queries.mediaobject import query_mediaobject
 
 
-config.load()
-
-ACCESS_KEY = os.environ['S3_ACCESS_KEY']
-SECRET_KEY = os.environ['S3_SECRET_KEY']
-S3_HOST = os.environ['S3_HOST']
 S3_BUCKET = 'meiconversion'
 # This is an s3 policy for a bucket called 'meiconversion' that allows anyone to download items from it
 S3_POLICY = '{"Version":"2012-10-17","Statement":[{"Effect":"Allow","Principal":{"AWS":["*"]},"Action":["s3:GetBucketLocation","s3:ListBucket"],"Resource":["arn:aws:s3:::meiconversion"]},{"Effect":"Allow","Principal":{"AWS":["*"]},"Action":["s3:GetObject"],"Resource":["arn:aws:s3:::meiconversion/*"]}]}'
 
 
+MUSICXML_FORMATS = ['application/vnd.recordare.musicxml+xml', 'application/vnd.recordare.musicxml']
+
+# Tells the threads of a stage of convert_ce_nodes to stop
+_DONE = object()
+# The key of the musescore SoftwareApplication in the result of get_application_ids
+MUSESCORE = "musescore"
+
+
 class FailedToConvertXml(Exception):
     pass
 
 
+class VerovioToolkitError(Exception):
+    pass
+
+
+_verovio_toolkit = None
+
+
 def get_or_create_musescore_application():
     creator = "https://github.com/trompamusic/ce-data-import/tree/master/algorithms/mxml-to-mei"
     source = "https://musescore.org"
@@ -82,16 +98,29 @@ def get_or_create_musescore_application():
         return app["identifier"]
 
 
-def get_or_create_verovio_application():
-    creator = "https://github.com/trompamusic/ce-data-import/tree/master/algorithms/mxml-to-mei"
-    source = "https://www.verovio.org"
-
+@functools.lru_cache(maxsize=None)
+def get_verovio_command_version():
+    """The version of the verovio command, as it prints it (Verovio x.y.z-...)"""
     run = subprocess.run(
         ['verovio', '-v'],
         check=True,
         capture_output=True
     )
-    version = str(run.stdout, "utf-8").strip()
+    return str(run.stdout, "utf-8").strip()
+
+
+def get_verovio_toolkit_version():
+    """The version of the verovio toolkit, in the same form as `get_verovio_command_version`"""
+    return f"Verovio {get_verovio_toolkit().getVersion()}"
+
+
+def get_or_create_verovio_application(version):
+    """Arguments:
+        version: the version of verovio that made an MEI file, from `get_verovio_command_version`
+                 or `get_verovio_toolkit_version`
+    """
+    creator = "https://github.com/trompamusic/ce-data-import/tree/master/algorithms/mxml-to-mei"
+    source = "https://www.verovio.org"
 
     query_application = queries_application.query_softwareapplication(
         creator=creator,
@@ -173,10 +202,13 @@ def uncompress_mxl_to_xml(mxl_file):
             return zipfp.read(xmlnames[0]).decode("utf-8")
 
 
-def convert_mxml_to_mei_file(inputdata, inputname) -> Tuple[str, bool]:
+def convert_mxml_to_mei_file(inputdata, inputname, use_toolkit=False) -> Tuple[str, bool, str]:
     """
-    returns a tuple  meidata, used_musescore
+    returns a tuple  meidata, used_musescore, verovio_version
     used_musescore is True if it had to convert with musescore first
+    verovio_version is the version of the verovio toolkit or command that made the MEI
+    If use_toolkit is True, first try to convert in this process with the verovio toolkit
+    (see `get_verovio_toolkit`), and use the verovio command if that fails
     """
     used_musescore = False
     with tempfile.TemporaryDirectory() as tmpdir:
@@ -201,24 +233,72 @@ def convert_mxml_to_mei_file(inputdata, inputname) -> Tuple[str, bool]:
             except subprocess.CalledProcessError as spe:
                 print(spe.stderr)
                 raise e
+        if hasattr(data, "read"):
+            data = data.read().decode("utf-8")
+
+        if use_toolkit:
+            try:
+                return run_mxml_to_mei_toolkit(data), used_musescore, get_verovio_toolkit_version()
+            except VerovioToolkitError as e:
+                print(f"failed to convert with the verovio toolkit ({e}), trying the verovio command")
+
+        if not shutil.which("verovio"):
+            # Only the verovio python package is installed
+            raise FailedToConvertXml("the verovio command isn't installed")
 
         outputname = os.path.join(tmpdir, "output.mei")
         inputname = os.path.join(tmpdir, "input.xml")
         with open(inputname, "w") as fp:
             fp.write(data)
         try:
-            return run_mxml_to_mei_verovio(inputname, outputname), used_musescore or False
+            meidata = run_mxml_to_mei_verovio(inputname, outputname)
         except subprocess.CalledProcessError:
             # Vervio failed to run, for example it could have segfaulted! In this case, convert
             # the file using musescore, from mxml to mxml and try again
             print("failed to convert with verovio, trying again")
             try:
                 new_mxml = run_mxml_to_mxml_musescore(inputname, tmpdir)
-                return run_mxml_to_mei_verovio(new_mxml, outputname), used_musescore or True
+                meidata = run_mxml_to_mei_verovio(new_mxml, outputname)
+                used_musescore = True
             except subprocess.CalledProcessError as e:
                 print(e)
                 # Still got a problem... give up
                 raise FailedToConvertXml(e)
+        return meidata, used_musescore, get_verovio_command_version()
+
+
+def get_verovio_toolkit():
+    """The verovio toolkit of this process. It is made the first time that it is used, so that
+    each process only loads the verovio fonts and resources once.
+    Raises VerovioToolkitError if the verovio python package isn't installed"""
+    global _verovio_toolkit
+    if _verovio_toolkit is None:
+        try:
+            import verovio
+        except ImportError as e:
+            raise VerovioToolkitError(e)
+        _verovio_toolkit = verovio.toolkit()
+    return _verovio_toolkit
+
+
+def init_conversion_worker():
+    """Load the verovio toolkit when a worker process of `convert_ce_nodes` starts"""
+    try:
+        get_verovio_toolkit()
+    except VerovioToolkitError as e:
+        print(f"The verovio toolkit isn't available, using the verovio command ({e})", file=sys.stderr)
+
+
+def run_mxml_to_mei_toolkit(data):
+    """Convert a MusicXML string to MEI with the verovio toolkit, like `run_mxml_to_mei_verovio`"""
+    toolkit = get_verovio_toolkit()
+    toolkit.setInputFrom("musicxml")
+    if not toolkit.loadData(data):
+        raise VerovioToolkitError("verovio couldn't load the file")
+    mei = toolkit.getMEI()
+    if not mei:
+        raise VerovioToolkitError("verovio didn't output any MEI")
+    return mei
 
 
 def run_mxml_to_mei_verovio(inputname, outputname):
@@ -242,11 +322,12 @@ def run_mxml_to_mxml_musescore(inputname, tmpdir):
 
 
 def upload_mei_to_s3(meidata, filename):
+    s3_host = os.environ['S3_HOST']
     client = boto3.client(
         's3',
-        endpoint_url=S3_HOST,
-        aws_access_key_id=ACCESS_KEY,
-        aws_secret_access_key=SECRET_KEY,
+        endpoint_url=s3_host,
+        aws_access_key_id=os.environ['S3_ACCESS_KEY'],
+        aws_secret_access_key=os.environ['S3_SECRET_KEY'],
     )
 
     try:
@@ -257,7 +338,7 @@ def upload_mei_to_s3(meidata, filename):
     client.upload_fileobj(meidata, S3_BUCKET, filename)
 
     file_path = os.path.join(S3_BUCKET, filename)
-    host_parsed = list(urlparse(S3_HOST))
+    host_parsed = list(urlparse(s3_host))
     host_parsed[2] = file_path
 
     return urlunparse(host_parsed)
@@ -337,22 +418,35 @@ def update_mei_node(mei_id, meiurl):
         return None
 
 
-def join_existing_and_new_mei(musiccomposition_id, mxml_mo_id, mei_mo_id, used_musescore: bool):
+def get_application_ids(verovio_versions, musescore=False):
+    """Find or create the SoftwareApplications of the programs that convert files
+    Arguments:
+        verovio_versions: the versions of verovio, see `get_or_create_verovio_application`
+        musescore: also get the musescore SoftwareApplication
+    Returns:
+        a dictionary {verovio version: identifier}, with the musescore identifier under MUSESCORE
+    """
+    applications = {version: get_or_create_verovio_application(version) for version in set(verovio_versions)}
+    if musescore:
+        applications[MUSESCORE] = get_or_create_musescore_application()
+    return applications
+
+
+def join_existing_and_new_mei(musiccomposition_id, mxml_mo_id, mei_mo_id, application_id,
+                              musescore_application_id=None):
     """
     Indicate that the MEI is an exampleOfWork of the composition
     That the MEI wasDerivedFrom the MXML
-    That the MEI used verovio to create it
+    That the MEI used verovio (application_id) to create it, and musescore if musescore_application_id is set
     """
 
-    application_id = get_or_create_verovio_application()
     example_mutation = mediaobject.mutation_merge_mediaobject_example_of_work(mei_mo_id, work_identifier=musiccomposition_id)
     submit_query(example_mutation, auth_required=True)
     derivedfrom_mutation = mediaobject.mutation_merge_media_object_wasderivedfrom(mei_mo_id, mxml_mo_id)
     submit_query(derivedfrom_mutation, auth_required=True)
     used_mutation = mediaobject.mutation_add_media_object_used(mei_mo_id, application_id)
     submit_query(used_mutation, auth_required=True)
-    if used_musescore:
-        musescore_application_id = get_or_create_musescore_application()
+    if musescore_application_id:
         used_mutation = mediaobject.mutation_add_media_object_used(mei_mo_id, musescore_application_id)
         submit_query(used_mutation, auth_required=True)
 
@@ -368,46 +462,67 @@ def mei_for_xml_exists(mediaobject_id):
         return False
 
 
-def process_cpdl(mediaobject):
-    mo_contenturl = mediaobject['contentUrl']
-
-    mei_mo_id = create_blank_mei_node()
-    mei_filename = mei_mo_id + ".mei"
-
-    r = requests.get(mo_contenturl)
-    file_content = io.BytesIO(r.content)
-
-    try:
-        mei_content, used_musescore = convert_mxml_to_mei_file(file_content, mo_contenturl)
+def get_mediaobject_to_convert(mediaobject_id):
+    """Get a MediaObject that refers to a MusicXML file from cpdl or imslp, if it hasn't been converted yet
+    Returns:
+        (mediaobject, work_id), or None if the MediaObject can't or shouldn't be converted
+    """
+    if mei_for_xml_exists(mediaobject_id):
+        print("An MEI file derived from this MusicXML already exists", file=sys.stderr)
+        return None
 
-        mei_fp = io.BytesIO(mei_content.encode("utf-8"))
-        mei_url = upload_mei_to_s3(mei_fp, mei_filename)
+    return_items = ["identifier", "name", "contributor", "url", "contentUrl", {"exampleOfWork": ["identifier"]}]
+    mo_query = query_mediaobject(identifier=mediaobject_id, return_items=return_items)
+    mo_response = submit_query(mo_query)
+    mo = mo_response.get('data', {}).get('MediaObject', [])
+    if not mo:
+        print("Cannot find a MediaObject", file=sys.stderr)
+        return None
+    mo = mo[0]
+    work = mo['exampleOfWork']
+    if not work:
+        print('Unexpectedly this MediaObject has no exampleOfWork', file=sys.stderr)
+        return None
+    if mo['contributor'] not in ("https://cpdl.org", "https://imslp.org"):
+        print("Contributor isn't one of cpdl or imslp", file=sys.stderr)
+        return None
+    return mo, work[0]['identifier']
 
-        update_mei_node(mei_mo_id, mei_url)
 
-        return mei_mo_id, used_musescore
-    except FailedToConvertXml:
-        return None, False
+def download_mediaobject_file(mediaobject):
+    """Download the MusicXML file of a cpdl or imslp MediaObject, in the form that
+    `convert_mxml_to_mei_file` takes"""
+    mo_contenturl = mediaobject['contentUrl']
+    if mediaobject['contributor'] == "https://cpdl.org":
+        r = requests.get(mo_contenturl)
+        return io.BytesIO(r.content)
+    else:
+        download_url = imslp_file_url_to_download_url(mediaobject['name'])
+        return get_file_in_imslp_archive(download_url, mo_contenturl)
 
 
-def process_imslp(mediaobject):
-    mo_contenturl = mediaobject['contentUrl']
+def store_mei(mediaobject, work_id, mei_content, used_musescore, verovio_version, applications=None):
+    """Upload an MEI file to s3, create a MediaObject for it and link it to the MusicXML MediaObject
+    and the work
+    Arguments:
+        applications: the result of `get_application_ids`. If it's not set, the applications are looked up
+    Returns:
+        the identifier of the new MediaObject
+    """
+    if applications is None:
+        applications = get_application_ids([verovio_version], used_musescore)
     mei_mo_id = create_blank_mei_node()
     mei_filename = mei_mo_id + ".mei"
 
-    download_url = imslp_file_url_to_download_url(mediaobject['name'])
-    mxml_file = get_file_in_imslp_archive(download_url, mo_contenturl)
+    mei_fp = io.BytesIO(mei_content.encode("utf-8"))
+    mei_url = upload_mei_to_s3(mei_fp, mei_filename)
+    update_mei_node(mei_mo_id, mei_url)
 
-    try:
-        mei_content, used_musescore = convert_mxml_to_mei_file(mxml_file, mo_contenturl)
-
-        mei_fp = io.BytesIO(mei_content.encode("utf-8"))
-        mei_url = upload_mei_to_s3(mei_fp, mei_filename)
-        update_mei_node(mei_mo_id, mei_url)
-
-        return mei_mo_id, used_musescore
-    except FailedToConvertXml:
-        return None, False
+    join_existing_and_new_mei(musiccomposition_id=work_id,
+                              mxml_mo_id=mediaobject['identifier'], mei_mo_id=mei_mo_id,
+                              application_id=applications[verovio_version],
+                              musescore_application_id=applications[MUSESCORE] if used_musescore else None)
+    return mei_mo_id
 
 
 def convert_ce_node(mediaobject_id):
@@ -417,45 +532,171 @@ def convert_ce_node(mediaobject_id):
     - do conversion
     - create mediaobject, link to input file, link to composition, upload to s3"""
 
-    if mei_for_xml_exists(mediaobject_id):
-        print("An MEI file derived from this MusicXML already exists", file=sys.stderr)
+    to_convert = get_mediaobject_to_convert(mediaobject_id)
+    if to_convert is None:
         return
-
-    return_items = ["identifier", "name", "contributor", "url", "contentUrl", {"exampleOfWork": ["identifier"]}]
-    mo_query = query_mediaobject(identifier=mediaobject_id, return_items=return_items)
-    mo_response = submit_query(mo_query)
-    mo = mo_response.get('data', {}).get('MediaObject', [])
-    if mo:
-        mo = mo[0]
-        mo_id = mo['identifier']
-        mo_contributor = mo['contributor']
-        work = mo['exampleOfWork']
-        if not work:
-            print('Unexpectedly this MediaObject has no exampleOfWork', file=sys.stderr)
-            return
-        work_id = work[0]['identifier']
-
-        if mo_contributor == "https://cpdl.org":
-            mei_id, used_musescore = process_cpdl(mo)
-        elif mo_contributor == "https://imslp.org":
-            mei_id, used_musescore = process_imslp(mo)
-        else:
-            print("Contributor isn't one of cpdl or imslp", file=sys.stderr)
-            return
-        if mei_id:
-            join_existing_and_new_mei(musiccomposition_id=work_id,
-                                      mxml_mo_id=mo_id, mei_mo_id=mei_id,
-                                      used_musescore=used_musescore)
-        else:
-            print("Failed to convert file", file=sys.stderr)
-    else:
-        print("Cannot find a MediaObject", file=sys.stderr)
+    mo, work_id = to_convert
+    mxml_file = download_mediaobject_file(mo)
+    try:
+        mei_content, used_musescore, verovio_version = convert_mxml_to_mei_file(mxml_file, mo['contentUrl'])
+    except FailedToConvertXml:
+        print("Failed to convert file", file=sys.stderr)
         return
+    return store_mei(mo, work_id, mei_content, used_musescore, verovio_version)
+
+
+def find_mediaobjects_to_convert(contributor):
+    """The identifiers of all MusicXML MediaObjects from a contributor (https://cpdl.org or https://imslp.org)"""
+    identifiers = []
+    for encodingformat in MUSICXML_FORMATS:
+        mo_query = query_mediaobject(contributor=contributor, encodingformat=encodingformat,
+                                     return_items=["identifier"])
+        mo_response = submit_query(mo_query)
+        identifiers.extend(mo['identifier'] for mo in mo_response.get('data', {}).get('MediaObject', []))
+    return identifiers
+
+
+def _start_stage(name, function, inbox, outbox, threads, failures):
+    """Start `threads` threads that call `function` on each item from `inbox` until they get _DONE,
+    and put the results that aren't None in `outbox`. If `function` raises an exception, the item is
+    dropped and (name, item, exception) is added to `failures`"""
+    def work():
+        while True:
+            item = inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = function(item)
+            except Exception as e:
+                print(f"{name} failed: {e!r}", file=sys.stderr)
+                # list.append is atomic
+                failures.append((name, item, e))
+                result = None
+            if result is not None and outbox is not None:
+                outbox.put(result)
+
+    started = [threading.Thread(target=work, name=f"{name}-{i}", daemon=True) for i in range(threads)]
+    for thread in started:
+        thread.start()
+    return started
+
+
+def _finish_stage(threads, inbox):
+    for _ in threads:
+        inbox.put(_DONE)
+    for thread in threads:
+        thread.join()
+
+
+class _ConversionPool:
+    """A pool of processes that run `convert_mxml_to_mei_file`. With use_toolkit, each process keeps
+    its own verovio toolkit. If a process crashes (verovio can segfault on some files), the pool is
+    replaced and the files that were being converted are converted again with the verovio command"""
+
+    def __init__(self, workers, use_toolkit):
+        self.workers = workers
+        self.use_toolkit = use_toolkit
+        self._lock = threading.Lock()
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        # Files are converted in a fresh process, not a fork of this one with its running threads
+        return concurrent.futures.ProcessPoolExecutor(
+            self.workers, mp_context=multiprocessing.get_context("forkserver"),
+            initializer=init_conversion_worker if self.use_toolkit else None)
+
+    def convert(self, inputdata, inputname):
+        pool = self._pool
+        try:
+            return pool.submit(convert_mxml_to_mei_file, inputdata, inputname, self.use_toolkit).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            if not self.use_toolkit:
+                raise
+            print(f"a conversion process crashed, converting {inputname} with the verovio command", file=sys.stderr)
+            with self._lock:
+                if self._pool is pool:
+                    pool.shutdown(wait=False)
+                    self._pool = self._new_pool()
+            return self._pool.submit(convert_mxml_to_mei_file, inputdata, inputname, False).result()
+
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+def convert_ce_nodes(mediaobject_ids, workers=None, downloaders=4, uploaders=4, use_toolkit=True):
+    """Convert many MediaObjects. Downloads and CE updates run in threads, and conversions run in a pool
+    of `workers` processes (one for each core by default). The stages are connected by bounded queues,
+    so that files are downloaded and uploaded while others are being converted, without downloading
+    much more than the converters can keep up with.
+    If use_toolkit is True, files are converted with a verovio toolkit in each worker process instead of
+    starting the verovio command for each file.
+    Returns:
+        (results, failures): a list of (mediaobject_id, mei_mediaobject_id) for each converted MediaObject,
+        and a list of (mediaobject_id, stage, exception) for each MediaObject that couldn't be
+        downloaded, converted or stored. MediaObjects that were already converted or that aren't from
+        cpdl or imslp are in neither list
+    """
+    workers = workers or os.cpu_count()
+    id_queue = queue.Queue(maxsize=downloaders * 2)
+    convert_queue = queue.Queue(maxsize=workers * 2)
+    upload_queue = queue.Queue(maxsize=uploaders * 2)
+    results = []
+    failures = []
+
+    def download(mediaobject_id):
+        to_convert = get_mediaobject_to_convert(mediaobject_id)
+        if to_convert is None:
+            return None
+        mo, work_id = to_convert
+        return mo, work_id, download_mediaobject_file(mo)
+
+    def convert(item):
+        mo, work_id, mxml_file = item
+        mei_content, used_musescore, verovio_version = pool.convert(mxml_file, mo['contentUrl'])
+        return mo, work_id, mei_content, used_musescore, verovio_version
+
+    def upload(item):
+        mo, work_id, mei_content, used_musescore, verovio_version = item
+        mei_mo_id = store_mei(mo, work_id, mei_content, used_musescore, verovio_version, applications)
+        # list.append is atomic
+        results.append((mo['identifier'], mei_mo_id))
+        print(f"{mo['identifier']} -> {mei_mo_id}")
+
+    # The applications are looked up or created once, and not by each upload thread
+    verovio_versions = []
+    if use_toolkit:
+        try:
+            verovio_versions.append(get_verovio_toolkit_version())
+        except VerovioToolkitError as e:
+            print(f"The verovio toolkit isn't available, using the verovio command ({e})", file=sys.stderr)
+    if shutil.which("verovio"):
+        verovio_versions.append(get_verovio_command_version())
+    applications = get_application_ids(verovio_versions, musescore=shutil.which("mscore3") is not None)
+
+    pool = _ConversionPool(workers, use_toolkit)
+    try:
+        # One thread per worker process, each waits for the conversion that it submitted
+        download_threads = _start_stage("download", download, id_queue, convert_queue, downloaders, failures)
+        convert_threads = _start_stage("convert", convert, convert_queue, upload_queue, workers, failures)
+        upload_threads = _start_stage("upload", upload, upload_queue, None, uploaders, failures)
+
+        for mediaobject_id in dict.fromkeys(mediaobject_ids):
+            id_queue.put(mediaobject_id)
+        _finish_stage(download_threads, id_queue)
+        _finish_stage(convert_threads, convert_queue)
+        _finish_stage(upload_threads, upload_queue)
+    finally:
+        pool.shutdown()
+    # The items of the convert and upload stages start with the MediaObject
+    failures = [(item if stage == "download" else item[0]['identifier'], stage, e) for stage, item, e in failures]
+    return results, failures
 
 
 @click.group()
 def cli():
-    pass
+    # Not loaded on import, so that the conversion functions can be used without a CE
+    # (worker processes of convert_ce_nodes, bench_verovio.py)
+    config.load()
 
 
 @cli.command("convert-mxml-to-mei-node")
@@ -472,5 +713,33 @@ def convert_mxml_to_mei_file_command(inputpath, outputpath):
     convert_mxml_to_mei_file(inputpath, outputpath)
 
 
+@cli.command("convert-mxml-to-mei-batch")
+@click.argument("mediaobject_ids", nargs=-1)
+@click.option("--ids-file", type=click.File("r"), help="File with a MediaObject id on each line, - for stdin")
+@click.option("--contributor", type=click.Choice(["https://cpdl.org", "https://imslp.org"]),
+              help="Convert all MusicXML MediaObjects from this contributor")
+@click.option("--workers", type=int, default=None, help="Number of conversion processes (default: number of cores)")
+@click.option("--downloaders", type=int, default=4, help="Number of download threads")
+@click.option("--uploaders", type=int, default=4, help="Number of upload threads")
+@click.option("--engine", type=click.Choice(["toolkit", "command"]), default="toolkit",
+              help="Convert with a verovio toolkit in each worker, or by running the verovio command for each file")
+def convert_mxml_to_mei_batch_command(mediaobject_ids, ids_file, contributor, workers, downloaders, uploaders,
+                                      engine):
+    """Convert many MediaObjects in parallel"""
+    mediaobject_ids = list(mediaobject_ids)
+    if ids_file:
+        mediaobject_ids.extend(line.strip() for line in ids_file if line.strip())
+    if contributor:
+        mediaobject_ids.extend(find_mediaobjects_to_convert(contributor))
+    results, failures = convert_ce_nodes(mediaobject_ids, workers, downloaders, uploaders,
+                                         use_toolkit=engine == "toolkit")
+    print(f"Converted {len(results)} of {len(set(mediaobject_ids))} MediaObjects")
+    if failures:
+        print(f"{len(failures)} MediaObjects failed:", file=sys.stderr)
+        for mediaobject_id, stage, e in failures:
+            print(f"  {mediaobject_id}: {stage} failed: {e!r}", file=sys.stderr)
+        sys.exit(1)
+
+
 if __name__ == '__main__':
     cli()
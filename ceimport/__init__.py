@@ -1,4 +1,13 @@
+import concurrent.futures
+import importlib
+import itertools
 import logging
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import types
 
 logger = logging.getLogger(__name__)
 ch = logging.StreamHandler()
@@ -9,7 +18,157 @@ logger.addHandler(ch)
 logger.setLevel(logging.DEBUG)
 
 
-def chunks(lst, n):
-    """Yield successive n-sized chunks from lst."""
-    for i in range(0, len(lst), n):
-        yield lst[i:i + n]
+def chunks(iterable, n):
+    """Yield successive n-sized lists from iterable. The last list may be shorter.
+    iterable can be any iterable, including a generator, and is consumed lazily."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, n))
+        if not chunk:
+            return
+        yield chunk
+
+
+def open_sqlite_index(path, schema, build):
+    """Open the sqlite index at `path`, first building it with build(connection) if it doesn't exist.
+    The index is built in a temporary file which is only moved to `path` when it is complete, so that
+    an interrupted build is started again the next time instead of leaving a partial index."""
+    if not os.path.exists(path):
+        tmp_path = path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.executescript(schema)
+            with conn:
+                build(conn)
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.executescript(schema)
+    return conn
+
+
+class _LazyModule(types.ModuleType):
+    """Stands in for a module until one of its attributes is used, see `lazy_import`"""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            # The import system locks the module while it runs, so if threads use it at the same
+            # time, one of them runs it and the others wait for it to finish
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """Import a module, but only run its code the first time that one of its attributes is used.
+
+    The site modules import large libraries (bs4, mwparserfromhell, requests_cache, ...).
+    Modules that are imported with this at the top of another module are only loaded by the
+    commands that use them. The module is imported normally on first use, so it can be used
+    from any thread, and `import` elsewhere gets the loaded module.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+class _PrefetchError:
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def prefetch(iterable, size):
+    """Consume an iterable in a background thread, keeping up to `size` items ready.
+
+    Use this between two stages of a pipeline of generators so that the slow stage
+    (e.g. downloading pages) keeps running while the next stage is processing items.
+    At most `size` items are held in memory at once.
+    If the iterable raises an exception, it is re-raised in the consumer.
+    If the consumer stops early (it breaks out of its loop, raises, or closes the generator),
+    the background thread stops too.
+    """
+    buffer = queue.Queue(maxsize=size)
+    done = object()
+    stopped = threading.Event()
+
+    def put(item):
+        """Add an item to the buffer, returns False if the consumer stopped before there was space"""
+        while not stopped.is_set():
+            try:
+                buffer.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except Exception as e:
+            put(_PrefetchError(e))
+            return
+        put(done)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = buffer.get()
+            if item is done:
+                return
+            if isinstance(item, _PrefetchError):
+                raise item.exception
+            yield item
+    finally:
+        stopped.set()
+
+
+def run_lookups_by_host(lookups):
+    """Run a list of lookups against external sites concurrently.
+
+    Lookups for different hosts are run at the same time, but lookups for the same host are
+    run one after the other so that we never have more than one request in flight to a site
+    and each site's own rate limiting still applies.
+
+    Arguments:
+        lookups: a list of (host, function, args) tuples
+    Returns:
+        a list with the result of each function, in the same order as `lookups`
+    """
+    by_host = {}
+    for position, (host, function, args) in enumerate(lookups):
+        by_host.setdefault(host, []).append((position, function, args))
+
+    results = [None] * len(lookups)
+
+    def run_host(host_lookups):
+        for position, function, args in host_lookups:
+            results[position] = function(*args)
+
+    if not by_host:
+        return results
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(by_host)) as executor:
+        futures = [executor.submit(run_host, host_lookups) for host_lookups in by_host.values()]
+        for future in futures:
+            # Re-raise any exception from a lookup
+            future.result()
+    return results
@@ -0,0 +1,353 @@
+"""
+Columnar batches of CE entities.
+
+A batch holds the arguments of the trompace create mutation of many entities of one type
+(e.g. `mutation_create_media_object`) as one list per argument instead of one dict per entity.
+Arguments which are the same for every entity (contributor, creator, format_, ...) are stored
+once. Values are encoded one column at a time, and each distinct value is only encoded once, which
+makes large batches with repeated values (languages, dates, hosts) cheap.
+
+`mutations` returns GraphQL documents which create many entities at once, each entity as an
+aliased mutation (e0, e1, ...), like `trompace.mutations.templates.format_sequence_mutation`.
+`variables` returns the same arguments as GraphQL variables, for `ceimport.connection.create_many`.
+
+    batch = MediaObjectBatch.from_columns(source=sources, contenturl=urls, title=titles, name=names,
+                                          encodingformat=formats,
+                                          contributor="https://cpdl.org", format_="text/html")
+    batch.set("creator", CREATOR_URL)
+    for document, indexes in batch.mutations():
+        ...
+"""
+import datetime
+import json
+
+from trompace.constants import SUPPORTED_GENDER, SUPPORTED_LANGUAGES
+from trompace.exceptions import NotAMimeTypeException, UnsupportedLanguageException
+from trompace.mutations import MUTATION
+from trompace.mutations.templates import MUTATION_ALIAS_TEMPLATE
+
+DATE_PARTS = ("year", "month", "day")
+
+
+def _date_parts(value):
+    """{year: .., month: .., day: ..} of a date, or None if it can't be parsed"""
+    if value is None:
+        return None
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        parts = [value.year, value.month, value.day]
+    elif isinstance(value, int):
+        parts = [value]
+    else:
+        value = str(value).strip().split("T")[0]
+        try:
+            parts = [int(p) for p in value.split("-") if p]
+        except ValueError:
+            return None
+        if not parts or len(parts) > 3:
+            return None
+    return dict(zip(DATE_PARTS, parts))
+
+
+def _encode_date(value):
+    """Convert a date, datetime, year or string (1685, 1685-03, 1685-03-21, 1685-03-21T00:00:00Z)
+    to the GraphQL value of a _Neo4jDate ({ year: 1685 month: 3 day: 21 }).
+    Returns None for values that can't be parsed"""
+    parts = _date_parts(value)
+    if parts is None:
+        return None
+    return "{{ {0}}}".format("".join(f"{name}: {part} " for name, part in parts.items()))
+
+
+def _map_unique(function, values):
+    """[function(v) for v in values], calling `function` once for each distinct value"""
+    results = {}
+    mapped = []
+    for v in values:
+        try:
+            mapped.append(results[v])
+        except KeyError:
+            results[v] = function(v)
+            mapped.append(results[v])
+        except TypeError:
+            # Unhashable values
+            mapped.append(function(v))
+    return mapped
+
+
+class EntityBatch:
+    """A columnar batch of CE entities of one type. Subclasses set:
+        DATA_TYPE: the type of the entities in the CE
+        MUTATION_NAME: the name of the create mutation in the CE
+        FIELDS: the arguments of the trompace create mutation, mapped to their name in GraphQL
+        DATE_FIELDS: arguments which are _Neo4jDates
+        ENUM_FIELDS: arguments which are written without quotes (GraphQL enums), and their values
+    """
+    DATA_TYPE = None
+    MUTATION_NAME = None
+    FIELDS = {}
+    REQUIRED = ("title", "contributor", "creator", "source", "format_")
+    DATE_FIELDS = ()
+    ENUM_FIELDS = {"language": SUPPORTED_LANGUAGES}
+
+    def __init__(self):
+        self._length = 0
+        # argument name: list of values, one for each entity
+        self.columns = {}
+        # argument name: a value that is the same for all entities
+        self.constants = {}
+
+    @classmethod
+    def from_columns(cls, **columns):
+        """Make a batch from lists of values, one list for each argument. An argument that isn't
+        a list is used for all entities"""
+        batch = cls()
+        lengths = {len(v) for v in columns.values() if isinstance(v, list)}
+        if len(lengths) > 1:
+            raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+        batch._length = lengths.pop() if lengths else 0
+        for name, values in columns.items():
+            batch._check_field(name)
+            if isinstance(values, list):
+                batch.columns[name] = values
+            else:
+                batch.constants[name] = values
+        return batch
+
+    @classmethod
+    def from_rows(cls, rows, strict=False, **constants):
+        """Make a batch from a list of dictionaries of mutation arguments, e.g. those made for
+        `loader.create_mediaobject`. Keys which aren't arguments of the mutation are ignored, unless
+        `strict` is set"""
+        rows = list(rows)
+        if strict:
+            for row in rows:
+                for name in row:
+                    cls._check_field(name)
+        names = {k for row in rows for k in row if k in cls.FIELDS and k not in constants}
+        columns = {name: [row.get(name) for row in rows] for name in names}
+        batch = cls.from_columns(**columns, **constants)
+        batch._length = len(rows)
+        return batch
+
+    @classmethod
+    def _check_field(cls, name):
+        if name not in cls.FIELDS:
+            raise ValueError(f"{name} is not an argument of {cls.MUTATION_NAME}")
+
+    def __len__(self):
+        return self._length
+
+    def set(self, name, value):
+        """Set an argument to the same value for all entities"""
+        self._check_field(name)
+        self.columns.pop(name, None)
+        self.constants[name] = value
+
+    def column(self, name):
+        """The values of an argument, as a list with one value for each entity"""
+        if name in self.constants:
+            return [self.constants[name]] * len(self)
+        return self.columns.get(name, [None] * len(self))
+
+    def row(self, index):
+        """The arguments of one entity, as a dictionary of values that are not None"""
+        row = {name: values[index] for name, values in self.columns.items() if values[index] is not None}
+        row.update((name, value) for name, value in self.constants.items() if value is not None)
+        return row
+
+    def rows(self):
+        return [self.row(i) for i in range(len(self))]
+
+    def select(self, indexes):
+        """A new batch with the entities at `indexes`"""
+        batch = type(self)()
+        batch._length = len(indexes)
+        batch.columns = {name: [values[i] for i in indexes] for name, values in self.columns.items()}
+        batch.constants = dict(self.constants)
+        return batch
+
+    def validate(self):
+        """Check the arguments like the trompace create mutations do
+        Raises:
+            ValueError: if a required argument is missing, or an enum has an unexpected value
+            UnsupportedLanguageException: if a language is not one of the supported languages
+            NotAMimeTypeException: if a format is not a mimetype
+        """
+        for name in self.REQUIRED:
+            values = self.column(name)
+            if None in values:
+                raise ValueError(f"required argument '{name}' must not be None (entity {values.index(None)})")
+        for name in ("format_", "encodingformat"):
+            if name in self.FIELDS:
+                for i, value in enumerate(self.column(name)):
+                    if value is not None and "/" not in value:
+                        raise NotAMimeTypeException(value)
+        for name, allowed in self.ENUM_FIELDS.items():
+            for value in self.column(name):
+                if value is not None and value.lower() not in allowed:
+                    if name == "language":
+                        raise UnsupportedLanguageException(value)
+                    raise ValueError(f"unexpected value for {name}: {value}")
+
+    def _encoded_columns(self):
+        """(encoded value, encoded column) for each argument, in the order of FIELDS. Arguments that
+        are the same for all entities have an encoded value, others have a column of encoded values"""
+        encoder = json.JSONEncoder()
+
+        def encode(name, graphql_name, value):
+            if value is None:
+                return None
+            if name in self.DATE_FIELDS:
+                value = _encode_date(value)
+                if value is None:
+                    return None
+            elif name in self.ENUM_FIELDS:
+                value = value.lower()
+            else:
+                value = encoder.encode(value)
+            return f"{graphql_name}: {value}"
+
+        encoded = []
+        for name, graphql_name in self.FIELDS.items():
+            if name in self.constants:
+                value = encode(name, graphql_name, self.constants[name])
+                if value is not None:
+                    encoded.append((value, None))
+            elif name in self.columns:
+                column = _map_unique(lambda v: encode(name, graphql_name, v), self.columns[name])
+                encoded.append((None, column))
+        return encoded
+
+    def mutations(self, batch_size=50):
+        """Make the create mutations for all entities in this batch.
+        Yields:
+            (document, indexes), a GraphQL document that creates up to `batch_size` entities, and the
+            index in this batch of the entity created by each aliased mutation in the document
+        """
+        self.validate()
+        encoded = self._encoded_columns()
+        for start in range(0, len(self), batch_size):
+            indexes = range(start, min(start + batch_size, len(self)))
+            aliases = []
+            for alias, i in enumerate(indexes):
+                parameters = [value if column is None else column[i] for value, column in encoded]
+                aliases.append(MUTATION_ALIAS_TEMPLATE.format(
+                    mutationalias=f"e{alias}", mutationname=self.MUTATION_NAME,
+                    parameters="\n        ".join(p for p in parameters if p is not None)))
+            yield MUTATION.format(mutation="\n".join(aliases)), list(indexes)
+
+    @property
+    def arguments(self):
+        """The GraphQL names of all arguments of the mutation, for `ceimport.connection.create_many`.
+        They are the same for every batch of this type, so that it only needs one GraphQL document"""
+        return tuple(self.FIELDS.values())
+
+    def variables(self):
+        """The arguments of all entities in this batch as GraphQL variables, for
+        `ceimport.connection.create_many`. Dates are _Neo4jDateInput objects and enums are lowercase.
+        Returns:
+            a dictionary of the variables of each entity, without the arguments that aren't set
+        """
+        self.validate()
+
+        def convert(name, value):
+            if value is None:
+                return None
+            if name in self.DATE_FIELDS:
+                return _date_parts(value)
+            if name in self.ENUM_FIELDS:
+                return value.lower()
+            return value
+
+        columns = []
+        for name, graphql_name in self.FIELDS.items():
+            if name in self.constants:
+                value = convert(name, self.constants[name])
+                if value is not None:
+                    columns.append((graphql_name, [value] * len(self)))
+            elif name in self.columns:
+                columns.append((graphql_name, _map_unique(lambda v: convert(name, v), self.columns[name])))
+        return [{graphql_name: column[i] for graphql_name, column in columns if column[i] is not None}
+                for i in range(len(self))]
+
+
+class PersonBatch(EntityBatch):
+    DATA_TYPE = "Person"
+    MUTATION_NAME = "CreatePerson"
+    FIELDS = {
+        "title": "title",
+        "contributor": "contributor",
+        "creator": "creator",
+        "source": "source",
+        "format_": "format",
+        "name": "name",
+        "family_name": "familyName",
+        "given_name": "givenName",
+        "description": "description",
+        "image": "image",
+        "publisher": "publisher",
+        "honorific_prefix": "honorificPrefix",
+        "honorific_suffix": "honorificSuffix",
+        "job_title": "jobTitle",
+        "gender": "gender",
+        "language": "language",
+        "birth_date": "birthDate",
+        "death_date": "deathDate",
+    }
+    DATE_FIELDS = ("birth_date", "death_date")
+    ENUM_FIELDS = {"language": SUPPORTED_LANGUAGES, "gender": SUPPORTED_GENDER}
+
+
+class MusicCompositionBatch(EntityBatch):
+    DATA_TYPE = "MusicComposition"
+    MUTATION_NAME = "CreateMusicComposition"
+    FIELDS = {
+        "title": "title",
+        "contributor": "contributor",
+        "creator": "creator",
+        "format_": "format",
+        "subject": "subject",
+        "source": "source",
+        "inlanguage": "inLanguage",
+        "name": "name",
+        "description": "description",
+        "position": "position",
+        "language": "language",
+    }
+
+
+class MediaObjectBatch(EntityBatch):
+    DATA_TYPE = "MediaObject"
+    MUTATION_NAME = "CreateMediaObject"
+    FIELDS = {
+        "title": "title",
+        "contributor": "contributor",
+        "creator": "creator",
+        "source": "source",
+        "format_": "format",
+        "name": "name",
+        "description": "description",
+        "encodingformat": "encodingFormat",
+        "embedurl": "embedUrl",
+        "url": "url",
+        "license": "license",
+        "contenturl": "contentUrl",
+        "inlanguage": "inLanguage",
+        "date": "date",
+        "language": "language",
+    }
+    DATE_FIELDS = ("date", )
+
+
+class PlaceBatch(EntityBatch):
+    DATA_TYPE = "Place"
+    MUTATION_NAME = "CreatePlace"
+    FIELDS = {
+        "title": "title",
+        "contributor": "contributor",
+        "creator": "creator",
+        "source": "source",
+        "format_": "format",
+        "name": "name",
+        "language": "language",
+    }
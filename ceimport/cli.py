@@ -1,12 +1,60 @@
 import click
 
-from ceimport import loader
-from ceimport.sites import imslp
+from ceimport import lazy_import
+
+# Each command only loads the modules (and the libraries that they use) that it needs
+loader = lazy_import("ceimport.loader")
+cpdl = lazy_import("ceimport.sites.cpdl")
+imslp = lazy_import("ceimport.sites.imslp")
+mbdump = lazy_import("ceimport.sites.mbdump")
+musicbrainz = lazy_import("ceimport.sites.musicbrainz")
+mwdump = lazy_import("ceimport.sites.mwdump")
+wikidata_dump = lazy_import("ceimport.sites.wikidata_dump")
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--imslp-dump', type=click.Path(exists=True), help='Read IMSLP pages from this MediaWiki XML dump')
+@click.option('--cpdl-dump', type=click.Path(exists=True), help='Read CPDL pages from this MediaWiki XML dump')
+@click.option('--musicbrainz-dump', type=click.Path(exists=True, file_okay=False),
+              help='Read MusicBrainz entities from the JSON dumps in this directory')
+@click.option('--imslp-index', type=click.Path(dir_okay=False),
+              help='Use this IMSLP work and people index (default: imslp-index.sqlite, if it exists)')
+def cli(imslp_dump, cpdl_dump, musicbrainz_dump, imslp_index):
+    if imslp_dump:
+        imslp.use_dump(imslp_dump)
+    if imslp_index:
+        imslp.use_index(imslp_index)
+    if cpdl_dump:
+        cpdl.use_dump(cpdl_dump)
+    if musicbrainz_dump:
+        musicbrainz.use_dump(musicbrainz_dump)
+
+
+@cli.command()
+@click.argument('dump', type=click.Path(exists=True))
+def index_mediawiki_dump(dump):
+    """Build the title and category index of a MediaWiki XML dump"""
+    mwdump.MediaWikiDump(dump).build_index()
+
+
+@cli.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+def index_musicbrainz_dump(directory):
+    """Build the mbid and url index of a directory of MusicBrainz JSON dumps"""
+    mbdump.MusicBrainzDump(directory).build_index()
+
+
+@cli.command()
+@click.argument('dump', type=click.Path(exists=True))
+@click.option('--property', 'properties', multiple=True, metavar='NAME=PID',
+              help='Also keep entities with this identifier, e.g. cpdl=P1234. Can be repeated')
+def extract_wikidata_dump(dump, properties):
+    """Extract people and works with MusicBrainz, IMSLP or VIAF ids from a Wikidata JSON dump into a local index"""
+    props = dict(wikidata_dump.PROPERTIES)
+    for prop in properties:
+        name, pid = prop.split("=", 1)
+        props[name] = pid
+    wikidata_dump.extract_dump(dump, props)
 
 
 @cli.command()
@@ -18,9 +66,10 @@ def cpdl_import_composers_in_category(category):
 
 @cli.command()
 @click.argument('category')
-def cpdl_import_works_in_category(category):
+@click.option('--incremental', is_flag=True, help='Only import pages that changed since the last incremental import')
+def cpdl_import_works_in_category(category, incremental):
     """Find all compositions in a category that have musicxml files and import them"""
-    loader.import_cpdl_works_for_category(category)
+    loader.import_cpdl_works_for_category(category, incremental=incremental)
 
 
 @cli.command()
@@ -104,11 +153,10 @@ def imslp_import_single_file(reverselookup):
 
 @cli.command()
 @click.argument('category')
-def imslp_import_works_in_category(category):
+@click.option('--incremental', is_flag=True, help='Only import pages that changed since the last incremental import')
+def imslp_import_works_in_category(category, incremental):
     """Import all works in a category if they have musicxml files"""
-    pages = imslp.category_pagelist(category)
-    for p in pages:
-        loader.load_musiccomposition_from_imslp_name(p)
+    loader.import_imslp_works_for_category(category, incremental=incremental)
 
 
 @cli.command()
@@ -120,6 +168,20 @@ def imslp_pages_in_category(category_name):
         print(p)
 
 
+@cli.command()
+@click.option('--full', is_flag=True, help='Rebuild the index from the start instead of continuing the last update')
+def imslp_update_work_index(full):
+    """Load the list of all IMSLP works and their composers into a local index"""
+    imslp.update_work_index(full=full)
+
+
+@cli.command()
+@click.option('--full', is_flag=True, help='Rebuild the index from the start instead of continuing the last update')
+def imslp_update_people_index(full):
+    """Load the list of all IMSLP people and their authority links into a local index"""
+    imslp.update_people_index(full=full)
+
+
 @cli.command()
 @click.argument('pages', type=click.File('r'))
 def imslp_filter_xml(pages):
@@ -1,8 +1,290 @@
-import trompace.connection
-from trompace.config import config
+"""
+Send queries and mutations to the CE.
 
-config.load()
+`submit_request` sends a query string made by the trompace query and mutation builders.
+
+The operations that the importers run many times (lookups by source, creating entities) are
+instead defined once as GraphQL documents with variables (`Operation`), and `execute` only sends
+the variables of each call. The types of the variables are read from the CE schema with an
+introspection query. If the schema can't be read, the operation builders return None and callers
+send query strings like before. If the `CEIMPORT_PERSISTED_QUERIES` environment variable is set, the
+document is sent only the first time that an operation is used, and after that only its sha256
+hash (automatic persisted queries, https://www.apollographql.com/docs/apollo-server/performance/apq/).
+The server must support this.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+
+from ceimport import lazy_import, logger
+
+# These import requests, which commands only need once they start importing
+requests = lazy_import("requests")
+trompace_config = lazy_import("trompace.config")
+trompace_connection = lazy_import("trompace.connection")
+trompace_exceptions = lazy_import("trompace.exceptions")
+
+_config_loaded = False
+_config_lock = threading.Lock()
+_session = None
+
+# {(root type, field): {argument: GraphQL type}} of the Query and Mutation fields of the CE schema,
+# or {} if the schema couldn't be introspected
+_argument_types = None
+_argument_types_lock = threading.Lock()
+
+# The number of mutations in each create request. Only these sizes are used, so that each mutation
+# only has a few documents
+CREATE_SIZES = (50, 32, 16, 8, 4, 2, 1)
+
+
+def load_config():
+    """Load the trompace configuration (see TROMPACE_CLIENT_CONFIG) if it hasn't been loaded yet"""
+    global _config_loaded
+    with _config_lock:
+        if not _config_loaded:
+            # Scripts may have already loaded it from a file of their own
+            if trompace_config.config.host is None:
+                trompace_config.config.load()
+            _config_loaded = True
+
+
+def get_session():
+    global _session
+    with _config_lock:
+        if _session is None:
+            _session = requests.Session()
+        return _session
 
 
 def submit_request(query):
-    return trompace.connection.submit_query(query, auth_required=True)
+    load_config()
+    return trompace_connection.submit_query(query, auth_required=True)
+
+
+class Operation:
+    """A named GraphQL document, which is sent with different variables each time it is executed"""
+
+    def __init__(self, name, document):
+        self.name = name
+        self.document = document
+        self.sha256 = hashlib.sha256(document.encode("utf-8")).hexdigest()
+        # If the server has stored this document as a persisted query
+        self.persisted = False
+
+    def __repr__(self):
+        return f"Operation({self.name!r})"
+
+
+INTROSPECTION_QUERY = """query RootFieldArguments {
+  __schema {
+    queryType { ...RootFields }
+    mutationType { ...RootFields }
+  }
+}
+fragment RootFields on __Type {
+  fields { name args { name type { ...TypeRef } } }
+}
+fragment TypeRef on __Type {
+  kind name ofType { kind name ofType { kind name ofType { kind name } } }
+}"""
+
+
+def _type_string(type_ref):
+    """The GraphQL type of an introspected __Type, e.g. String! or [String]"""
+    if type_ref["kind"] == "NON_NULL":
+        return _type_string(type_ref["ofType"]) + "!"
+    if type_ref["kind"] == "LIST":
+        return f"[{_type_string(type_ref['ofType'])}]"
+    return type_ref["name"]
+
+
+def _load_argument_types():
+    try:
+        resp = execute(Operation("RootFieldArguments", INTROSPECTION_QUERY))
+    except Exception as e:
+        logger.warning("Can't read the argument types from the CE schema (%r), sending queries as strings", e)
+        return {}
+    types = {}
+    schema = resp["data"]["__schema"]
+    for root, root_type in (("Query", schema["queryType"]), ("Mutation", schema["mutationType"])):
+        for field in (root_type or {}).get("fields") or []:
+            types[(root, field["name"])] = {arg["name"]: _type_string(arg["type"]) for arg in field["args"]}
+    return types
+
+
+def get_argument_types(root, field):
+    """The GraphQL type of each argument of a field of the Query or Mutation type in the CE schema,
+    e.g. get_argument_types("Mutation", "CreatePerson")["title"] == "String!".
+    The schema is read the first time that this is called.
+    Returns None if the schema can't be read or doesn't have the field"""
+    global _argument_types
+    with _argument_types_lock:
+        if _argument_types is None:
+            _argument_types = _load_argument_types()
+        return _argument_types.get((root, field))
+
+
+def _variable_definitions(root, field, variables):
+    """$name: Type for each (variable name, argument name) pair of the arguments of a field,
+    or None if the type of one of the arguments isn't known"""
+    types = get_argument_types(root, field)
+    if types is None or any(argument not in types for _, argument in variables):
+        return None
+    return ", ".join(f"${variable}: {types[argument]}" for variable, argument in variables)
+
+
+@functools.lru_cache(maxsize=None)
+def query_operation(data_type, field, selection=("identifier", )):
+    """The operation which finds objects of `data_type` by the value of `field`,
+    with the variable $value. None if the schema can't be read"""
+    definitions = _variable_definitions("Query", data_type, [("value", field)])
+    if definitions is None:
+        return None
+    name = f"{data_type}By{field[0].upper()}{field[1:]}"
+    document = (f"query {name}({definitions}) {{\n"
+                f"  {data_type}({field}: $value) {{\n"
+                + "".join(f"    {s}\n" for s in selection) +
+                "  }\n}")
+    return Operation(name, document)
+
+
+@functools.lru_cache(maxsize=1024)
+def lookup_operation(data_types):
+    """The operation which finds the identifiers of one object of each type in `data_types` by
+    source. The variables are $s0, $s1, ..., and the result of each lookup is in q0, q1, ...
+    None if the schema can't be read"""
+    definitions = [_variable_definitions("Query", data_type, [(f"s{i}", "source")])
+                   for i, data_type in enumerate(data_types)]
+    if None in definitions:
+        return None
+    fields = "\n".join(f"  q{i}: {data_type}(source: $s{i}) {{ identifier }}" for i, data_type in enumerate(data_types))
+    return Operation("LookupBySource", f"query LookupBySource({', '.join(definitions)}) {{\n{fields}\n}}")
+
+
+@functools.lru_cache(maxsize=None)
+def create_operation(mutation_name, arguments, count=1):
+    """The operation which runs the mutation `mutation_name` (e.g. CreatePerson) `count` times.
+    Arguments:
+        arguments: a tuple of the names of the arguments of the mutation
+        count: one of CREATE_SIZES
+    The variables of the n-th mutation are the argument names with the suffix n (title0, source0, ...),
+    and its result is in e<n>. None if the schema can't be read"""
+    definitions = _variable_definitions(
+        "Mutation", mutation_name, [(f"{argument}{n}", argument) for n in range(count) for argument in arguments])
+    if definitions is None:
+        return None
+    mutations = "\n".join(
+        f"  e{n}: {mutation_name}({', '.join(f'{argument}: ${argument}{n}' for argument in arguments)}) {{\n"
+        "    identifier\n  }" for n in range(count))
+    name = f"{mutation_name}{count}"
+    return Operation(name, f"mutation {name}({definitions}) {{\n{mutations}\n}}")
+
+
+def _post(body, auth_required):
+    headers = {}
+    if auth_required and trompace_config.config.server_auth_required:
+        headers["Authorization"] = f"Bearer {trompace_config.config.jwt_token}"
+    r = get_session().post(trompace_config.config.host, data=json.dumps(body),
+                           headers=dict(headers, **{"Content-Type": "application/json"}))
+    try:
+        resp = r.json()
+    except ValueError:
+        resp = None
+    if not r.ok:
+        logger.error("CE request %s failed with status %s: %s", body.get("operationName"), r.status_code, r.text)
+        # GraphQL errors are raised by `execute`
+        if not (isinstance(resp, dict) and resp.get("errors")):
+            r.raise_for_status()
+    if not isinstance(resp, dict):
+        raise trompace_exceptions.QueryException([{"message": r.text}])
+    return resp
+
+
+def _persisted_query_not_found(resp):
+    return any(e.get("message") == "PersistedQueryNotFound" or
+               e.get("extensions", {}).get("code") == "PERSISTED_QUERY_NOT_FOUND"
+               for e in resp.get("errors", []))
+
+
+def execute(operation, variables=None, auth_required=True):
+    """Execute an operation with the given variables and return the response.
+    Raises trompace.exceptions.QueryException if the response has errors"""
+    load_config()
+    body = {"operationName": operation.name, "variables": variables or {}}
+    if os.getenv("CEIMPORT_PERSISTED_QUERIES"):
+        body["extensions"] = {"persistedQuery": {"version": 1, "sha256Hash": operation.sha256}}
+        resp = None
+        if operation.persisted:
+            resp = _post(body, auth_required)
+        if resp is None or _persisted_query_not_found(resp):
+            # The server doesn't have the document yet, send it with the hash so that it's stored
+            resp = _post(dict(body, query=operation.document), auth_required)
+            operation.persisted = "errors" not in resp
+    else:
+        resp = _post(dict(body, query=operation.document), auth_required)
+    if "errors" in resp:
+        raise trompace_exceptions.QueryException(resp["errors"])
+    return resp
+
+
+def query_by_field(data_type, field, value, selection=("identifier", ), auth_required=True):
+    """Find the objects of `data_type` where `field` has this value, and return the response.
+    The result is in resp["data"][data_type]"""
+    operation = query_operation(data_type, field, tuple(selection))
+    if operation is not None:
+        return execute(operation, {"value": value}, auth_required)
+    load_config()
+    query = (f"query {{\n  {data_type}({field}: {json.dumps(value)}) {{\n"
+             + "".join(f"    {s}\n" for s in selection) + "  }\n}")
+    return trompace_connection.submit_query(query, auth_required=auth_required)
+
+
+def lookup_by_source(pairs, auth_required=True):
+    """Find the objects of each (data type, source) pair in one request, and return the response.
+    The result of the n-th pair is in resp["data"][f"q{n}"]"""
+    operation = lookup_operation(tuple(data_type for data_type, _ in pairs))
+    if operation is not None:
+        return execute(operation, {f"s{i}": source for i, (_, source) in enumerate(pairs)}, auth_required)
+    load_config()
+    fields = "\n".join(f"  q{i}: {data_type}(source: {json.dumps(source)}) {{ identifier }}"
+                       for i, (data_type, source) in enumerate(pairs))
+    return trompace_connection.submit_query(f"query {{\n{fields}\n}}", auth_required=auth_required)
+
+
+def find_identifier_by_source(data_type, source):
+    """The identifier of the first object of `data_type` with this source, or None"""
+    resp = query_by_field(data_type, "source", source)
+    objects = resp.get("data", {}).get(data_type, [])
+    if not objects:
+        return None
+    return objects[0]["identifier"]
+
+
+def create_many(mutation_name, arguments, rows):
+    """Run the mutation `mutation_name` once for each dictionary of variables in `rows`, up to 50 in
+    each request. Each request has one of CREATE_SIZES mutations, the rows after the last 50 are split
+    into smaller requests
+    Arguments:
+        arguments: a tuple of the argument names of the mutation, always the same for a mutation.
+                   Arguments that are not in a row are not set for that row
+    Returns:
+        the identifier of each new object, or None if the argument types of the mutation can't
+        be read from the CE schema
+    """
+    if create_operation(mutation_name, arguments, 1) is None:
+        return None
+    identifiers = []
+    start = 0
+    while start < len(rows):
+        count = next(size for size in CREATE_SIZES if size <= len(rows) - start)
+        operation = create_operation(mutation_name, arguments, count)
+        variables = {f"{argument}{n}": value
+                     for n, row in enumerate(rows[start:start + count]) for argument, value in row.items()}
+        resp = execute(operation, variables)
+        # TODO: If this query fails?
+        identifiers.extend(resp["data"][f"e{n}"]["identifier"] for n in range(count))
+        start += count
+    return identifiers
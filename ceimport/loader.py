@@ -1,21 +1,22 @@
+import contextlib
 import itertools
 
 from trompace.mutations import person as mutation_person
 from trompace.mutations import place as mutation_place
 from trompace.mutations import musiccomposition as mutation_musiccomposition
 from trompace.mutations import mediaobject as mutation_mediaobject
-from trompace.queries import person as query_person
-from trompace.queries import musiccomposition as query_musiccomposition
-from trompace.queries import mediaobject as query_mediaobject
 
-from ceimport import connection, logger
-from ceimport.sites import musicbrainz, cpdl
-from ceimport.sites import viaf
-from ceimport.sites import imslp
-from ceimport.sites import wikidata
-from ceimport.sites import loc
-from ceimport.sites import worldcat
-from ceimport.sites import isni
+from ceimport import chunks, connection, lazy_import, logger, prefetch, run_lookups_by_host, sync
+from ceimport.batch import MediaObjectBatch, MusicCompositionBatch, PersonBatch, PlaceBatch
+
+musicbrainz = lazy_import("ceimport.sites.musicbrainz")
+cpdl = lazy_import("ceimport.sites.cpdl")
+viaf = lazy_import("ceimport.sites.viaf")
+imslp = lazy_import("ceimport.sites.imslp")
+wikidata = lazy_import("ceimport.sites.wikidata")
+loc = lazy_import("ceimport.sites.loc")
+worldcat = lazy_import("ceimport.sites.worldcat")
+isni = lazy_import("ceimport.sites.isni")
 
 
 CREATOR_URL = "https://github.com/trompamusic/ce-data-import/tree/master"
@@ -28,33 +29,62 @@ def load_artist_from_musicbrainz(artist_mbid):
     persons.append(mb_person)
 
     rels = musicbrainz.load_person_relations_from_musicbrainz(artist_mbid)
+    # Each of these lookups is to a different site, so we load them all at the same time
+    lookups = []
     if 'viaf' in rels:
-        viaf_person = viaf.load_person_from_viaf(rels['viaf'])
-        persons.append(viaf_person)
+        lookups.append(("viaf.org", viaf.load_person_from_viaf, (rels['viaf'], )))
     if 'imslp' in rels:
         # TODO: If there are more rels in imslp that aren't in MB we could use them here
         imslp_url = rels['imslp']
-        imslp_person = imslp.api_composer(imslp_url.replace("https://imslp.org/wiki/", "").replace("_", " "))
-        persons.append(imslp_person)
+        imslp_name = imslp_url.replace("https://imslp.org/wiki/", "").replace("_", " ")
+        lookups.append(("imslp.org", imslp.api_composer, (imslp_name, )))
     if 'worldcat' in rels:
-        worldcat_person = worldcat.load_person_from_worldcat(rels['worldcat'])
-        persons.append(worldcat_person)
+        lookups.append(("worldcat.org", worldcat.load_person_from_worldcat, (rels['worldcat'], )))
     if 'loc' in rels:
-        loc_person = loc.load_person_from_loc(rels['loc'])
-        persons.append(loc_person)
+        lookups.append(("id.loc.gov", loc.load_person_from_loc, (rels['loc'], )))
     if 'isni' in rels:
         isni_url = f"https://isni.org/isni/{rels['isni']}"
-        isni_person = isni.load_person_from_isni(isni_url)
-        persons.append(isni_person)
+        lookups.append(("isni.org", isni.load_person_from_isni, (isni_url, )))
     if 'wikidata' in rels:
-        wd_person = wikidata.load_person_from_wikidata_url(rels['wikidata'])
-        if wd_person:
-            persons.append(wd_person)
-        wp_person = wikidata.load_person_from_wikipedia_wikidata_url(rels['wikidata'], 'en')
-        if wp_person:
-            persons.append(wp_person)
-
-    # dedup by source
+        lookups.append(("wikidata.org", load_persons_from_wikidata_url, (rels['wikidata'], )))
+
+    persons.extend(_flatten_lookup_results(run_lookups_by_host(lookups)))
+
+    return _dedup_persons_by_source(persons)
+
+
+def load_persons_from_wikidata_url(wikidata_url):
+    """Load a person from wikidata, and from the english wikipedia page that the wikidata item links to"""
+    persons = []
+    wd_person = wikidata.load_person_from_wikidata_url(wikidata_url)
+    if wd_person:
+        persons.append(wd_person)
+    wp_person = wikidata.load_person_from_wikipedia_wikidata_url(wikidata_url, 'en')
+    if wp_person:
+        persons.append(wp_person)
+    return persons
+
+
+def load_persons_from_wikipedia_url(wikipedia_url):
+    """Find the wikidata item for a wikipedia page, and load a person from wikidata and wikipedia"""
+    wikidata_id = wikidata.get_wikidata_id_from_wikipedia_url(wikipedia_url)
+    if wikidata_id:
+        return load_persons_from_wikidata_url(f"https://www.wikidata.org/wiki/{wikidata_id}")
+    return []
+
+
+def _flatten_lookup_results(results):
+    """Lookups return either a single person or a list of persons, make them all into one list"""
+    persons = []
+    for result in results:
+        if isinstance(result, list):
+            persons.extend(result)
+        elif result:
+            persons.append(result)
+    return persons
+
+
+def _dedup_persons_by_source(persons):
     ret = []
     seen = set()
     for p in persons:
@@ -67,32 +97,88 @@ def load_artist_from_musicbrainz(artist_mbid):
 
 def get_existing_person_by_source(source) -> str:
     """Returns an identifier of the thing with the given source, else None"""
-    query_by_source = query_person.query_person(source=source)
-    resp = connection.submit_request(query_by_source)
-    person = resp.get('data', {}).get('Person', [])
-    if not person:
-        return None
-    else:
-        return person[0]['identifier']
+    return connection.find_identifier_by_source('Person', source)
+
+
+def get_existing_by_source(data_type, sources):
+    """Look up many things of one type by source, 100 in each request
+    Returns:
+        a dictionary of {source: identifier}, the identifier is None if there is no thing with the source
+    """
+    existing = {}
+    for batch in chunks(dict.fromkeys(sources), 100):
+        resp = connection.lookup_by_source([(data_type, source) for source in batch])
+        for i, source in enumerate(batch):
+            thing = resp.get('data', {}).get(f'q{i}') or []
+            existing[source] = thing[0]['identifier'] if thing else None
+    return existing
+
+
+def get_existing_persons_by_source(sources):
+    """Look up many persons by source, see `get_existing_by_source`"""
+    return get_existing_by_source('Person', sources)
 
 
 def get_existing_mediaobject_by_source(source) -> str:
     """Returns an identifier of the thing with the given source, else None"""
-    query_by_source = query_mediaobject.query_mediaobject(source=source)
-    resp = connection.submit_request(query_by_source)
-    mediaobject = resp.get('data', {}).get('MediaObject', [])
-    if not mediaobject:
-        return None
-    else:
-        return mediaobject[0]['identifier']
+    return connection.find_identifier_by_source('MediaObject', source)
+
+
+def create_entity(batch_class, arguments):
+    """Create one entity
+    Arguments:
+        batch_class: the `ceimport.batch.EntityBatch` of the type of the entity
+        arguments: a dictionary where keys are the parameters to its trompace create mutation
+    """
+    [identifier] = create_batch(batch_class.from_rows([arguments], strict=True))
+    return identifier
 
 
 def create_mediaobject(mediaobject):
     mediaobject["creator"] = CREATOR_URL
-    mutation_create = mutation_mediaobject.mutation_create_media_object(**mediaobject)
-    resp = connection.submit_request(mutation_create)
-    # TODO: If this query fails?
-    return resp['data']['CreateMediaObject']['identifier']
+    return create_entity(MediaObjectBatch, mediaobject)
+
+
+def create_batch(batch):
+    """Create all entities in a batch (see `ceimport.batch`), up to 50 in each request
+    Returns:
+        the identifiers of the new entities, in the same order as the batch
+    """
+    batch.set("creator", CREATOR_URL)
+    identifiers = connection.create_many(batch.MUTATION_NAME, batch.arguments, batch.variables())
+    if identifiers is not None:
+        return identifiers
+
+    # The argument types of the mutation couldn't be read from the CE schema, use the trompace builders
+    identifiers = [None] * len(batch)
+    for document, indexes in batch.mutations():
+        resp = connection.submit_request(document)
+        # TODO: If this query fails?
+        for alias, i in enumerate(indexes):
+            identifiers[i] = resp['data'][f'e{alias}']['identifier']
+    return identifiers
+
+
+def get_or_create_batch(batch):
+    """Create the entities in a batch that don't exist in the CE yet. Entities with the same source
+    are only created once
+    Arguments:
+        batch: an `ceimport.batch.EntityBatch`
+    Returns:
+        the identifiers of all entities, in the same order as the batch
+    """
+    sources = batch.column("source")
+    existing = get_existing_by_source(batch.DATA_TYPE, sources)
+    # The first entity with each source that doesn't exist
+    to_create = {}
+    for i, source in enumerate(sources):
+        if existing[source] is None:
+            to_create.setdefault(source, i)
+    missing = list(to_create.values())
+    if missing:
+        for i, identifier in zip(missing, create_batch(batch.select(missing))):
+            existing[sources[i]] = identifier
+    return [existing[source] for source in sources]
 
 
 def create_person(person):
@@ -114,24 +200,16 @@ def create_person(person):
         deathplace = person['deathplace']
         del person['deathplace']
 
-    mutation_create = mutation_person.mutation_create_person(**person)
-    resp = connection.submit_request(mutation_create)
     # TODO: If this query fails?
-    person_id = resp['data']['CreatePerson']['identifier']
+    person_id = create_entity(PersonBatch, person)
 
     if birthplace:
-        birthplace["creator"] = CREATOR_URL
-        mutation_create = mutation_place.mutation_create_place(**birthplace)
-        resp = connection.submit_request(mutation_create)
-        birthplace_id = resp['data']['CreatePlace']['identifier']
+        birthplace_id = create_place(birthplace)
         mutation_merge = mutation_place.mutation_merge_person_birthplace(person_id, birthplace_id)
         connection.submit_request(mutation_merge)
 
     if deathplace:
-        deathplace["creator"] = CREATOR_URL
-        mutation_create = mutation_place.mutation_create_place(**deathplace)
-        resp = connection.submit_request(mutation_create)
-        deathplace_id = resp['data']['CreatePlace']['identifier']
+        deathplace_id = create_place(deathplace)
         mutation_merge = mutation_place.mutation_merge_person_deathplace(person_id, deathplace_id)
         connection.submit_request(mutation_merge)
 
@@ -140,18 +218,14 @@ def create_person(person):
 
 def create_place(place):
     place["creator"] = CREATOR_URL
-    mutation_create = mutation_place.mutation_create_place(**place)
-    resp = connection.submit_request(mutation_create)
     # TODO: If this query fails?
-    return resp['data']['CreatePlace']['identifier']
+    return create_entity(PlaceBatch, place)
 
 
 def create_musiccomposition(musiccomposition):
     musiccomposition["creator"] = CREATOR_URL
-    mutation_create = mutation_musiccomposition.mutation_create_music_composition(**musiccomposition)
-    resp = connection.submit_request(mutation_create)
     # TODO: If this query fails?
-    return resp['data']['CreateMusicComposition']['identifier']
+    return create_entity(MusicCompositionBatch, musiccomposition)
 
 
 def link_musiccomposition_and_parts(musiccomposition_id, part_ids):
@@ -205,13 +279,7 @@ def create_persons_and_link(persons):
 
 def get_existing_musiccomposition_by_source(source) -> str:
     """Returns an identifier of the thing with the given source, else None"""
-    query_by_source = query_musiccomposition.query_musiccomposition(source=source)
-    resp = connection.submit_request(query_by_source)
-    mc = resp.get('data', {}).get('MusicComposition', [])
-    if not mc:
-        return None
-    else:
-        return mc[0]['identifier']
+    return connection.find_identifier_by_source('MusicComposition', source)
 
 
 def get_or_create_person(person):
@@ -253,11 +321,8 @@ def load_musiccomposition_from_musicbrainz(work_mbid):
     persons = load_artist_from_musicbrainz(composer)
     composer_ids = create_persons_and_link(persons)
 
-    all_part_ids = []
-    # For each part, import the part and then link it to the main work
-    for part in meta['parts']:
-        part_id = get_or_create_musiccomposition(part)
-        all_part_ids.append(part_id)
+    # Import all parts and then link them to the main work
+    all_part_ids = get_or_create_batch(MusicCompositionBatch.from_rows(meta['parts']))
 
     link_musiccomposition_and_parts(musiccomp_ceid, all_part_ids)
     link_musiccomposition_and_composers(musiccomp_ceid, composer_ids)
@@ -285,49 +350,36 @@ def load_artist_from_imslp(url):
         people.append(imslp_person)
 
     rels = imslp.api_composer_get_relations(url)
+    # Each of these lookups is to a different site, so we load them all at the same time
+    lookups = []
     if 'worldcat' in rels:
-        worldcat_person = worldcat.load_person_from_worldcat(rels['worldcat'])
-        people.append(worldcat_person)
+        lookups.append(("worldcat.org", worldcat.load_person_from_worldcat, (rels['worldcat'], )))
     if 'viaf' in rels:
-        viaf_person = viaf.load_person_from_viaf(rels['viaf'])
-        people.append(viaf_person)
+        lookups.append(("viaf.org", viaf.load_person_from_viaf, (rels['viaf'], )))
     if 'wikipedia' in rels:
-        wikidata_id = wikidata.get_wikidata_id_from_wikipedia_url(rels['wikipedia'])
-        if wikidata_id:
-            wd_person = wikidata.load_person_from_wikidata_url(rels['wikidata'])
-            if wd_person:
-                people.append(wd_person)
-            wp_person = wikidata.load_person_from_wikipedia_wikidata_url(rels['wikidata'], 'en')
-            if wp_person:
-                people.append(wp_person)
+        lookups.append(("wikipedia.org", load_persons_from_wikipedia_url, (rels['wikipedia'], )))
     if 'musicbrainz' in rels:
-        mb_person = musicbrainz.load_person_from_musicbrainz(rels['musicbrainz'])
-        people.append(mb_person)
+        lookups.append(("musicbrainz.org", musicbrainz.load_person_from_musicbrainz, (rels['musicbrainz'], )))
+    else:
+        # If no link to musicbrainz from imslp, do a reverse lookup in musicbrainz to see if it's there
+        lookups.append(("musicbrainz.org", _load_musicbrainz_person_by_imslp_url, (url, )))
     if 'isni' in rels:
-        isni_person = isni.load_person_from_isni(rels['isni'])
-        people.append(isni_person)
+        lookups.append(("isni.org", isni.load_person_from_isni, (rels['isni'], )))
     if 'loc' in rels:
-        loc_person = loc.load_person_from_loc(rels['loc'])
-        people.append(loc_person)
-
-    # If no link to musicbrainz from imslp, do a reverse lookup in musicbrainz to see if it's there
-    if 'musicbrainz' not in rels:
-        artist_mbid = musicbrainz.get_artist_mbid_by_imslp_url(url)
-        # TODO: If the artist exists in MB, then we should also import all of the other
-        #  relationships that exist, by using `load_artist_from_musicbrainz`
-        if artist_mbid:
-            mb_person = musicbrainz.load_person_from_musicbrainz(artist_mbid)
-            people.append(mb_person)
-
-    # dedup by source
-    ret = []
-    seen = set()
-    for p in people:
-        if 'source' in p:
-            if p['source'] not in seen:
-                ret.append(p)
-                seen.add(p['source'])
-    return ret
+        lookups.append(("id.loc.gov", loc.load_person_from_loc, (rels['loc'], )))
+
+    people.extend(_flatten_lookup_results(run_lookups_by_host(lookups)))
+
+    return _dedup_persons_by_source(people)
+
+
+def _load_musicbrainz_person_by_imslp_url(url):
+    artist_mbid = musicbrainz.get_artist_mbid_by_imslp_url(url)
+    # TODO: If the artist exists in MB, then we should also import all of the other
+    #  relationships that exist, by using `load_artist_from_musicbrainz`
+    if artist_mbid:
+        return musicbrainz.load_person_from_musicbrainz(artist_mbid)
+    return None
 
 
 def load_musiccomposition_from_imslp_by_file(reverselookup):
@@ -466,20 +518,39 @@ def import_cpdl_composer_wikitext(composer_wikitext):
     create_persons_and_link(persons)
 
 
-def import_cpdl_composer(composer_name):
-    """Import a single composer"""
-    composerwikitext = cpdl.get_wikitext_for_titles([composer_name])
-    if composerwikitext:
-        composer = composerwikitext[0]
+def import_cpdl_composer(composer_name, composer_pool=None):
+    """Import a single composer
+    Arguments:
+        composer_name: the title of the composer's page
+        composer_pool: a pool of composer wikitext from `cpdl.fill_wikitext_pool`. If the composer isn't
+                       in the pool, it is loaded and added to it
+    """
+    if composer_pool is None:
+        composer_pool = {}
+    cpdl.fill_wikitext_pool(composer_pool, [composer_name])
+    composer = composer_pool.get(cpdl.normalise_title(composer_name))
+    if composer:
         logger.info("Importing CPDL composer %s", composer['title'])
         import_cpdl_composer_wikitext(composer)
-        source = f'https://cpdl.org/wiki/index.php/{composer["title"].replace(" ", "_")}'
+        source = cpdl_composer_source(composer["title"])
         existing_composer_ceid = get_existing_person_by_source(source)
         return existing_composer_ceid
     else:
         return None
 
 
+def cpdl_composer_source(composer_name):
+    return f'https://cpdl.org/wiki/index.php/{composer_name.replace(" ", "_")}'
+
+
+def fill_cpdl_composer_pool(composer_pool, composers):
+    """Load the wikitext of the composers which aren't in the CE yet into a pool (see `cpdl.fill_wikitext_pool`),
+    the pool is only used by `import_cpdl_work_wikitext` for composers that it can't find in the CE"""
+    composers = [c for c in dict.fromkeys(composers) if cpdl.normalise_title(c) not in composer_pool]
+    existing = get_existing_persons_by_source(cpdl_composer_source(c) for c in composers)
+    return cpdl.fill_wikitext_pool(composer_pool, [c for c in composers if not existing[cpdl_composer_source(c)]])
+
+
 def import_cpdl_composers_for_category(cpdl_category):
     """Given a category in CPDL, find all of its works. Then, filter to only include works
     with a musicxml file and get a unique list of composers for these works.
@@ -489,34 +560,48 @@ def import_cpdl_composers_for_category(cpdl_category):
     wikitext = cpdl.get_wikitext_for_titles(titles)
     xmlwikitext = cpdl.get_works_with_xml(wikitext)
     composers = cpdl.get_composers_for_works(xmlwikitext)
-    composerwikitext = cpdl.get_wikitext_for_titles(composers)
+    composer_pool = cpdl.fill_wikitext_pool({}, composers)
 
-    total = len(composerwikitext)
-    for i, composer in enumerate(composerwikitext, 1):
-        logger.info("Importing CPDL composer %s/%s %s", i, total, composer['title'])
-        import_cpdl_composer_wikitext(composer)
+    total = len(composers)
+    for i, composer_name in enumerate(composers, 1):
+        composer = composer_pool.get(cpdl.normalise_title(composer_name))
+        if composer:
+            logger.info("Importing CPDL composer %s/%s %s", i, total, composer['title'])
+            import_cpdl_composer_wikitext(composer)
 
 
-def import_cpdl_work_wikitext(work_wikitext):
+def import_cpdl_work_wikitext(work_wikitext, file_urls=None, composer_pool=None):
+    """Import a work, its composer and its files.
+    Arguments:
+        work_wikitext: the wikitext of the work
+        file_urls: the result of `cpdl.get_fileurls_for_works` for the works being imported,
+                   if not set the files for this work are looked up individually
+        composer_pool: wikitext of composers from `cpdl.fill_wikitext_pool`, used if the composer
+                   of this work doesn't exist in the CE yet
+    """
     composition = cpdl.composition_wikitext_to_music_composition(work_wikitext)
     composer = composition['composer']
     if composer is not None:
-        source = f'https://cpdl.org/wiki/index.php/{composer.replace(" ", "_")}'
+        source = cpdl_composer_source(composer)
         existing_composer_ceid = get_existing_person_by_source(source)
         if not existing_composer_ceid:
-            existing_composer_ceid = import_cpdl_composer(composer)
+            existing_composer_ceid = import_cpdl_composer(composer, composer_pool)
         if existing_composer_ceid:
             musiccomp_ceid = get_or_create_musiccomposition(composition['work'])
             link_musiccomposition_and_composers(musiccomp_ceid, [existing_composer_ceid])
-            mediaobjects = cpdl.composition_wikitext_to_mediaobjects(work_wikitext)
-            for mo in mediaobjects:
-                xml = mo["xml"]
-                xmlmediaobject_ceid = get_or_create_mediaobject(xml)
+            mediaobjects = cpdl.composition_wikitext_to_mediaobjects(work_wikitext, file_urls)
+            # The xml and pdf files of the work are created together
+            rows = [mo["xml"] for mo in mediaobjects]
+            pdf_rows = {i: len(rows) + n for n, i in enumerate(
+                i for i, mo in enumerate(mediaobjects) if mo.get("pdf") is not None)}
+            rows += [mediaobjects[i]["pdf"] for i in pdf_rows]
+            mediaobject_ceids = get_or_create_batch(MediaObjectBatch.from_rows(rows))
+            for i in range(len(mediaobjects)):
+                xmlmediaobject_ceid = mediaobject_ceids[i]
                 link_musiccomposition_and_mediaobject(composition_id=musiccomp_ceid,
                                                       mediaobject_id=xmlmediaobject_ceid)
-                if "pdf" in mo and mo["pdf"] is not None:
-                    pdf = mo["pdf"]
-                    pdfmediaobject_ceid = get_or_create_mediaobject(pdf)
+                if i in pdf_rows:
+                    pdfmediaobject_ceid = mediaobject_ceids[pdf_rows[i]]
                     link_musiccomposition_and_mediaobject(composition_id=musiccomp_ceid,
                                                           mediaobject_id=pdfmediaobject_ceid)
                     # In CPDL, we know that PDFs are generated from the source xml file
@@ -529,22 +614,80 @@ def import_cpdl_work_wikitext(work_wikitext):
 def import_cpdl_work(work_names):
     """Import a single work"""
     wikitext = cpdl.get_wikitext_for_titles(work_names)
+    file_urls = cpdl.get_fileurls_for_works(wikitext)
+    composer_pool = fill_cpdl_composer_pool({}, cpdl.get_composers_for_works(wikitext))
     for work in wikitext:
         logger.info("Importing CPDL work %s", work['title'])
-        import_cpdl_work_wikitext(work)
+        import_cpdl_work_wikitext(work, file_urls, composer_pool)
 
 
-def import_cpdl_works_for_category(cpdl_category):
+def import_cpdl_works_for_category(cpdl_category, incremental=False):
     """Given a category in CPDL, find all of its works. Then, filter to only include works
     with a musicxml file. Import each of these works and the xml files.
     This assumes that import_cpdl_composers_for_category has been run first and that Person
-    objects exist in the CE for each Composer"""
-
-    titles = cpdl.get_titles_in_category(cpdl_category)
-    wikitext = cpdl.get_wikitext_for_titles(titles)
-    xmlwikitext = cpdl.get_works_with_xml(wikitext)
-
-    total = len(xmlwikitext)
-    for i, work in enumerate(xmlwikitext, 1):
-        logger.info("Importing CPDL work %s/%s %s", i, total, work['title'])
-        import_cpdl_work_wikitext(work)
+    objects exist in the CE for each Composer
+
+    Each step is a generator, so works are imported as soon as their page has been downloaded.
+    Up to 500 pages are downloaded ahead of the import in a background thread.
+
+    If `incremental` is set, only import works which were created or edited since the last
+    incremental import of this category, and record the time of this import when it finishes."""
+
+    sync_started = sync.now()
+    titles = cpdl.iter_titles_in_category(cpdl_category)
+    if incremental:
+        titles = _filter_titles_changed_since_last_sync("cpdl", cpdl_category, titles,
+                                                        cpdl.get_titles_changed_since)
+
+    # In incremental mode we need the current version of the pages, not the cached one
+    with cpdl.session.cache_disabled() if incremental else contextlib.nullcontext():
+        wikitext = prefetch(cpdl.iter_wikitext_for_titles(titles), 500)
+        xmlwikitext = cpdl.filter_works_with_xml(wikitext)
+
+        # Composers of works are loaded 50 works at a time, and kept for the rest of the import
+        composer_pool = {}
+        i = 0
+        for works in chunks(cpdl.iter_works_with_file_urls(xmlwikitext), 50):
+            fill_cpdl_composer_pool(composer_pool, cpdl.get_composers_for_works(w for w, _ in works))
+            for work, file_urls in works:
+                i += 1
+                logger.info("Importing CPDL work %s %s", i, work['title'])
+                import_cpdl_work_wikitext(work, file_urls, composer_pool)
+
+    if incremental:
+        sync.set_last_sync("cpdl", cpdl_category, sync_started)
+
+
+def import_imslp_works_for_category(imslp_category, incremental=False):
+    """Import all works in an IMSLP category.
+
+    If `incremental` is set, only import works which were created or edited since the last
+    incremental import of this category, and record the time of this import when it finishes."""
+    sync_started = sync.now()
+    pages = imslp.category_pagelist(imslp_category)
+    if incremental:
+        pages = list(_filter_titles_changed_since_last_sync("imslp", imslp_category, pages,
+                                                            imslp.get_titles_changed_since))
+
+    # In incremental mode we need the current version of the pages, not the cached one
+    with imslp.session.cache_disabled() if incremental else contextlib.nullcontext():
+        total = len(pages)
+        for i, p in enumerate(pages, 1):
+            logger.info("Importing IMSLP work %s/%s", i, total)
+            load_musiccomposition_from_imslp_name(p)
+
+    if incremental:
+        sync.set_last_sync("imslp", imslp_category, sync_started)
+
+
+def _filter_titles_changed_since_last_sync(site, category, titles, get_titles_changed_since):
+    """Only keep titles of pages that have changed since the last sync of this category.
+    If there was no recent sync, keep all titles"""
+    last_sync = sync.get_last_sync(site, category)
+    if last_sync is None:
+        logger.info("No recent import of %s category %s, importing all pages", site, category)
+        return titles
+
+    changed = get_titles_changed_since(last_sync)
+    logger.info("%s pages changed on %s since %s", len(changed), site, last_sync)
+    return (t for t in titles if t in changed)
@@ -7,7 +7,8 @@ import requests_cache
 import mwparserfromhell as mwph
 from requests.adapters import HTTPAdapter
 
-from ceimport import chunks
+from ceimport import chunks, logger, sync
+from ceimport.sites import mwdump
 
 
 session = requests_cache.CachedSession()
@@ -15,6 +16,16 @@ adapter = HTTPAdapter(max_retries=5)
 session.mount("https://", adapter)
 session.mount("http://", adapter)
 
+# If set, read wikitext and categories from a local MediaWiki XML dump instead of the api
+dump = None
+
+
+def use_dump(path):
+    """Read CPDL pages from a local MediaWiki XML dump (pages-articles.xml, optionally .bz2 or .gz)
+    instead of the api. File urls are still loaded from cpdl.org"""
+    global dump
+    dump = mwdump.MediaWikiDump(path)
+
 
 def get_mediawiki():
     return mediawiki.MediaWiki(url='http://www.cpdl.org/wiki/api.php', rate_limit=True)
@@ -61,7 +72,12 @@ def get_fileurl_from_media(media: List[str]):
     return ret
 
 
-def get_wiki_content_for_pages(pages):
+def get_wiki_content_for_pages(pages, raise_errors=False):
+    """Get the wikitext of up to 50 pages. Pages which don't exist are not in the result.
+    If the api can't be reached or returns something that isn't json, the result is empty,
+    unless `raise_errors` is set, in which case the error is raised"""
+    if dump is not None:
+        return dump.get_pages(pages)
     if len(pages) > 50:
         raise ValueError("can only do up to 50 pages")
 
@@ -80,11 +96,15 @@ def get_wiki_content_for_pages(pages):
     try:
         r = session.get(url, params=params)
     except requests.exceptions.ConnectionError:
+        if raise_errors:
+            raise
         return []
     r.raise_for_status()
     try:
         j = r.json()
     except ValueError:
+        if raise_errors:
+            raise
         return []
 
     pages = j.get("query", {}).get("pages", [])
@@ -113,11 +133,17 @@ def get_works_with_xml(pages):
     Arguments:
         pages: result of `get_wiki_content_for_pages`
     """
-    ret = []
+    return list(filter_works_with_xml(pages))
+
+
+def filter_works_with_xml(pages):
+    """Lazily yield only the pages that have an XML file
+    Arguments:
+        pages: an iterable of pages, e.g. from `iter_wikitext_for_titles`
+    """
     for page in pages:
         if "{{XML}}" in page["content"]:
-            ret.append(page)
-    return ret
+            yield page
 
 
 def composition_wikitext_to_music_composition(wikitext):
@@ -202,17 +228,86 @@ def get_file_pairs_from_composition_wikitext(wikitext):
     return ret
 
 
-def composition_wikitext_to_mediaobjects(wikitext):
-    files = get_file_pairs_from_composition_wikitext(wikitext)
+def get_file_names_for_file_pairs(files):
+    """Get a list of all xml and pdf file titles from the result of
+    `get_file_pairs_from_composition_wikitext`"""
     file_names = []
     for f in files:
         file_names.append(f["xml"])
         if "pdf" in f and f["pdf"]:
             file_names.append(f["pdf"])
+    return file_names
 
+
+def get_fileurls_for_file_names(file_names):
+    """Look up the imageinfo of many files, 50 at a time"""
     file_urls = {}
     for items in chunks(file_names, 50):
         file_urls.update(get_fileurl_from_media(items))
+    return file_urls
+
+
+def get_fileurls_for_works(works):
+    """Look up the file urls for the xml and pdf files of many works at once.
+
+    Collecting the files from all works before querying the api means that each imageinfo
+    request contains 50 files, instead of the 2 or 3 files that a single work normally has.
+
+    Arguments:
+        works: the result of `get_wikitext_for_titles` or `get_works_with_xml`
+    Returns:
+        a dictionary of file title: imageinfo, which can be passed to `composition_wikitext_to_mediaobjects`
+    """
+    file_names = []
+    seen = set()
+    for work in works:
+        files = get_file_pairs_from_composition_wikitext(work)
+        for name in get_file_names_for_file_pairs(files):
+            if name not in seen:
+                file_names.append(name)
+                seen.add(name)
+    return get_fileurls_for_file_names(file_names)
+
+
+def iter_works_with_file_urls(works, batch_size=50):
+    """Pair each work with the urls of its files, looking up files for many works at once.
+
+    Works are read from `works` until they reference at least `batch_size` files, and then
+    the files are looked up with `get_fileurls_for_works` so that imageinfo requests are full.
+
+    Arguments:
+        works: an iterable of work wikitext, e.g. from `filter_works_with_xml`
+    Yields:
+        (work, file_urls) tuples, where file_urls can be given to `composition_wikitext_to_mediaobjects`
+    """
+    buffer = []
+    file_names = []
+    for work in works:
+        buffer.append(work)
+        files = get_file_pairs_from_composition_wikitext(work)
+        file_names.extend(get_file_names_for_file_pairs(files))
+        if len(file_names) >= batch_size:
+            file_urls = get_fileurls_for_file_names(list(dict.fromkeys(file_names)))
+            for w in buffer:
+                yield w, file_urls
+            buffer = []
+            file_names = []
+    if buffer:
+        file_urls = get_fileurls_for_file_names(list(dict.fromkeys(file_names)))
+        for w in buffer:
+            yield w, file_urls
+
+
+def composition_wikitext_to_mediaobjects(wikitext, file_urls=None):
+    """
+    Arguments:
+        wikitext: the wikitext of a single work
+        file_urls: the result of `get_fileurls_for_works` for a group of works that includes this one.
+                   If not set, look up the files of this work
+    """
+    files = get_file_pairs_from_composition_wikitext(wikitext)
+    if file_urls is None:
+        file_urls = get_fileurls_for_file_names(get_file_names_for_file_pairs(files))
     ret = []
 
     for f in files:
@@ -318,6 +413,8 @@ def composer_wikitext_to_person(wikitext):
 
 
 def get_wikitext_for_titles(titles):
+    if dump is not None:
+        return dump.get_pages(titles)
     num_iterations = int(len(titles) / 50)
     i = 1
     all_pages = []
@@ -330,6 +427,28 @@ def get_wikitext_for_titles(titles):
     return all_pages
 
 
+def iter_wikitext_for_titles(titles):
+    """Lazily load wikitext for an iterable of titles, 50 titles per request
+    Arguments:
+        titles: an iterable of page titles, e.g. from `iter_titles_in_category`
+    """
+    if dump is not None:
+        # Read all pages in one pass through the dump instead of seeking for each batch
+        yield from dump.get_pages(list(titles))
+        return
+    for i, items in enumerate(chunks(titles, 50), 1):
+        logger.debug("Loading wikitext for pages, batch %s", i)
+        for page in get_wiki_content_for_pages(items):
+            yield page
+
+
+def get_titles_changed_since(timestamp):
+    """Get the titles of all pages that were created or edited since `timestamp`.
+    The cache is skipped so that we always see the latest changes"""
+    with session.cache_disabled():
+        return sync.get_titles_changed_since(session, 'http://www.cpdl.org/wiki/api.php', timestamp)
+
+
 def get_composers_for_works(works):
     """
     :param works: the result of get_wikitext_for_titles or get_works_with_xml (filtered version)
@@ -338,11 +457,56 @@ def get_composers_for_works(works):
     composers = set()
     for work in works:
         composition = composition_wikitext_to_music_composition(work)
-        composers.add(str(composition['composer']))
+        if composition['composer'] is not None:
+            composers.add(str(composition['composer']))
 
     return sorted(list(composers))
 
 
+def normalise_title(title):
+    """Make a title look like the titles that the api returns: spaces instead of underscores,
+    and starting with an uppercase letter"""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def fill_wikitext_pool(pool, titles):
+    """Load the wikitext of all pages in `titles` which aren't already in `pool`, 50 pages per request.
+
+    A pool is a dictionary of normalised title: wikitext which is kept for the length of an import run,
+    so that a page (e.g. a composer) which is needed many times is only downloaded once.
+    Pages which don't exist are stored in the pool as None so that they are not requested again.
+    If a request for 50 pages fails, its pages are requested one at a time, and pages that still
+    fail are left out of the pool so that they are requested again the next time they are needed.
+
+    Arguments:
+        pool: the dictionary to fill, updated in place
+        titles: the titles of the pages that will be needed
+    Returns:
+        the pool
+    """
+    missing = [t for t in dict.fromkeys(normalise_title(t) for t in titles) if t not in pool]
+    for batch in chunks(missing, len(missing) if dump is not None else 50):
+        failed = set()
+        try:
+            pages = get_wiki_content_for_pages(batch, raise_errors=True)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            logger.warning("Failed to load the wikitext of %s pages (%r), loading them one at a time", len(batch), e)
+            pages = []
+            for title in batch:
+                try:
+                    pages.extend(get_wiki_content_for_pages([title], raise_errors=True))
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    logger.warning("Failed to load the wikitext of %s (%r), skipping it", title, e)
+                    failed.add(title)
+        for page in pages:
+            pool[normalise_title(page["title"])] = page
+        for title in batch:
+            if title not in failed:
+                pool.setdefault(title, None)
+    return pool
+
+
 def get_titles_in_category(category):
     """Get a list of works constrained by the category from the specified URL
 
@@ -350,10 +514,51 @@ def get_titles_in_category(category):
         md: a MediaWiki object pointing to an API
         category: the category title to get page titles from
     """
+    if dump is not None:
+        titles = dump.titles_in_category(category)
+        if titles:
+            return titles
+        # Categories that are added to pages with templates aren't visible in a dump
+        logger.warning("No pages in category %s in the CPDL dump, getting them from the api", category)
     mw = get_mediawiki()
     return mw.categorymembers(category, results=None, subcategories=True)[0]
 
 
+def iter_titles_in_category(category):
+    """Lazily get the titles of all pages in a category, one page of api results at a time
+    Subcategories are not included.
+
+    Arguments:
+        category: the category title to get page titles from, without the Category: prefix
+    """
+    if dump is not None:
+        titles = dump.titles_in_category(category)
+        if titles:
+            yield from titles
+            return
+        logger.warning("No pages in category %s in the CPDL dump, getting them from the api", category)
+    params = {
+        "action": "query",
+        "list": "categorymembers",
+        "cmtitle": f"Category:{category}",
+        "cmtype": "page",
+        "cmlimit": "500",
+        "format": "json"
+    }
+    url = 'http://www.cpdl.org/wiki/api.php'
+
+    while True:
+        r = session.get(url, params=params)
+        r.raise_for_status()
+        j = r.json()
+        for member in j.get("query", {}).get("categorymembers", []):
+            yield member["title"]
+        cont = j.get("continue")
+        if not cont:
+            return
+        params.update(cont)
+
+
 def main():
     titles = cpdl.get_titles_in_category("4-part choral music")
     wikitext = cpdl.get_wikitext_for_titles(titles)
@@ -1,8 +1,9 @@
 import base64
-import json
+import html.parser
 import random
 import re
 import sys
+import threading
 import time
 import urllib
 from typing import List
@@ -14,7 +15,8 @@ from mediawiki import mediawiki
 import mwparserfromhell as mwph
 from requests.adapters import HTTPAdapter
 
-from ceimport import chunks, logger
+from ceimport import chunks, logger, sync
+from ceimport.sites import imslp_index, mwdump
 
 
 def make_throttle_hook():
@@ -36,6 +38,36 @@ adapter = HTTPAdapter(max_retries=5)
 session.mount("https://", adapter)
 session.mount("http://", adapter)
 
+# Not cached, requests_cache would download and store the whole page when we only read its start
+# (see `get_page_metadata`)
+head_session = requests.Session()
+head_session.hooks = {'response': make_throttle_hook()}
+head_session.mount("https://", adapter)
+head_session.mount("http://", adapter)
+
+# url -> result of get_page_metadata, for pages that could be loaded
+_page_metadata = {}
+_page_metadata_lock = threading.Lock()
+PAGE_METADATA_CACHE_SIZE = 4096
+HEAD_END_TAG = b"</head>"
+
+# If set, read wikitext and categories from a local MediaWiki XML dump instead of the api
+dump = None
+# Titles of indexed people that were updated from the api in this run
+_people_from_api = set()
+
+
+def use_dump(path):
+    """Read IMSLP pages from a local MediaWiki XML dump (pages-articles.xml, optionally .bz2 or .gz)
+    instead of the api. File urls and page metadata are still loaded from imslp.org"""
+    global dump
+    dump = mwdump.MediaWikiDump(path)
+
+
+def use_index(path):
+    """Read and store IMSLP works and people in the index at `path`, see `imslp_index`"""
+    imslp_index.use_index(path)
+
 
 def get_titles_in_category(mw, category):
     """Get a list of works constrained by the category from the specified URL
@@ -66,13 +98,86 @@ def read_source(source: str) -> str:
         return None
 
 
+class _HeadParser(html.parser.HTMLParser):
+    """Collect the <title> and <meta> tags from the <head> of a html page"""
+
+    def __init__(self):
+        super().__init__()
+        self.title = None
+        self.meta = {}
+        self._in_title = False
+        self._title_parts = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "title":
+            self._in_title = True
+        elif tag == "meta":
+            key = attrs.get("name") or attrs.get("property")
+            if key and "content" in attrs:
+                self.meta[key] = attrs["content"]
+        elif tag == "link" and attrs.get("rel") == "canonical":
+            self.meta["canonical"] = attrs.get("href")
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._in_title:
+            self._in_title = False
+            self.title = "".join(self._title_parts)
+
+    def handle_data(self, data):
+        if self._in_title:
+            self._title_parts.append(data)
+
+
+def get_page_metadata(source: str):
+    """Load a page and get the metadata from its <head>.
+
+    Only the start of the page is downloaded, up to the end of the <head> element, and results
+    of pages that could be loaded are remembered so that each url is only requested once.
+
+    Args:
+        source: the URL of the page to load
+
+    Returns:
+        a dictionary {"url": the url after redirects, "title": the page title, "meta": {name: content}},
+        or None if the page couldn't be loaded
+    """
+    headers = {
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_10_1) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/39.0.2171.95 Safari/537.36'}
+    with _page_metadata_lock:
+        if source in _page_metadata:
+            return _page_metadata[source]
+    with head_session.get(source, headers=headers, stream=True) as r:
+        try:
+            r.raise_for_status()
+        except requests.exceptions.HTTPError:
+            return None
+        chunks = []
+        tail = b""
+        for chunk in r.iter_content(chunk_size=16384):
+            chunks.append(chunk)
+            # Only search the new chunk, and the end of the previous ones in case the tag is split between them
+            tail = tail[-(len(HEAD_END_TAG) - 1):] + chunk.lower()
+            if HEAD_END_TAG in tail:
+                break
+        prefix = b"".join(chunks)
+        url = r.url
+
+    parser = _HeadParser()
+    parser.feed(prefix.decode(r.encoding or "utf-8", errors="replace"))
+    metadata = {"url": url, "title": parser.title, "meta": parser.meta}
+    with _page_metadata_lock:
+        if len(_page_metadata) >= PAGE_METADATA_CACHE_SIZE:
+            # Forget the oldest page
+            del _page_metadata[next(iter(_page_metadata))]
+        _page_metadata[source] = metadata
+    return metadata
+
+
 def get_page_title(source):
-    page = read_source(source)
-    if page is not None:
-        bs = BeautifulSoup(page, features="lxml")
-        title = bs.find("title")
-        if title:
-            return title.text
+    metadata = get_page_metadata(source)
+    if metadata is not None:
+        return metadata["title"]
 
 
 def special_link_to_download_url(special_link, download_id):
@@ -98,14 +203,29 @@ def get_pages_for_category(mw, category_name, page_name=None, num_pages=None):
 
 
 def category_pagelist(category_name: str):
+    if dump is not None:
+        titles = dump.titles_in_category(category_name)
+        if titles:
+            return titles
+        # IMSLP adds most categories to pages with templates, which aren't visible in a dump
+        logger.warning("No pages in category %s in the IMSLP dump, getting them from the api", category_name)
     mw = mediawiki.MediaWiki(url='https://imslp.org/api.php', rate_limit=True)
 
     list_of_titles = get_pages_for_category(mw, category_name)
     return list_of_titles
 
 
+def get_titles_changed_since(timestamp):
+    """Get the titles of all pages that were created or edited since `timestamp`.
+    The cache is skipped so that we always see the latest changes"""
+    with session.cache_disabled():
+        return sync.get_titles_changed_since(session, 'https://imslp.org/api.php', timestamp)
+
+
 def get_wiki_content_for_pages(pages: List[str]):
     """Use the mediawiki api to load Wikitext for a list of page"""
+    if dump is not None:
+        return dump.get_pages(pages)
     if len(pages) > 50:
         raise ValueError("can only do up to 50 pages")
 
@@ -151,26 +271,53 @@ def get_wiki_content_for_pages(pages: List[str]):
     return ret
 
 
-def api_all_pages():
-    """Get a list of all composition pages in IMSLP, including the category which represents the work's composer"""
-    base_url = "https://imslp.org/imslpscripts/API.ISCR.php?account=worklist/disclaimer=accepted/sort=id/type=2/start={}/retformat=json"
+def api_worklist(list_type, start=0):
+    """Page through the IMSLP worklist api, 1000 items at a time.
+
+    Arguments:
+        list_type: 1 for people, 2 for works
+        start: the position in the list to start from
+    Yields:
+        (start, items) tuples, where start is the position of the first item of the next page
+    """
+    base_url = "https://imslp.org/imslpscripts/API.ISCR.php?account=worklist/disclaimer=accepted/sort=id/type={}/start={}/retformat=json"
     hasnext = True
-    start = 0
-    alldata = []
     while hasnext:
-        url = base_url.format(start)
-        r = session.get(url)
+        url = base_url.format(list_type, start)
+        # This list changes all the time, so we never want a cached version
+        with session.cache_disabled():
+            r = session.get(url)
+        r.raise_for_status()
         j = r.json()
-        metadata = j.get('metadata', {})
-        if metadata:
-            hasnext = metadata.get('moreresultsavailable', False)
+        hasnext = j.get('metadata', {}).get('moreresultsavailable', False)
+        items = []
         for i in range(1000):
             data = j.get(str(i))
             if data:
-                alldata.append(data)
-        start += 1000
-    with open("all-imslp-pages.json", "w") as fp:
-        json.dump(alldata, fp)
+                items.append(data)
+        start += len(items)
+        if not items:
+            hasnext = False
+        yield start, items
+
+
+def update_work_index(full=False):
+    """Load all composition pages in IMSLP into the local index in `imslp_index`,
+    including the category which represents the work's composer.
+
+    The worklist is sorted by page id, so new works are added at the end of the list.
+    We remember the position in the list after the last work that we loaded, and the next time
+    that this runs we continue from there, which means that an interrupted update can be resumed,
+    and an update of a complete index only loads new works.
+
+    Arguments:
+        full: if True, start again from the beginning of the list
+    """
+    start = 0 if full else int(imslp_index.get_meta("works_start", 0))
+    for next_start, works in api_worklist(2, start):
+        imslp_index.store_works(works)
+        imslp_index.set_meta("works_start", next_start)
+        logger.info("Indexed %s IMSLP works", next_start)
 
 
 def parse_imslp_date(year, month, day):
@@ -200,14 +347,76 @@ def imslp_api_raw_query(page_name):
     return {}
 
 
-def api_composer_get_relations(composer_name):
+def _api_item_to_person(item):
+    """Convert a person from the IMSLP api (either from a page query or from the worklist)
+    to a dictionary that can be stored in the index"""
+    extvals = item.get("extvals") or {}
+    intvals = item.get("intvals") or {}
+    image = intvals.get("picturelinkraw")
+    if image:
+        image = f"https://imslp.org{image}"
+
+    return {
+        "title": item["id"],
+        "name": intvals.get("normalname"),
+        "family_name": intvals.get("lastname"),
+        "given_name": intvals.get("firstname"),
+        "gender": extvals.get("Sex"),
+        "birth_date": parse_imslp_date(extvals.get("Born Year"), extvals.get("Born Month"), extvals.get("Born Day")),
+        "death_date": parse_imslp_date(extvals.get("Died Year"), extvals.get("Died Month"), extvals.get("Died Day")),
+        "image": image,
+        "permlink": item.get("permlink"),
+        "page_title": None,
+        "authorities": (intvals.get("wikidata") or {}).get("authorities", []),
+    }
+
+
+def update_people_index(full=False):
+    """Load all people in IMSLP into the local index in `imslp_index`.
+    Like `update_work_index`, this continues from where the last update finished.
+
+    Arguments:
+        full: if True, start again from the beginning of the list
+    """
+    start = 0 if full else int(imslp_index.get_meta("people_start", 0))
+    for next_start, people in api_worklist(1, start):
+        imslp_index.store_people([_api_item_to_person(p) for p in people])
+        imslp_index.set_meta("people_start", next_start)
+        logger.info("Indexed %s IMSLP people", next_start)
+
+
+def _person_is_complete(person):
+    return bool(person["authorities"]) and bool(person["birth_date"] or person["death_date"])
+
+
+def get_composer(composer_name):
+    """Get a composer from the local people index. If the composer isn't in the index, or the
+    index doesn't have its authorities or dates, load it from the IMSLP api and add it.
+    If there is no index (see `imslp_index.index_exists`), the composer is only loaded from the api.
+    Returns None if the composer doesn't exist on IMSLP"""
+    person = imslp_index.get_person(composer_name)
+    if person is not None and (_person_is_complete(person) or person["title"] in _people_from_api):
+        return person
     j = imslp_api_raw_query(composer_name)
+    if person is not None:
+        # Some people don't have authorities or dates on IMSLP either, only ask the api once per run
+        _people_from_api.add(person["title"])
     if "0" not in j:
+        return person
+    # Store the composer under the name that we were asked for, so that we find it next time
+    api_person = _api_item_to_person(dict(j["0"], id=composer_name))
+    if not imslp_index.index_exists():
+        return api_person
+    imslp_index.store_people([api_person])
+    return imslp_index.get_person(composer_name)
+
+
+def api_composer_get_relations(composer_name):
+    composer = get_composer(composer_name)
+    if not composer:
         return {}
 
-    composer = j["0"]
-    intvals = composer["intvals"]
-    authorities = intvals.get("wikidata", {}).get("authorities", [])
+    authorities = composer["authorities"]
 
     external_relations = {}
     for link, url, identifier in authorities:
@@ -230,49 +439,48 @@ def api_composer_get_relations(composer_name):
 def api_composer(composer_name):
     """
     Load a composer from ISMLP and return a dictionary adequate to create a Person on the CE
+    Metadata comes from the local people index, or the IMSLP api if the composer isn't indexed yet.
     Arguments:
           composer_name: an imslp Category name for a composer"""
-    j = imslp_api_raw_query(composer_name)
-    if "0" not in j:
+    composer = get_composer(composer_name)
+    if not composer:
         return {}
 
-    composer = j["0"]
-    extvals = composer["extvals"]
-    intvals = composer["intvals"]
-    family_name = intvals.get("lastname")
-    given_name = intvals.get("firstname")
-    name = intvals.get("normalname")
-    gender = extvals.get("Sex")
-    image = intvals.get("picturelinkraw")
-    if image:
-        image = f"https://imslp.org{image}"
-
-    birth_date = parse_imslp_date(extvals.get("Born Year"), extvals.get("Born Month"), extvals.get("Born Day"))
-    death_date = parse_imslp_date(extvals.get("Died Year"), extvals.get("Died Month"), extvals.get("Died Day"))
-
     composer_source = composer["permlink"]
 
-    # Make a second query to get the actual html title
-    page = read_source(composer_source)
-    if page is not None:
+    # The html title isn't in the api, the first time that we see a composer we load it from the page
+    title = composer["page_title"]
+    if title is None:
         title = get_page_title(composer_source)
+        if title is None:
+            return {}
+        if imslp_index.index_exists():
+            imslp_index.set_person_page_title(composer["title"], title)
+
+    return {
+        'contributor': 'https://imslp.org',
+        'source': composer_source,
+        'format_': 'text/html',
+        'language': 'en',
+        'title': title,
+        'name': composer["name"],
+        'gender': composer["gender"],
+        'family_name': composer["family_name"],
+        'given_name': composer["given_name"],
+        'birth_date': composer["birth_date"],
+        'death_date': composer["death_date"],
+        'image': composer["image"]
+    }
 
-        return {
-            'contributor': 'https://imslp.org',
-            'source': composer_source,
-            'format_': 'text/html',
-            'language': 'en',
-            'title': title,
-            'name': name,
-            'gender': gender,
-            'family_name': family_name,
-            'given_name': given_name,
-            'birth_date': birth_date,
-            'death_date': death_date,
-            'image': image
-        }
-    else:
+
+def _imslppage_params(parsed):
+    """The parameters of the #fte:imslppage template of a work page that have a value (Work Title,
+    Language, ...), the same as the extvals of the page in the IMSLP api"""
+    nodes = parsed.filter_templates()
+    if not nodes or str(nodes[0].name).strip() != "#fte:imslppage":
         return {}
+    params = {str(p.name).strip(): str(p.value).strip() for p in nodes[0].params}
+    return {name: value for name, value in params.items() if value}
 
 
 def api_work(work_name):
@@ -282,14 +490,23 @@ def api_work(work_name):
        - one is the wikitext of the page
        - the other is the IMSLP API for a page, given the base64 of a title
        https://imslp.org/imslpscripts/API.ISCR.php?retformat=json/disclaimer=accepted/type=0/id=VmFyaWF0aW9ucyBhbmQgRnVndWUgaW4gRS1mbGF0IG1ham9yLCBPcC4zNSAoQmVldGhvdmVuLCBMdWR3aWcgdmFuKQ==
+    If the work is in the local index, its composer comes from the index and the API isn't used
     """
 
     url = "https://imslp.org/wiki/" + work_name.replace(" ", "_")
-    html_page = read_source(url)
-    api_page = imslp_api_raw_query(work_name.replace("_", " "))
-    api_page = api_page.get('0', {})
+    html_metadata = get_page_metadata(url)
+    indexed_composer = imslp_index.get_composer_for_work(work_name)
     wikitext = get_wiki_content_for_pages([work_name])
     parsed = mwph.parse(wikitext[0]["content"])
+    if indexed_composer is not None:
+        # The composer is in the index and the work info is in the wikitext, we don't need the api
+        extvals = _imslppage_params(parsed)
+        parent = indexed_composer
+    else:
+        api_page = imslp_api_raw_query(work_name.replace("_", " "))
+        api_page = api_page.get('0', {})
+        extvals = api_page.get('extvals', {})
+        parent = api_page.get('parent')
     musicbrainz_work_id = None
     templates = parsed.filter_templates()
     for t in templates:
@@ -303,18 +520,18 @@ def api_work(work_name):
                         'dutch': 'nl',
                         'catalan': 'ca'}
 
-    if html_page is not None:
-        title = get_page_title(url)
+    if html_metadata is not None:
+        title = html_metadata["title"]
 
         inlanguage = None
-        language = api_page.get('extvals', {}).get('Language')
+        language = extvals.get('Language')
         if language:
             inlanguage = language_mapping.get(language.lower())
             if inlanguage is None:
                 print(f"No mapping for language {language}")
 
-        name = api_page.get('extvals', {}).get('Work Title')
-        composer = api_page.get('parent')
+        name = extvals.get('Work Title')
+        composer = parent
 
         work_dict = {
             'title': title,
@@ -572,7 +789,13 @@ def get_score():
 
 def filter_works_for_xml(work_names):
     """Given a list of work names, bulk load them an only return those which have an xml
-    file attached to them (File Description contains "XML") """
+    file attached to them (File Description contains "XML")
+    If a dump is used, this is one pass through the dump file"""
+
+    if dump is not None:
+        wanted = set(work_names)
+        xml_works = {p["title"] for p in dump.iter_pages() if p["title"] in wanted and page_has_mxml(p)}
+        return [w for w in work_names if w in xml_works]
 
     total_works = len(work_names)
     current_works = 0
@@ -589,12 +812,17 @@ def filter_works_for_xml(work_names):
 def get_composers_for_works(work_names):
     """Given a list of works, get a unique list of composers for each of them.
 
-    Requires an individual lookup for each work name
+    Composers are read from the local work index (see `update_work_index`). Works which
+    are not in the index require an individual lookup
     """
     total_works = len(work_names)
     composers = set()
 
     for index, work_name in enumerate(work_names, 1):
+        composer = imslp_index.get_composer_for_work(work_name)
+        if composer:
+            composers.add(composer)
+            continue
         print("{}/{}".format(index, total_works), file=sys.stderr)
         page_contents = imslp_api_raw_query(work_name)
         page = page_contents.get('0')
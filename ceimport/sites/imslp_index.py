@@ -0,0 +1,186 @@
+"""
+A local index of IMSLP pages, built from the bulk IMSLP worklist API.
+
+The index is an sqlite database. Set the `CEIMPORT_IMSLP_INDEX` environment variable, or
+call `use_index`, to choose where it is stored, by default it is `imslp-index.sqlite` in the
+current directory. This module only reads and writes the index, use `imslp.update_work_index`
+to fill it. Lookups only create the index if its path was configured, otherwise it is only
+used once it has been built.
+"""
+import json
+import os
+import sqlite3
+import threading
+
+_connection = None
+_lock = threading.Lock()
+# The path that was set with use_index
+_path = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS works (
+    title TEXT PRIMARY KEY,
+    pageid TEXT,
+    parent TEXT,
+    permlink TEXT,
+    intvals TEXT
+);
+CREATE INDEX IF NOT EXISTS works_parent ON works (parent);
+CREATE TABLE IF NOT EXISTS people (
+    title TEXT PRIMARY KEY,
+    name TEXT,
+    family_name TEXT,
+    given_name TEXT,
+    gender TEXT,
+    birth_date TEXT,
+    death_date TEXT,
+    image TEXT,
+    permlink TEXT,
+    page_title TEXT,
+    authorities TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def use_index(path):
+    """Use the index at `path`, creating it when something is stored in it"""
+    global _path, _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+        _path = path
+
+
+def get_index_path():
+    return _path or os.getenv("CEIMPORT_IMSLP_INDEX", "imslp-index.sqlite")
+
+
+def get_connection():
+    """Open the index, creating it if it doesn't exist. The connection is shared by all threads"""
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(get_index_path(), check_same_thread=False)
+            _connection.executescript(SCHEMA)
+        return _connection
+
+
+def normalise_title(title):
+    return title.replace("_", " ").strip()
+
+
+def get_meta(key, default=None):
+    conn = get_connection()
+    with _lock:
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key, )).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(key, value):
+    conn = get_connection()
+    with _lock, conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+def store_works(works):
+    """Add or update works in the index
+    Arguments:
+        works: items from the IMSLP worklist api (type=2)
+    """
+    rows = []
+    for work in works:
+        intvals = work.get("intvals") or {}
+        rows.append((normalise_title(work["id"]), str(intvals.get("pageid", "")) or None,
+                     work.get("parent"), work.get("permlink"), json.dumps(intvals)))
+    conn = get_connection()
+    with _lock, conn:
+        conn.executemany("INSERT OR REPLACE INTO works (title, pageid, parent, permlink, intvals) "
+                         "VALUES (?, ?, ?, ?, ?)", rows)
+
+
+def index_exists():
+    """True if an index has been created, or its path was configured with `use_index` or
+    CEIMPORT_IMSLP_INDEX. Lookups in an index that doesn't exist return None"""
+    return (_connection is not None or _path is not None or os.getenv("CEIMPORT_IMSLP_INDEX") is not None
+            or os.path.exists(get_index_path()))
+
+
+def get_work(title):
+    """Get a work from the index.
+    Returns a dictionary with keys title, pageid, parent, permlink and intvals, or None
+    if the work isn't in the index"""
+    if not index_exists():
+        return None
+    conn = get_connection()
+    with _lock:
+        row = conn.execute("SELECT title, pageid, parent, permlink, intvals FROM works WHERE title = ?",
+                           (normalise_title(title), )).fetchone()
+    if row is None:
+        return None
+    return {"title": row[0], "pageid": row[1], "parent": row[2], "permlink": row[3],
+            "intvals": json.loads(row[4]) if row[4] else {}}
+
+
+def get_composer_for_work(title):
+    """Get the composer category (e.g. Category:Beethoven, Ludwig van) of a work,
+    or None if the work isn't in the index"""
+    work = get_work(title)
+    if work:
+        return work["parent"]
+    return None
+
+
+PERSON_COLUMNS = ["title", "name", "family_name", "given_name", "gender", "birth_date", "death_date",
+                  "image", "permlink", "page_title", "authorities"]
+
+
+def store_people(people):
+    """Add or update people in the index. Values of a person that is already in the index are
+    kept if the new item doesn't have them (the worklist doesn't have everything that the api
+    has for a page).
+    Arguments:
+        people: dictionaries with the keys in PERSON_COLUMNS. `authorities` is the list of
+                authorities from the IMSLP api.
+    """
+    rows = []
+    for person in people:
+        row = [person.get(c) for c in PERSON_COLUMNS]
+        row[0] = normalise_title(row[0])
+        row[-1] = json.dumps(person.get("authorities") or [])
+        rows.append(row)
+    conn = get_connection()
+    columns = ", ".join(PERSON_COLUMNS)
+    placeholders = ", ".join("?" for _ in PERSON_COLUMNS)
+    with _lock, conn:
+        conn.executemany(f"INSERT INTO people ({columns}) VALUES ({placeholders}) "
+                         "ON CONFLICT (title) DO UPDATE SET "
+                         + ", ".join(f"{c} = COALESCE(excluded.{c}, {c})" for c in PERSON_COLUMNS[1:-1])
+                         + ", authorities = CASE WHEN excluded.authorities = '[]' THEN authorities "
+                           "ELSE excluded.authorities END", rows)
+
+
+def set_person_page_title(title, page_title):
+    conn = get_connection()
+    with _lock, conn:
+        conn.execute("UPDATE people SET page_title = ? WHERE title = ?", (page_title, normalise_title(title)))
+
+
+def get_person(title):
+    """Get a person from the index.
+    Returns a dictionary with the keys in PERSON_COLUMNS, or None if the person isn't in the index"""
+    if not index_exists():
+        return None
+    conn = get_connection()
+    with _lock:
+        row = conn.execute(f"SELECT {', '.join(PERSON_COLUMNS)} FROM people WHERE title = ?",
+                           (normalise_title(title), )).fetchone()
+    if row is None:
+        return None
+    person = dict(zip(PERSON_COLUMNS, row))
+    person["authorities"] = json.loads(person["authorities"]) if person["authorities"] else []
+    return person
@@ -0,0 +1,128 @@
+"""
+Read MusicBrainz entities from the MusicBrainz JSON data dumps, as an offline replacement for
+the MusicBrainz web service.
+
+Download the dumps from https://data.metabrainz.org/pub/musicbrainz/data/json-dumps/ and extract
+the `mbdump/<entity>` file from each archive (artist, work, area) into one directory. Each
+file has one entity per line, in the same JSON format as the web service with all relationships.
+
+The first time that a dump directory is used we build an index in it (index.sqlite) which stores
+the position of each entity in its file, and the url relationships of artists and works so that
+we can find the entity that links to a url.
+"""
+import json
+import os
+import threading
+
+from ceimport import logger, open_sqlite_index
+
+ENTITY_TYPES = ["artist", "work", "area"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    mbid TEXT PRIMARY KEY,
+    entity_type TEXT,
+    offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT,
+    entity_type TEXT,
+    mbid TEXT
+);
+CREATE INDEX IF NOT EXISTS urls_url ON urls (url);
+"""
+
+
+def to_musicbrainzngs(entity):
+    """Convert an entity from the JSON dump to the format that musicbrainzngs returns, so that
+    it can be used in place of the result of e.g. `get_artist_by_id`. Relationships are moved
+    to <target-type>-relation-list, with url relationships having the url in `target`"""
+    ret = {k: v for k, v in entity.items() if k not in ("relations", "isnis") and v is not None}
+    if entity.get("isnis"):
+        ret["isni-list"] = entity["isnis"]
+    if "life-span" in ret:
+        ret["life-span"] = {k: v for k, v in ret["life-span"].items() if v is not None}
+    for relation in entity.get("relations", []):
+        target_type = relation["target-type"]
+        rel = {k: v for k, v in relation.items() if v is not None and not isinstance(v, dict)}
+        target = relation.get(target_type) or relation.get(target_type.replace("-", "_")) or {}
+        if target_type == "url":
+            rel["target"] = target.get("resource")
+        else:
+            rel["target"] = target.get("id")
+            rel[target_type] = target
+        if "ordering-key" in rel:
+            rel["ordering-key"] = str(rel["ordering-key"])
+        ret.setdefault(f"{target_type}-relation-list", []).append(rel)
+    return ret
+
+
+class MusicBrainzDump:
+
+    def __init__(self, directory, index_path=None):
+        self.directory = directory
+        self.index_path = index_path or os.path.join(directory, "index.sqlite")
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _get_connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = open_sqlite_index(self.index_path, SCHEMA, self._build_index)
+            return self._connection
+
+    def _build_index(self, conn):
+        for entity_type in ENTITY_TYPES:
+            path = os.path.join(self.directory, entity_type)
+            if not os.path.exists(path):
+                logger.warning("No %s file in MusicBrainz dump %s", entity_type, self.directory)
+                continue
+            logger.info("Indexing MusicBrainz dump %s", path)
+            with open(path, "rb") as fp:
+                offset = 0
+                entities = []
+                urls = []
+                for i, line in enumerate(fp, 1):
+                    entity = json.loads(line)
+                    entities.append((entity["id"], entity_type, offset))
+                    for relation in entity.get("relations", []):
+                        if relation.get("target-type") == "url":
+                            urls.append((relation["url"]["resource"], entity_type, entity["id"]))
+                    offset += len(line)
+                    if i % 100000 == 0:
+                        self._insert(conn, entities, urls)
+                        entities = []
+                        urls = []
+                        logger.info("Indexed %s %ss", i, entity_type)
+                self._insert(conn, entities, urls)
+
+    @staticmethod
+    def _insert(conn, entities, urls):
+        conn.executemany("INSERT OR REPLACE INTO entities (mbid, entity_type, offset) VALUES (?, ?, ?)", entities)
+        conn.executemany("INSERT INTO urls (url, entity_type, mbid) VALUES (?, ?, ?)", urls)
+
+    def build_index(self):
+        """Build the index of this dump if it doesn't exist yet"""
+        self._get_connection()
+
+    def get_entity(self, entity_type, mbid):
+        """Get an entity from the dump in the format returned by musicbrainzngs,
+        or None if it isn't in the dump"""
+        conn = self._get_connection()
+        with self._lock:
+            row = conn.execute("SELECT offset FROM entities WHERE mbid = ? AND entity_type = ?",
+                               (mbid, entity_type)).fetchone()
+        if row is None:
+            return None
+        with open(os.path.join(self.directory, entity_type), "rb") as fp:
+            fp.seek(row[0])
+            return to_musicbrainzngs(json.loads(fp.readline()))
+
+    def get_mbid_by_url(self, url, entity_type):
+        """Get the mbid of the first entity of type `entity_type` with a relationship to `url`,
+        or None if no entity links to it"""
+        conn = self._get_connection()
+        with self._lock:
+            row = conn.execute("SELECT mbid FROM urls WHERE url = ? AND entity_type = ? ORDER BY rowid",
+                               (url, entity_type)).fetchone()
+        return row[0] if row else None
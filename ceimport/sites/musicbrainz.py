@@ -2,6 +2,8 @@ import requests_cache
 from musicbrainzngs import musicbrainz as mb
 from requests.adapters import HTTPAdapter
 
+from ceimport.sites import mbdump
+
 mb.set_useragent('trompa', '0.1')
 
 
@@ -10,6 +12,25 @@ adapter = HTTPAdapter(max_retries=5)
 session.mount("https://", adapter)
 session.mount("http://", adapter)
 
+# If set, read entities from local MusicBrainz JSON dumps instead of the web service
+dump = None
+
+
+def use_dump(directory):
+    """Read artists, works and areas from the MusicBrainz JSON dumps in `directory` instead of
+    the web service. Entities which aren't in the dump are still loaded from the web service"""
+    global dump
+    dump = mbdump.MusicBrainzDump(directory)
+
+
+def _get_entity(entity_type, mbid, includes=None):
+    if dump is not None:
+        entity = dump.get_entity(entity_type, mbid)
+        if entity is not None:
+            return entity
+    get_by_id = getattr(mb, f"get_{entity_type}_by_id")
+    return get_by_id(mbid, includes=includes or [])[entity_type]
+
 
 VIAF_REL = 'e8571dcc-35d4-4e91-a577-a3382fd84460'
 WIKIDATA_REL = '689870a4-a1e4-4912-b17f-7b2664215698'
@@ -24,7 +45,7 @@ PARTS_REL = 'ca8d3642-ce5f-49f8-91f2-125d72524e6a'
 def get_artist_from_musicbrainz(artist_mbid):
     """
     """
-    artist = mb.get_artist_by_id(artist_mbid, includes=['artist-rels'])['artist']
+    artist = _get_entity('artist', artist_mbid, includes=['artist-rels'])
 
     return artist
 
@@ -51,7 +72,7 @@ def load_group_from_musicbrainz(artist):
     for relation in artist_relations:
         if relation['type-id'] == '5be4c609-9afa-4ea0-910b-12ffb71e3821':
             member = relation.get('artist', {})
-            member = mb.get_artist_by_id(member['id'])['artist']
+            member = _get_entity('artist', member['id'])
             mb_person = load_person_from_musicbrainz(member)
             members.append(mb_person)
 
@@ -60,7 +81,11 @@ def load_group_from_musicbrainz(artist):
 
 def load_person_from_musicbrainz(artist):
     """
+    Arguments:
+        artist: an artist from musicbrainzngs, or an artist mbid
     """
+    if isinstance(artist, str):
+        artist = get_artist_from_musicbrainz(artist)
     name = artist['name']
 
     '''TODO: add these items?
@@ -115,7 +140,7 @@ def load_person_from_musicbrainz(artist):
 def load_person_relations_from_musicbrainz(artist_mbid):
     # TODO: Don't do this request twice
 
-    artist = mb.get_artist_by_id(artist_mbid, includes=['url-rels'])['artist']
+    artist = _get_entity('artist', artist_mbid, includes=['url-rels'])
     isnis = artist.get('isni-list', [])
 
     external_relations = {}
@@ -142,7 +167,7 @@ def load_person_relations_from_musicbrainz(artist_mbid):
 
 
 def load_work_from_musicbrainz(work_mbid):
-    work = mb.get_work_by_id(work_mbid, includes=["artist-rels", "work-rels"])['work']
+    work = _get_entity('work', work_mbid, includes=["artist-rels", "work-rels"])
 
     title = work['title']
     work_dict = {
@@ -195,7 +220,7 @@ def load_work_from_musicbrainz(work_mbid):
 
 
 def load_area_from_musicbrainz(area_id):
-    area = mb.get_area_by_id(area_id)['area']
+    area = _get_entity('area', area_id)
     name = area['name']
     return {
         # This is the title of the page, so it includes the header
@@ -209,18 +234,24 @@ def load_area_from_musicbrainz(area_id):
 
 
 def get_work_mbid_by_imslp_url(imslp_url):
-    return _lookup_imslp_url(imslp_url, 'work-rels', _parse_url_work_relation)
+    return _lookup_imslp_url(imslp_url, 'work', 'work-rels', _parse_url_work_relation)
 
 
 def get_artist_mbid_by_imslp_url(imslp_url):
-    return _lookup_imslp_url(imslp_url, 'artist-rels', _parse_url_artist_relation)
+    return _lookup_imslp_url(imslp_url, 'artist', 'artist-rels', _parse_url_artist_relation)
 
 
-def _lookup_imslp_url(url, includes, parse_callback):
+def _lookup_imslp_url(url, entity_type, includes, parse_callback):
     # In Musicbrainz, imslp urls are all https:
     if url.startswith("http://"):
         url = url.replace("http:", "https:")
 
+    if dump is not None:
+        mbid = dump.get_mbid_by_url(url, entity_type)
+        if mbid is not None:
+            return mbid
+        # The relationship could have been added after the dump was made
+
     params = {"fmt": "json", "resource": url,
               "inc": includes}
     headers = {"User-Agent": "trompa importer"}
@@ -0,0 +1,172 @@
+"""
+Read pages from a MediaWiki XML export (pages-articles.xml), as an offline replacement for
+the api of a MediaWiki site like IMSLP or CPDL.
+
+The dump can be uncompressed, or compressed with bz2 or gzip. It is read as a stream, one <page>
+at a time, so memory use doesn't depend on the size of the dump.
+The first time that a dump is used we build an index next to it (dump path + .index.sqlite)
+which stores the position of each page in the dump, and the categories that pages are in.
+
+Random access to single pages is fast for an uncompressed dump, but for a compressed dump
+each lookup has to decompress the file up to the page. For full passes over a dump use `iter_pages`.
+
+Categories are read from [[Category:...]] links in the wikitext. Categories which a site
+adds to pages through templates are not visible in a dump, the cpdl and imslp modules get the
+pages of a category from the api when a dump has none.
+"""
+import bz2
+import gzip
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+from ceimport import chunks, logger, open_sqlite_index
+
+CATEGORY_RE = re.compile(r"\[\[\s*Category\s*:\s*([^\]|]+)", re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    title TEXT PRIMARY KEY,
+    offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS categories (
+    category TEXT,
+    title TEXT
+);
+CREATE INDEX IF NOT EXISTS categories_category ON categories (category);
+"""
+
+
+def open_dump(path):
+    """Open a dump file for reading in binary mode, decompressing it if needed"""
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    elif path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    else:
+        return open(path, "rb")
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def parse_page(fragment):
+    """Parse the xml of a single <page> element into a dictionary {"title", "ns", "content"}"""
+    element = ET.fromstring(fragment)
+    page = {"title": None, "ns": None, "content": None}
+    for child in element.iter():
+        name = _local_name(child.tag)
+        if name == "title":
+            page["title"] = child.text
+        elif name == "ns":
+            page["ns"] = int(child.text)
+        elif name == "text":
+            # Only keep the text of the last revision
+            page["content"] = child.text or ""
+    return page
+
+
+def iter_page_fragments(fp):
+    """Read a dump line by line, yielding (offset, xml) for each <page> element.
+    `offset` is the position of the <page> line in the uncompressed dump"""
+    offset = 0
+    page_offset = None
+    lines = []
+    for line in fp:
+        stripped = line.strip()
+        if stripped == b"<page>":
+            page_offset = offset
+            lines = []
+        if page_offset is not None:
+            lines.append(line)
+        if stripped == b"</page>" and page_offset is not None:
+            yield page_offset, b"".join(lines)
+            page_offset = None
+            lines = []
+        offset += len(line)
+
+
+def normalise_title(title):
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+class MediaWikiDump:
+
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + ".index.sqlite"
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _get_connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = open_sqlite_index(self.index_path, SCHEMA, self._build_index)
+            return self._connection
+
+    def _build_index(self, conn):
+        logger.info("Indexing MediaWiki dump %s", self.path)
+        with open_dump(self.path) as fp:
+            for i, (offset, fragment) in enumerate(iter_page_fragments(fp), 1):
+                page = parse_page(fragment)
+                conn.execute("INSERT OR REPLACE INTO pages (title, offset) VALUES (?, ?)", (page["title"], offset))
+                if page["ns"] != 0:
+                    continue
+                categories = {normalise_title(c) for c in CATEGORY_RE.findall(page["content"] or "")}
+                conn.executemany("INSERT INTO categories (category, title) VALUES (?, ?)",
+                                 [(c, page["title"]) for c in categories])
+                if i % 10000 == 0:
+                    logger.info("Indexed %s pages", i)
+
+    def build_index(self):
+        """Build the index of this dump if it doesn't exist yet"""
+        self._get_connection()
+
+    def iter_pages(self):
+        """Yield every page in the dump, in the order that they appear in the file"""
+        with open_dump(self.path) as fp:
+            for offset, fragment in iter_page_fragments(fp):
+                yield parse_page(fragment)
+
+    def get_pages(self, titles):
+        """Get the wikitext of many pages. Pages are read in the order that they are in the dump,
+        so that the file is only read once. Titles which aren't in the dump are skipped.
+        Returns a list of {"title", "content"}, in the same format as `get_wiki_content_for_pages`"""
+        conn = self._get_connection()
+        offsets = []
+        for items in chunks([normalise_title(t) for t in titles], 500):
+            placeholders = ", ".join("?" for _ in items)
+            with self._lock:
+                offsets.extend(conn.execute(f"SELECT offset FROM pages WHERE title IN ({placeholders})",
+                                            items).fetchall())
+        ret = []
+        with open_dump(self.path) as fp:
+            for offset, in sorted(offsets):
+                fp.seek(offset)
+                lines = []
+                for line in fp:
+                    lines.append(line)
+                    if line.strip() == b"</page>":
+                        break
+                page = parse_page(b"".join(lines))
+                ret.append({"title": page["title"], "content": page["content"]})
+        return ret
+
+    def titles_in_category(self, category):
+        """All titles of pages in the main namespace which are in the category,
+        from [[Category:]] links on the page. Subcategories are not included"""
+        if category.startswith("Category:"):
+            category = category[len("Category:"):]
+        conn = self._get_connection()
+        with self._lock:
+            rows = conn.execute("SELECT title FROM categories WHERE category = ? ORDER BY title",
+                                (normalise_title(category), )).fetchall()
+        return [r[0] for r in rows]
+
+    def page_titles(self):
+        """The titles of all pages in the dump"""
+        conn = self._get_connection()
+        with self._lock:
+            return [r[0] for r in conn.execute("SELECT title FROM pages ORDER BY offset").fetchall()]
@@ -2,10 +2,12 @@ import requests_cache
 import wikipedia
 from wikipedia.exceptions import DisambiguationError, PageError
 from wikidata.client import Client
-from urllib.parse import urlparse
+from urllib.parse import unquote, urlparse
 
 from requests.adapters import HTTPAdapter
 
+from ceimport.sites import wikidata_dump
+
 session = requests_cache.CachedSession()
 adapter = HTTPAdapter(max_retries=5)
 session.mount("https://", adapter)
@@ -16,6 +18,17 @@ class WikipediaException(Exception):
     pass
 
 
+class IndexedEntity:
+    """An entity from the local index (see `wikidata_dump`), with the attributes
+    of `wikidata.entity.Entity` that we use"""
+
+    def __init__(self, entity):
+        self.id = entity["qid"]
+        self.label = entity["labels"]
+        self.description = entity["descriptions"]
+        self.attributes = {"sitelinks": entity["sitelinks"]}
+
+
 def load_person_from_wikidata_url(wikidata_url):
 
     # TODO: Description, multiple versions for different languages
@@ -122,6 +135,11 @@ def get_wikidata_id_from_wikipedia_url(wp_url):
     if "en.wikipedia.org" not in wp_url:
         raise WikipediaException("Can only use en.wikipedia.org urls")
     parts = urlparse(wp_url)
+    if wikidata_dump.index_exists():
+        qid = wikidata_dump.get_qid_by_sitelink("enwiki", unquote(parts.path[len("/wiki/"):]))
+        if qid is not None:
+            return qid
+        # The page may be newer than the index, or be linked to an entity that isn't in it
     # Remove /wiki/
     # some titles may have / in them so we can't take the last part after splitting on /
     wp_title = "/".join(parts[2:])
@@ -159,6 +177,9 @@ def get_description_from_wikipedia(title):
 def get_entity_for_wikidata(wikidata_url):
     parts = urlparse(wikidata_url)
     wd_id = parts.path.split("/")[-1]
+    indexed = wikidata_dump.get_entity(wd_id)
+    if indexed is not None:
+        return IndexedEntity(indexed)
     c = Client()
     entity = c.get(wd_id, load=True)
     return entity
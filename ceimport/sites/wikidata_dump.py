@@ -0,0 +1,213 @@
+"""
+Extract the entities that we are interested in from a Wikidata JSON dump
+(https://dumps.wikimedia.org/wikidatawiki/entities/latest-all.json.bz2) into a small local index,
+so that Wikidata and Wikipedia lookups for people can be made without the network.
+
+Only entities with one of the external identifiers in `PROPERTIES` are kept, and of these
+only the labels, descriptions and Wikipedia sitelinks in `LANGUAGES`, and the identifiers.
+The dump is read one entity at a time, so memory use doesn't depend on the size of the dump.
+
+The index is an sqlite database. Set the `CEIMPORT_WIKIDATA_INDEX` environment variable
+to choose where it is stored, by default it is `wikidata-index.sqlite` in the current directory.
+"""
+import bz2
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+from ceimport import logger
+
+LANGUAGES = ["en", "es", "ca", "nl", "de", "fr"]
+
+# External identifiers that an entity needs to have at least one of to be kept
+PROPERTIES = {
+    "musicbrainz_artist": "P434",
+    "musicbrainz_work": "P435",
+    "imslp": "P839",
+    "viaf": "P214",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    qid TEXT PRIMARY KEY,
+    labels TEXT,
+    descriptions TEXT,
+    identifiers TEXT
+);
+CREATE TABLE IF NOT EXISTS sitelinks (
+    site TEXT,
+    title TEXT,
+    qid TEXT,
+    PRIMARY KEY (site, title)
+);
+CREATE TABLE IF NOT EXISTS identifiers (
+    property TEXT,
+    value TEXT,
+    qid TEXT
+);
+CREATE INDEX IF NOT EXISTS identifiers_value ON identifiers (property, value);
+"""
+
+_connection = None
+_lock = threading.Lock()
+
+
+def get_index_path():
+    return os.getenv("CEIMPORT_WIKIDATA_INDEX", "wikidata-index.sqlite")
+
+
+def get_connection():
+    """Open the index, creating it if it doesn't exist. The connection is shared by all threads"""
+    global _connection
+    with _lock:
+        if _connection is None:
+            _connection = sqlite3.connect(get_index_path(), check_same_thread=False)
+            _connection.executescript(SCHEMA)
+        return _connection
+
+
+def index_exists():
+    """True if an index has been created. Lookups in an index that doesn't exist return None"""
+    return _connection is not None or os.path.exists(get_index_path())
+
+
+def open_dump(path):
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rb")
+    elif path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    else:
+        return open(path, "rb")
+
+
+def iter_entities(fp, properties):
+    """Read a Wikidata JSON dump, yielding only the entities that have a claim for one of `properties`.
+    The dump is a json array with one entity on each line"""
+    markers = [f'"{p}"'.encode() for p in properties]
+    for line in fp:
+        line = line.strip().rstrip(b",")
+        if not line or line in (b"[", b"]"):
+            continue
+        # Most entities don't have any of the properties, avoid parsing them
+        if not any(m in line for m in markers):
+            continue
+        entity = json.loads(line)
+        claims = entity.get("claims", {})
+        if any(p in claims for p in properties):
+            yield entity
+
+
+def _claim_values(claims, prop):
+    values = []
+    for statement in claims.get(prop, []):
+        value = statement.get("mainsnak", {}).get("datavalue", {}).get("value")
+        if isinstance(value, str):
+            values.append(value)
+    return values
+
+
+def compact_entity(entity, properties):
+    """Keep only the parts of a Wikidata entity that we store in the index"""
+    claims = entity.get("claims", {})
+    return {
+        "qid": entity["id"],
+        "labels": {lang: entity["labels"][lang]["value"] for lang in LANGUAGES if lang in entity.get("labels", {})},
+        "descriptions": {lang: entity["descriptions"][lang]["value"]
+                         for lang in LANGUAGES if lang in entity.get("descriptions", {})},
+        "sitelinks": {f"{lang}wiki": entity["sitelinks"][f"{lang}wiki"]["title"]
+                      for lang in LANGUAGES if f"{lang}wiki" in entity.get("sitelinks", {})},
+        "identifiers": {name: _claim_values(claims, prop) for name, prop in properties.items()
+                        if prop in claims}
+    }
+
+
+def extract_dump(path, properties=None):
+    """Read a Wikidata JSON dump (optionally .bz2 or .gz) and add all entities with one of
+    the identifiers in `properties` to the index.
+    Arguments:
+        path: the dump file
+        properties: a dictionary of {name: property id}, defaults to `PROPERTIES`
+    """
+    properties = properties or PROPERTIES
+    count = 0
+    batch = []
+    with open_dump(path) as fp:
+        for entity in iter_entities(fp, properties.values()):
+            batch.append(compact_entity(entity, properties))
+            if len(batch) == 1000:
+                store_entities(batch)
+                count += len(batch)
+                batch = []
+                logger.info("Extracted %s entities", count)
+    store_entities(batch)
+    logger.info("Extracted %s entities", count + len(batch))
+
+
+def store_entities(entities):
+    conn = get_connection()
+    with _lock, conn:
+        for e in entities:
+            conn.execute("INSERT OR REPLACE INTO entities (qid, labels, descriptions, identifiers) VALUES (?, ?, ?, ?)",
+                         (e["qid"], json.dumps(e["labels"]), json.dumps(e["descriptions"]),
+                          json.dumps(e["identifiers"])))
+            conn.execute("DELETE FROM sitelinks WHERE qid = ?", (e["qid"], ))
+            conn.executemany("INSERT OR REPLACE INTO sitelinks (site, title, qid) VALUES (?, ?, ?)",
+                             [(site, title, e["qid"]) for site, title in e["sitelinks"].items()])
+            conn.execute("DELETE FROM identifiers WHERE qid = ?", (e["qid"], ))
+            conn.executemany("INSERT INTO identifiers (property, value, qid) VALUES (?, ?, ?)",
+                             [(name, value, e["qid"]) for name, values in e["identifiers"].items()
+                              for value in values])
+
+
+def wikipedia_url(site, title):
+    language = site[:-len("wiki")]
+    return f"https://{language}.wikipedia.org/wiki/{quote(title.replace(' ', '_'), safe=':/(),!*')}"
+
+
+def get_entity(qid):
+    """Get an entity from the index.
+    Returns a dictionary with keys qid, labels, descriptions, sitelinks and identifiers. sitelinks are
+    in the same format as the Wikidata api: {"enwiki": {"title": ..., "url": ...}}.
+    Returns None if the entity isn't in the index"""
+    if not index_exists():
+        return None
+    conn = get_connection()
+    with _lock:
+        row = conn.execute("SELECT labels, descriptions, identifiers FROM entities WHERE qid = ?",
+                           (qid, )).fetchone()
+        if row is None:
+            return None
+        sitelinks = conn.execute("SELECT site, title FROM sitelinks WHERE qid = ?", (qid, )).fetchall()
+    return {
+        "qid": qid,
+        "labels": json.loads(row[0]),
+        "descriptions": json.loads(row[1]),
+        "identifiers": json.loads(row[2]),
+        "sitelinks": {site: {"title": title, "url": wikipedia_url(site, title)} for site, title in sitelinks}
+    }
+
+
+def get_qid_by_sitelink(site, title):
+    """Get the id of the entity with a sitelink to the page `title` on `site` (e.g. enwiki),
+    or None if it isn't in the index"""
+    if not index_exists():
+        return None
+    conn = get_connection()
+    with _lock:
+        row = conn.execute("SELECT qid FROM sitelinks WHERE site = ? AND title = ?",
+                           (site, title.replace("_", " "))).fetchone()
+    return row[0] if row else None
+
+
+def get_qid_by_identifier(name, value):
+    """Get the id of the entity with an external identifier, e.g. ("musicbrainz_artist", mbid)"""
+    if not index_exists():
+        return None
+    conn = get_connection()
+    with _lock:
+        row = conn.execute("SELECT qid FROM identifiers WHERE property = ? AND value = ?",
+                           (name, value)).fetchone()
+    return row[0] if row else None
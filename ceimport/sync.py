@@ -0,0 +1,102 @@
+"""
+Keep track of when a category on a MediaWiki site was last imported, so that
+later imports only need to process pages that changed since then.
+
+The time of the last import of each (site, category) is stored in a json file.
+Set the `CEIMPORT_SYNC_STATE` environment variable to choose where this file is, by default
+it is `ceimport-sync-state.json` in the current directory.
+"""
+import datetime
+import json
+import os
+
+# MediaWiki only keeps recent changes for a limited time ($wgRCMaxAge). Its default is 90 days,
+# but sites can set it lower, so we only trust the recent changes of the last 30 days.
+# If the last import was longer ago than this, we can't know everything that changed since then
+RECENTCHANGES_MAX_AGE = datetime.timedelta(days=30)
+
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+
+def _get_state_file():
+    return os.getenv("CEIMPORT_SYNC_STATE", "ceimport-sync-state.json")
+
+
+def _load_state():
+    state_file = _get_state_file()
+    if not os.path.exists(state_file):
+        return {}
+    with open(state_file) as fp:
+        return json.load(fp)
+
+
+def now():
+    """The current time as a MediaWiki api timestamp"""
+    return datetime.datetime.utcnow().strftime(TIMESTAMP_FORMAT)
+
+
+def get_last_sync(site, category):
+    """Get the timestamp of the last complete import of `category` on `site`.
+    Returns None if the category was never imported, or if it was imported too long ago to be able
+    to use the recentchanges api to find what changed since then."""
+    timestamp = _load_state().get(site, {}).get(category)
+    if timestamp is None:
+        return None
+    last_sync = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+    if datetime.datetime.utcnow() - last_sync > RECENTCHANGES_MAX_AGE:
+        return None
+    return timestamp
+
+
+def set_last_sync(site, category, timestamp):
+    """Record that `category` on `site` was completely imported at `timestamp`"""
+    state = _load_state()
+    state.setdefault(site, {})[category] = timestamp
+    state_file = _get_state_file()
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w") as fp:
+        json.dump(state, fp, indent=2, sort_keys=True)
+    os.replace(tmp_file, state_file)
+
+
+def get_titles_changed_since(session, api_url, timestamp):
+    """Use the MediaWiki recentchanges api to get the titles of all pages in the main namespace
+    that were created, edited or moved since `timestamp`. Both the old and the new title of a
+    moved page are included
+
+    Arguments:
+        session: the requests session of the site
+        api_url: the url of the site's api.php
+        timestamp: a MediaWiki api timestamp, e.g. from `get_last_sync`
+    Returns:
+        a set of page titles
+    """
+    params = {
+        "action": "query",
+        "list": "recentchanges",
+        "rcstart": timestamp,
+        "rcdir": "newer",
+        "rcnamespace": "0",
+        "rctype": "new|edit|log",
+        "rcprop": "title|loginfo",
+        "rclimit": "500",
+        "format": "json"
+    }
+    titles = set()
+    while True:
+        r = session.get(api_url, params=params)
+        r.raise_for_status()
+        j = r.json()
+        for change in j.get("query", {}).get("recentchanges", []):
+            if change["type"] == "log":
+                # Other log entries (uploads, deletions, blocks, ...) don't change the text of a page
+                if change.get("logtype") != "move":
+                    continue
+                target = change.get("logparams", {}).get("target_title")
+                if target:
+                    titles.add(target)
+            titles.add(change["title"])
+        cont = j.get("continue")
+        if not cont:
+            return titles
+        params.update(cont)
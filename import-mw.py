@@ -13,8 +13,8 @@ import asyncio
 import trompace as ce
 from trompace.config import config
 
-from muziekweb_api import set_api_account
-from importers import import_artist, import_album, import_tracks
+from muziekweb_api import set_api_account, use_dump
+from importers import import_artist, import_album, import_tracks, import_track_keys
 from dotenv import load_dotenv
 
 
@@ -29,6 +29,8 @@ main_parser = argparse.ArgumentParser(description="Input data options:")
 # main_parser.add_argument("-a", dest="artist", required=False, help="Muziekweb performer_id or input file with Muziekweb performer identifiers.")
 # main_parser.add_argument("-r", dest="release", required=False, help="Muziekweb album_id or input file with Muziekweb albums release identifiers.")
 main_parser.add_argument("-t", dest="track", required=False, help="Muziekweb track_id or input file with Muziekweb albums track identifiers.")
+main_parser.add_argument("-d", dest="dump", required=False, help="Read albums and performers from this Muziekweb linked-data dump (N-Triples or Turtle, optionally gzipped) instead of the API. Turtle dumps are loaded into memory, use N-Triples for large dumps.")
+main_parser.add_argument("-c", dest="concurrency", type=int, default=4, help="Number of tracks to import at the same time (default 4).")
 # Trompa CE
 main_parser.add_argument("-ce", dest="ce_host", required=False, help="Trompa CE host.")
 main_parser.add_argument("-ceu", dest="ce_user", required=False, help="Trompa CE username.")
@@ -45,6 +47,7 @@ args = main_parser.parse_args()
 # source_artist = None if args.artist is None else args.artist.strip(" \n\t\"")
 # source_release = None if args.release is None else args.release.strip(" \n\t\"")
 source_track = None if args.track is None else args.track.strip(" \n\t\"")
+concurrency = max(1, args.concurrency)
 
 # Trompa CE
 trompa_ce_host = trompa_ce_host if args.ce_host is None else args.ce_host
@@ -76,7 +79,9 @@ if __name__ == "__main__":
     config_file = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'trompace.ini')
     config.load(config_file)
 
-    if mw_api_user is None or mw_api_pass is None:
+    if args.dump is not None:
+        use_dump(args.dump)
+    elif mw_api_user is None or mw_api_pass is None:
         print('Add Muziekweb user and password to a .env file as with .env.example')
         sys.exit(0)
 
@@ -85,25 +90,21 @@ if __name__ == "__main__":
         set_api_account(mw_api_user, mw_api_pass)
 
     tracks = readKeys(source_track)
-    for track in tracks:
-        # Import Muziekweb artists into the Trompa CE
-        # asyncio for python >= 3.8
-        if sys.version_info[0] == 3 and sys.version_info[1] >= 8:
-            # if source_artist is not None:
-            #     asyncio.run(import_artist(source_artist))
-            # elif source_release is not None:
-            #     asyncio.run(import_album(source_release))
-            # elif source_track is not None:
-            asyncio.run(import_tracks(track))
-        else:
-            # asyncio for python < 3.7
-            loop = asyncio.get_event_loop()
-            # if source_artist is not None:
-            #     result = loop.run_until_complete(import_artist(source_artist))
-            # elif source_release is not None:
-            #     result = loop.run_until_complete(import_album(source_release))
-            # elif source_track is not None:
-            result = loop.run_until_complete(import_tracks(track))
-
-        print('Import track {} COMPLETED'.format(track))
-        print('--------------------------------------\n')
\ No newline at end of file
+    # Import Muziekweb tracks into the Trompa CE
+    # asyncio for python >= 3.8
+    if sys.version_info[0] == 3 and sys.version_info[1] >= 8:
+        # if source_artist is not None:
+        #     asyncio.run(import_artist(source_artist))
+        # elif source_release is not None:
+        #     asyncio.run(import_album(source_release))
+        # elif source_track is not None:
+        asyncio.run(import_track_keys(tracks, concurrency))
+    else:
+        # asyncio for python < 3.7
+        loop = asyncio.get_event_loop()
+        # if source_artist is not None:
+        #     result = loop.run_until_complete(import_artist(source_artist))
+        # elif source_release is not None:
+        #     result = loop.run_until_complete(import_album(source_release))
+        # elif source_track is not None:
+        result = loop.run_until_complete(import_track_keys(tracks, concurrency))
@@ -2,5 +2,5 @@
 Import per data type
 """
 from .artist import import_artist
-from .audio_object import import_tracks
+from .audio_object import import_tracks, import_track_keys, get_mw_audio_tracks, group_keys_by_album, PerformerResolver
 from .music_album import import_album
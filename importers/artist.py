@@ -1,25 +1,121 @@
 """
 Muziekweb artist importer
 """
-from typing import Optional
+import asyncio
+import csv
+import io
+from typing import Dict, Optional
 
-import trompace as ce
-from SPARQLWrapper import SPARQLWrapper, JSON
-from trompace.connection import submit_query
+from rdflib import Graph
+from SPARQLWrapper import SPARQLWrapper, CSV
 from trompace.mutations.person import mutation_update_person, mutation_create_person
 
+from ceimport import chunks
 from models import CE_Person
-from trompace_local import GLOBAL_CONTRIBUTOR, GLOBAL_IMPORTER_REPO, GLOBAL_PUBLISHER, lookupIdentifier
+from trompace_local import GLOBAL_CONTRIBUTOR, GLOBAL_IMPORTER_REPO, GLOBAL_PUBLISHER, lookupIdentifier, \
+    submit_query_async
+
+
+MW_SPARQL_ENDPOINT = "https://api.data.muziekweb.nl/datasets/muziekweborganization/Muziekweb/services/Muziekweb/sparql"
+MW_LINK_URL = "https://data.muziekweb.nl/Link/{}"
+
+# Number of performer links to send in one SPARQL query
+ARTIST_BATCH_SIZE = 200
+
+_sparql = None
+
+
+def get_sparql_endpoint():
+    """The Muziekweb SPARQL endpoint, created once and reused for all queries"""
+    global _sparql
+    if _sparql is None:
+        _sparql = SPARQLWrapper(MW_SPARQL_ENDPOINT)
+    return _sparql
+
+
+def run_sparql_query(endpoint, qry):
+    """Run a SELECT query and yield each result row as a dictionary {variable: value}.
+    Rows are read one at a time from the response.
+
+    Arguments:
+        endpoint: a SPARQLWrapper, or an rdflib Graph (e.g. loaded from a local file, for
+            running without the Muziekweb endpoint)
+        qry: the query
+    """
+    if isinstance(endpoint, Graph):
+        for row in endpoint.query(qry):
+            yield {var: str(value) for var, value in row.asdict().items()}
+        return
+
+    endpoint.setQuery(qry)
+    endpoint.setReturnFormat(CSV)
+    response = endpoint.query().response
+    try:
+        for row in csv.DictReader(io.TextIOWrapper(response, encoding="utf-8")):
+            yield row
+    finally:
+        response.close()
+
+
+def build_artists_query(keys: list) -> str:
+    values = " ".join(f"<{MW_LINK_URL.format(key)}>" for key in keys)
+    return f"""PREFIX schema: <http://schema.org/>
+    PREFIX vocab: <https://data.muziekweb.nl/vocab/>
+    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
+    select ?url ?name ?birthYear ?deathYear where {{
+        VALUES ?url {{ {values} }}
+        ?url vocab:beginYear ?birthYear;
+            vocab:endYear ?deathYear;
+            rdfs:label ?name.
+    }}"""
+
+
+def get_mw_artists(keys: list, endpoint=None, batch_size: int = ARTIST_BATCH_SIZE) -> Dict[str, CE_Person]:
+    """
+    Get many artists from Muziekweb, with `batch_size` artists in each SPARQL query.
+    Returns:
+        a dictionary of {key: CE_Person}. Keys that weren't found are not included
+    """
+    if endpoint is None:
+        endpoint = get_sparql_endpoint()
+
+    artists = {}
+    for batch in chunks(keys, batch_size):
+        for row in run_sparql_query(endpoint, build_artists_query(batch)):
+            key = row["url"].rsplit("/", 1)[-1]
+            if key in artists:
+                continue
+            person = CE_Person(
+                identifier=None,
+                name=row["name"],
+                url=row["url"],
+                contributor=GLOBAL_CONTRIBUTOR,
+                creator=GLOBAL_IMPORTER_REPO,
+                title='{} - Muziekweb'.format(row["name"]),
+                source=row["url"],
+            )
+
+            person.publisher = GLOBAL_PUBLISHER
+            person.description = None
+            person.birthDate = row["birthYear"]
+            person.deathDate = row["deathYear"]
+
+            artists[key] = person
+
+    return artists
 
 
 async def import_artist(keys: list):
     """
     Imports artists from Muziekweb for all given keys into the Trompa CE.
     """
+    print(f"Retrieving {len(keys)} artists from Muziekweb")
+    # Get data from Muziekweb, without blocking the event loop
+    loop = asyncio.get_event_loop()
+    artists = await loop.run_in_executor(None, get_mw_artists, keys)
+
     for key in keys:
-        print(f"Retrieving artist with key {key} from Muziekweb")
-        # Get data from Muziekweb
-        artist = await get_mw_artist(key)
+        artist = artists.get(key)
 
         if artist is None:
             print(f"No data received for {key}")
@@ -29,11 +125,11 @@ async def import_artist(keys: list):
 
         if artist.identifier is not None:
             print(f"Updating record {artist.identifier} in Trompa CE", end="")
-            response = await ce.connection.submit_query(mutation_update_person(**artist.as_dict()))
+            response = await submit_query_async(mutation_update_person(**artist.as_dict()))
             artist.identifier = response["data"]["UpdatePerson"]["identifier"]
         else:
             print("Inserting new record in Trompa CE", end="")
-            response = await ce.connection.submit_query(mutation_create_person(**artist.as_dict()))
+            response = await submit_query_async(mutation_create_person(**artist.as_dict()))
             artist.identifier = response["data"]["CreatePerson"]["identifier"]
 
         if artist.identifier is None:
@@ -45,37 +141,6 @@ async def import_artist(keys: list):
 
 
 async def get_mw_artist(key: str) -> Optional[CE_Person]:
-    sparql = SPARQLWrapper(
-        "https://api.data.muziekweb.nl/datasets/muziekweborganization/Muziekweb/services/Muziekweb/sparql")
-    sparql.setReturnFormat(JSON)
-    qry = f"""PREFIX schema: <http://schema.org/>
-    PREFIX vocab: <https://data.muziekweb.nl/vocab/>
-    PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
-    select ?url ?name ?birthYear ?deathYear where {{
-        BIND(<https://data.muziekweb.nl/Link/{key}> as ?url)
-        ?url vocab:beginYear ?birthYear;
-            vocab:endYear ?deathYear;
-            rdfs:label ?name.
-    }}"""
-    sparql.setQuery(qry)
-
-    result = sparql.query().convert()["results"]["bindings"]
-
-    if len(result) > 0:
-        # Now get Muziekweb data
-        person = CE_Person(
-            identifier=None,
-            name=result[0]["name"]["value"],
-            url=result[0]["url"]["value"],
-            contributor=GLOBAL_CONTRIBUTOR,
-            creator=GLOBAL_IMPORTER_REPO,
-        )
-
-        person.publisher = GLOBAL_PUBLISHER
-        person.description = None
-        person.birthDate = result[0]["birthYear"]["value"]
-        person.deathDate = result[0]["deathYear"]["value"]
-
-        return person
-
-    return None
+    loop = asyncio.get_event_loop()
+    artists = await loop.run_in_executor(None, get_mw_artists, [key])
+    return artists.get(key)
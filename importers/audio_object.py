@@ -1,7 +1,10 @@
 """
 Muziekweb music fragment importer
 """
+import asyncio
+import concurrent.futures
 import itertools
+import weakref
 
 import trompace as ce
 from trompace.connection import submit_query
@@ -17,6 +20,7 @@ from trompace.mutations.musicgroup import mutation_create_musicgroup, \
 from trompace.mutations.musicrecording import mutation_create_musicrecording, \
     mutation_update_musicrecording, mutation_merge_music_recording_audio
 
+from ceimport import run_lookups_by_host
 from ceimport.sites.isni import load_person_from_isni
 # from ceimport.sites.musicbrainz import load_person_data_from_musicbrainz
 from ceimport.sites import musicbrainz
@@ -24,214 +28,195 @@ from ceimport.sites.viaf import load_person_from_viaf
 from ceimport.sites.wikidata import load_person_from_wikidata_url, load_person_from_wikipedia_url
 from models import CE_AudioObject, CE_Person, CE_MusicComposition, CE_MusicGroup, CE_MusicRecording
 from muziekweb_api import get_album_information, get_artist_information
-from trompace_local import GLOBAL_CONTRIBUTOR, GLOBAL_IMPORTER_REPO, GLOBAL_PUBLISHER, lookupIdentifier
+from trompace_local import GLOBAL_CONTRIBUTOR, GLOBAL_IMPORTER_REPO, GLOBAL_PUBLISHER, lookupIdentifier, \
+    lookupIdentifiers, submit_query_async
 
 MW_AUDIO_URL = "https://www.muziekweb.nl/Embed/{}"
 MW_MUSIC_URL = "https://www.muziekweb.nl/en/Link/{}/{}/{}"
+# The fields of a track from `get_album_information` that we need to import it
+TRACK_FIELDS = ('uniform_title_link', 'uniform_title', 'catalogue', 'performer_link')
 
 
-async def import_tracks(key: str):
-    """
-    Imports audio fragments from Muziekweb for the key into the Trompa CE.
-    """
-    print(f"Retrieving release info with key {key} from Muziekweb")
-    # Get data from Muziekweb
-    audio_objects, music_recordings, music_works, persons, music_groups = get_mw_audio_1track(key)
-    # tracks = get_mw_audio(key)
-
-    if audio_objects is None or len(audio_objects) == 0:
-        print(f"No track data received for {key}")
-        return
-
-    #####################################
-    # MUSICCOMPOSITION
-    # Loop the music works to create the CE_MusicComposition on the CE
-    #####################################
-    for work in music_works:
-
-        work.identifier = await lookupIdentifier("MusicComposition", work.source)
+# Objects with the same source are imported one at a time, so that tracks that are imported
+# concurrently don't both create the same object. Per event loop, the locks for each source
+# and the identifiers of objects that were created while it ran
+_run_state = weakref.WeakKeyDictionary()
 
-        if work.identifier is not None:
-            print(f"Updating work {work.identifier} in Trompa CE\n", end="")
-            response = await ce.connection.submit_query_async(mutation_update_music_composition(**work.as_dict()))
-            work.identifier = response["data"]["UpdateMusicComposition"]["identifier"]
-        else:
-            print("Inserting new work {} in Trompa CE\n".format(work.name))
 
-            response = await ce.connection.submit_query_async(mutation_create_music_composition(**work.as_dict()))
-            work.identifier = response["data"]["CreateMusicComposition"]["identifier"]
+def _get_run_state():
+    return _run_state.setdefault(asyncio.get_event_loop(), {"locks": {}, "created": {}})
 
-    print(f"Importing music composition {work.identifier} done.\n")
 
-    #####################################
-    # MUSICRECORDING
-    # Loop the music recordings to create the CE_MusicRecording on the CE
-    #####################################
-    for recording in music_recordings:
+def _get_source_lock(source):
+    locks = _get_run_state()["locks"]
+    if source not in locks:
+        locks[source] = asyncio.Lock()
+    return locks[source]
 
-        recording.identifier = await lookupIdentifier("MusicRecording", recording.source)
 
-        if recording.identifier is not None:
-            print(f"Updating music recording {recording.identifier} in Trompa CE\n")
+async def _import_ce_object(obj, ce_type, mutation_update, mutation_create, label, identifiers=None):
+    """Update `obj` in the Trompa CE if an object with its source exists, otherwise create it.
+    Sets and returns the identifier of the object
 
-            response = await ce.connection.submit_query_async(mutation_update_musicrecording(**recording.as_dict()))
-            recording.identifier = response["data"]["UpdateMusicRecording"]["identifier"]
+    Arguments:
+        identifiers: identifiers that were already looked up with `lookupIdentifiers`
+    """
+    async with _get_source_lock(obj.source):
+        created = _get_run_state()["created"]
+        key = (ce_type, obj.source)
+        if key in created:
+            # Created by another track after the identifiers were looked up
+            obj.identifier = created[key]
+        elif identifiers is not None and key in identifiers:
+            obj.identifier = identifiers[key]
         else:
-            print("Inserting new recording {} in Trompa CE\n".format(recording.title))
-
-            response = await ce.connection.submit_query_async(mutation_create_musicrecording(**recording.as_dict()))
-            recording.identifier = response["data"]["CreateMusicRecording"]["identifier"]
-
-    print(f"Importing recordings {recording.identifier} done.\n")
-
-    #####################################
-    # AUDIOOBJECTS
-    # Loop the audio objects to create the CE_AudioObject on the CE
-    #####################################
-    for audio in audio_objects:
+            obj.identifier = await lookupIdentifier(ce_type, obj.source)
 
-        audio.identifier = await lookupIdentifier("AudioObject", audio.source)
+        if obj.identifier is not None:
+            print(f"Updating {label} {obj.identifier} in Trompa CE\n")
+            response = await submit_query_async(mutation_update(**obj.as_dict()))
+            obj.identifier = response["data"][f"Update{ce_type}"]["identifier"]
+        else:
+            print(f"Inserting new {label} {obj.name} in Trompa CE\n")
+            response = await submit_query_async(mutation_create(**obj.as_dict()))
+            obj.identifier = response["data"][f"Create{ce_type}"]["identifier"]
+            created[key] = obj.identifier
 
-        if audio.identifier is not None:
-            print(f"Updating audio object {audio.identifier} in Trompa CE\n")
+    return obj.identifier
 
-            response = await ce.connection.submit_query_async(mutation_update_audioobject(**audio.as_dict()))
-            audio.identifier = response["data"]["UpdateAudioObject"]["identifier"]
-        else:
-            print("Inserting new audio {} in Trompa CE\n".format(audio.title))
 
-            response = await ce.connection.submit_query_async(mutation_create_audioobject(**audio.as_dict()))
-            audio.identifier = response["data"]["CreateAudioObject"]["identifier"]
+async def _link(query, message):
+    await submit_query_async(query)
+    print(message)
 
-    print(f"Importing audio {audio.identifier} done.\n")
 
-    #####################################
-    # Linking MUSICCOMPOSITIONS and MUSICRECORDING
-    # Loop the musicworks identifiers and link them to audioobjects
-    #####################################
-    query = mutation_merge_music_composition_recorded_as(work.identifier, recording.identifier)
-    response = await ce.connection.submit_query_async(query)
-    print(f"   - Linking MusicComposition {work.identifier} to MusicRecording {recording.identifier} done.")
+async def import_tracks(key: str, track_objects=None):
+    """
+    Imports audio fragments from Muziekweb for the key into the Trompa CE.
+    Objects and links that don't depend on each other are sent to the CE at the same time.
+    Arguments:
+        key: the track key
+        track_objects: the CE objects for this track from `get_mw_audio_tracks`. If not set,
+            they are retrieved from Muziekweb
+    """
+    if track_objects is None:
+        print(f"Retrieving release info with key {key} from Muziekweb")
+        # Get data from Muziekweb
+        track_objects = await asyncio.get_event_loop().run_in_executor(None, get_mw_audio_1track, key)
+    audio_objects, music_recordings, music_works, persons, music_groups = track_objects
 
-    #####################################
-    # Linking MUSICRECORDING and AUDIOOBJECTS
-    # Loop the musicworks identifiers and link them to audioobjects
-    #####################################
-    query = mutation_merge_music_recording_audio(recording.identifier, audio.identifier)
-    response = await ce.connection.submit_query_async(query)
-    print(f"   - Linking MusicRecording {recording.identifier} to AudioObject {audio.identifier} done.")
+    if audio_objects is None or len(audio_objects) == 0:
+        print(f"No track data received for {key}")
+        return
 
     #####################################
-    # PERSONS
-    # Loop the persons on all external links to add references for each CE_person
+    # MUSICCOMPOSITION, MUSICRECORDING, AUDIOOBJECTS, PERSONS and MUSIC GROUPS
+    # Look up all objects in one query, then create or update them on the CE
     #####################################
-    list_person_ids = list()
-    for person in persons:
-
-        person.identifier = await lookupIdentifier("Person", person.source)
-
-        if person.identifier is not None:
-            print(f"Updating person {person.identifier} in Trompa CE\n")
-
-            response = await ce.connection.submit_query_async(mutation_update_person(**person.as_dict()))
-            person.identifier = response["data"]["UpdatePerson"]["identifier"]
-            list_person_ids.append(person.identifier)
-        else:
-            print("Inserting new person {} in Trompa CE\n".format(person.name))
-
-            response = await ce.connection.submit_query_async(mutation_create_person(**person.as_dict()))
-
-            person.identifier = response["data"]["CreatePerson"]["identifier"]
-            list_person_ids.append(person.identifier)
-
+    objects = [(work, "MusicComposition", mutation_update_music_composition,
+                mutation_create_music_composition, "work") for work in music_works]
+    objects += [(recording, "MusicRecording", mutation_update_musicrecording,
+                 mutation_create_musicrecording, "music recording") for recording in music_recordings]
+    objects += [(audio, "AudioObject", mutation_update_audioobject,
+                 mutation_create_audioobject, "audio object") for audio in audio_objects]
+    objects += [(person, "Person", mutation_update_person,
+                 mutation_create_person, "person") for person in persons]
+    objects += [(music_group, "MusicGroup", mutation_update_musicgroup,
+                 mutation_create_musicgroup, "music group") for music_group in music_groups]
+    identifiers = await lookupIdentifiers([(ce_type, obj.source) for obj, ce_type, *_ in objects])
+    await asyncio.gather(*[_import_ce_object(*args, identifiers=identifiers) for args in objects])
+
+    work = music_works[-1]
+    recording = music_recordings[-1]
+    audio = audio_objects[-1]
+    list_person_ids = [person.identifier for person in persons]
+    list_music_group_ids = [music_group.identifier for music_group in music_groups]
+    print(f"Importing music composition {work.identifier}, recording {recording.identifier} "
+          f"and audio {audio.identifier} done.\n")
     if list_person_ids:
         print(f"Importing Persons for {key} done.")
+    if list_music_group_ids:
+        print(f"Importing Music Groups for {key} done.")
 
     #####################################
-    # Linking PERSONS
-    # Loop the person identifiers and link them
+    # Link all objects
     #####################################
+    links = [
+        _link(mutation_merge_music_composition_recorded_as(work.identifier, recording.identifier),
+              f"   - Linking MusicComposition {work.identifier} to MusicRecording {recording.identifier} done."),
+        _link(mutation_merge_music_recording_audio(recording.identifier, audio.identifier),
+              f"   - Linking MusicRecording {recording.identifier} to AudioObject {audio.identifier} done.")
+    ]
+
+    # Linking PERSONS
     if not music_groups:
         for from_id, to_id in itertools.permutations(list_person_ids, 2):
-            query = mutation_person_add_exact_match_person(from_id, to_id)
-            response = await ce.connection.submit_query_async(query)
-            print(f"   - Linking Person {from_id} to Person {to_id} done.")
+            links.append(_link(mutation_person_add_exact_match_person(from_id, to_id),
+                               f"   - Linking Person {from_id} to Person {to_id} done."))
 
-    #####################################
     # Linking PERSONS and MUSICCOMPOSITIONS
-    # Loop the person identifiers and link them to music compositions
-    #####################################
     for person_id in list_person_ids:
-        query = mutation_merge_music_composition_composer(work.identifier, person_id)
-        response = await ce.connection.submit_query_async(query)
-        print(f"   - Linking Person {person_id} to MusicComposition {work.identifier} done.\n")
+        links.append(_link(mutation_merge_music_composition_composer(work.identifier, person_id),
+                           f"   - Linking Person {person_id} to MusicComposition {work.identifier} done.\n"))
 
-    #####################################
-    # MUSIC GROUPS
-    # Loop the Music Groups on all external links to add references for each CE_person
-    #####################################
-    list_music_group_ids = list()
-    for music_group in music_groups:
-
-        music_group.identifier = await lookupIdentifier("MusicGroup", music_group.source)
-
-        if music_group.identifier is not None:
-            print(f"Updating music group {music_group.identifier} in Trompa CE\n")
-
-            response = await ce.connection.submit_query_async(mutation_update_musicgroup(**music_group.as_dict()))
-            music_group.identifier = response["data"]["UpdateMusicGroup"]["identifier"]
-            list_music_group_ids.append(music_group.identifier)
-        else:
-            print("Inserting new music group {} in Trompa CE\n".format(music_group.name))
-
-            response = await ce.connection.submit_query_async(mutation_create_musicgroup(**music_group.as_dict()))
-
-            music_group.identifier = response["data"]["CreateMusicGroup"]["identifier"]
-            list_music_group_ids.append(music_group.identifier)
-
-    if list_music_group_ids:
-        print(f"Importing Music Groups for {key} done.")
-
-    #####################################
     # Linking MUSIC GROUPS
-    # Loop the music groups identifiers and link them
-    #####################################
     for from_id, to_id in itertools.permutations(list_music_group_ids, 2):
-        query = mutation_musicgroup_add_exact_match_musicgroup(from_id, to_id)
-        response = await ce.connection.submit_query_async(query)
-        print(f"   - Linking Music Group {from_id} to Music Group {to_id} done.")
+        links.append(_link(mutation_musicgroup_add_exact_match_musicgroup(from_id, to_id),
+                           f"   - Linking Music Group {from_id} to Music Group {to_id} done."))
 
-    #####################################
     # Linking MUSIC GROUPS and MUSICCOMPOSITIONS
-    # Loop the music group identifiers and link them to music compositions
-    #####################################
     for music_group_id in list_music_group_ids:
-        query = mutation_merge_music_composition_composer(work.identifier, music_group_id)
-        response = await ce.connection.submit_query_async(query)
-        print(f"   - Linking MusicGroup {music_group_id} to MusicComposition {work.identifier} done.\n")
+        links.append(_link(mutation_merge_music_composition_composer(work.identifier, music_group_id),
+                           f"   - Linking MusicGroup {music_group_id} to MusicComposition {work.identifier} done.\n"))
 
-    #####################################
     # Linking MUSIC GROUPS and PERSONS
-    # Loop the music group identifiers and link them to person identifiers
-    #####################################
     for music_group_id in list_music_group_ids:
         for person_id in list_person_ids:
-            query = mutation_merge_musicgroup_member(person_id, music_group_id)
-            response = await ce.connection.submit_query_async(query)
-            print(f"   - Linking Person {person_id} to MusicGroup {music_group_id} done.\n")
+            links.append(_link(mutation_merge_musicgroup_member(person_id, music_group_id),
+                               f"   - Linking Person {person_id} to MusicGroup {music_group_id} done.\n"))
+
+    await asyncio.gather(*links)
+
+
+async def import_track_keys(keys: list, concurrency: int = 4):
+    """
+    Imports many tracks from Muziekweb into the Trompa CE, with up to `concurrency` tracks
+    being imported at the same time. Each album is only retrieved once, and each performer
+    is only looked up once.
+    """
+    loop = asyncio.get_event_loop()
+    # CE queries are run in the default executor, make sure that it has enough threads for all tracks
+    loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=concurrency * 4))
+    semaphore = asyncio.Semaphore(concurrency)
+    resolver = PerformerResolver()
+
+    async def import_track(track, track_objects):
+        async with semaphore:
+            await import_tracks(track, track_objects)
+        print('Import track {} COMPLETED'.format(track))
+        print('--------------------------------------\n')
+
+    tasks = []
+    for key_album, album_tracks in group_keys_by_album(keys).items():
+        print(f"Retrieving release info for album {key_album} from Muziekweb")
+        # Retrieve the next album while the tracks of the previous albums are being imported
+        album_track_objects = await loop.run_in_executor(None, get_mw_audio_tracks, key_album, album_tracks, resolver)
+        for track in album_tracks:
+            tasks.append(asyncio.ensure_future(import_track(track, album_track_objects[track])))
+    await asyncio.gather(*tasks)
 
 
 def get_mw_audio(key: str) -> [CE_AudioObject]:
     # Use the Muziekweb API to retrieve all the tracks on the album
-    doc = get_album_information(key)
+    tracks = get_album_information(key)
 
-    if doc is not None and doc.firstChild.tagName == "Result" and doc.firstChild.attributes['ErrorCode'].value == "0":
+    if tracks is not None:
 
         # Now extract the audio links from the Muziekweb data
         audio_objects = list()
 
-        for track in doc.getElementsByTagName('Track'):
-            trackId = track.getElementsByTagName('AlbumTrackID')[0].firstChild.data
+        for track in tracks:
+            trackId = track['track_id']
 
             audio_object = CE_AudioObject(
                 identifier=None,
@@ -241,7 +226,7 @@ def get_mw_audio(key: str) -> [CE_AudioObject]:
                 creator=GLOBAL_IMPORTER_REPO,
             )
 
-            audio_object.title = track.getElementsByTagName('TrackTitle')[0].firstChild.data
+            audio_object.title = track['title']
             audio_object.publisher = GLOBAL_PUBLISHER
             audio_object.description = 'Embed in frame using the following code: <iframe width="300" height="30" src="[url]" frameborder="no" scrolling="no" allowtransparency="true"></iframe>'
 
@@ -252,102 +237,292 @@ def get_mw_audio(key: str) -> [CE_AudioObject]:
     return None
 
 
+def group_keys_by_album(keys):
+    """Group track keys (e.g. JK136417-0003) by the album that they are on, keeping the order of the keys
+    Returns:
+        a dictionary of {album key: [track keys]}
+    """
+    albums = {}
+    for key in keys:
+        albums.setdefault(key.split('-')[0], []).append(key)
+    return albums
+
+
+class PerformerResolver:
+    """Resolve Muziekweb performers to CE_Person and CE_MusicGroup objects, remembering what was looked up
+    so that a performer who is on many tracks is only looked up once. Use one resolver for a whole import run.
+    """
+
+    def __init__(self):
+        # perf_link -> performer from get_artist_information
+        self._performers = {}
+        # perf_link -> MusicBrainz artist type
+        self._artist_types = {}
+        # perf_link -> result of load_external_links
+        self._external_links = {}
+
+    def get_performer(self, perf_link):
+        if perf_link not in self._performers:
+            self._performers[perf_link] = get_artist_information(perf_link)
+        return self._performers[perf_link]
+
+    def get_artist_type(self, perf_link):
+        """The MusicBrainz type (e.g. Person, Group) of a performer, if it has a MusicBrainz link"""
+        if perf_link not in self._artist_types:
+            artist_type = None
+            # provider -> link, the first link of each provider
+            links = dict(reversed(self.get_performer(perf_link)['external_links']))
+            if 'MUSICBRAINZ' in links:
+                mbid = links['MUSICBRAINZ'].split('/')[-1]
+                artist = musicbrainz.get_artist_from_musicbrainz(mbid)
+                artist_type = artist.get('type', None)
+            self._artist_types[perf_link] = artist_type
+        return self._artist_types[perf_link]
+
+    def get_external_links(self, perf_link, unif_style, kind):
+        """The external links of a performer with their data, see `load_external_links`.
+        They are only loaded for the first track of the performer"""
+        if perf_link not in self._external_links:
+            mw_artist = self.get_performer(perf_link)
+            self._external_links[perf_link] = load_external_links(mw_artist, mw_artist['name'], perf_link,
+                                                                  unif_style, kind)
+        return [(prov_name, ext_link, _with_unif_style(prov_name, ext_link, ppl, perf_link, unif_style))
+                for prov_name, ext_link, ppl in self._external_links[perf_link]]
+
+    def resolve(self, perf_link, unif_style):
+        """Get the persons and music groups for a performer.
+        Returns:
+            a tuple (persons, music_groups). These are new objects, so they can be changed by the caller
+        """
+        mw_artist = self.get_performer(perf_link)
+        perf_name = mw_artist['name']
+        perf_text = perf_name.replace(' ', '-')
+        persons = list()
+        music_groups = list()
+        if self.get_artist_type(perf_link) == 'Group':
+            external_links = self.get_external_links(perf_link, unif_style, 'music group')
+            music_groups, persons = get_music_group_information(mw_artist, music_groups, persons, perf_name, perf_link, perf_text, unif_style,
+                                                                external_links)
+        else:
+            external_links = self.get_external_links(perf_link, unif_style, 'person')
+            persons = get_person_information(mw_artist, persons, perf_name, perf_link, perf_text, unif_style,
+                                             external_links)
+        return persons, music_groups
+
+
+def get_mw_audio_tracks(key_album: str, keys: list, resolver: PerformerResolver = None):
+    """Retrieve an album once and build the CE objects for each of the tracks in `keys`
+    Arguments:
+        key_album: the album key
+        keys: the track keys
+        resolver: the performer resolver of this import run. If not set, performers are only
+            remembered for this album
+    Returns:
+        a dictionary of {track key: (audio_objects, music_recordings, music_works, persons, music_groups)}.
+        All values of the tuple are None for keys which aren't on the album
+    """
+    tracks = get_album_information(key_album)
+
+    if resolver is None:
+        resolver = PerformerResolver()
+    wanted = set(keys)
+    objects = {}
+    if tracks is not None:
+        for track in tracks:
+            if track['track_id'] in wanted and track['track_id'] not in objects:
+                track_objects = get_mw_track_objects(track, resolver)
+                if track_objects is not None:
+                    objects[track['track_id']] = track_objects
+
+    return {key: objects.get(key, (None, None, None, None, None)) for key in keys}
+
+
 def get_mw_audio_1track(key: str) -> [CE_AudioObject]:
     # Use the Muziekweb API to retrieve one track
 
     key_album = key.split('-')[0]
 
-    doc = get_album_information(key_album)
+    return get_mw_audio_tracks(key_album, [key])[key]
 
-    if doc is not None and doc.firstChild.tagName == "Result" and doc.firstChild.attributes['ErrorCode'].value == "0":
 
-        # Now extract the audio links from the Muziekweb data
-        audio_objects = list()
-        music_recordings = list()
-        music_works = list()
-        persons = list()
-        music_groups = list()
+def get_mw_track_objects(track, resolver: PerformerResolver):
+    """Build the CE objects for a track from `get_album_information`, or None if the track
+    doesn't have a uniform title, catalogue or performer"""
+    missing = [field for field in TRACK_FIELDS if not track.get(field)]
+    if missing:
+        print(f"Skipping track {track['track_id']}, it has no {', '.join(missing)}")
+        return None
+
+    audio_objects = list()
+    music_recordings = list()
+    music_works = list()
+
+    trackId = track['track_id']
+
+    track_name = track['title']
+    # append audio object
+    audio_object = CE_AudioObject(
+        identifier=None,
+        name=track_name,
+        url=MW_AUDIO_URL.format(trackId),
+        contributor=GLOBAL_CONTRIBUTOR,
+        creator=GLOBAL_IMPORTER_REPO,
+    )
 
-        for track in doc.getElementsByTagName('Track'):
-
-            trackId = track.getElementsByTagName('AlbumTrackID')[0].firstChild.data
-
-            if trackId == key:
-                track_name = track.getElementsByTagName('TrackTitle')[0].firstChild.data
-                # append audio object
-                audio_object = CE_AudioObject(
-                    identifier=None,
-                    name=track_name,
-                    url=MW_AUDIO_URL.format(trackId),
-                    contributor=GLOBAL_CONTRIBUTOR,
-                    creator=GLOBAL_IMPORTER_REPO,
-                )
-
-                audio_object.title = "Muziekweb - de muziekbibliotheek van Nederland"
-                audio_object.publisher = GLOBAL_PUBLISHER
-                audio_object.description = 'Embed in frame using the following code: <iframe width="300" height="30" src="[url]" frameborder="no" scrolling="no" allowtransparency="true"></iframe>'
-
-                audio_objects.append(audio_object)
-
-                # append music recording object
-                music_recording = CE_MusicRecording(
-                    identifier=None,
-                    name=track_name,
-                    url=MW_AUDIO_URL.format(trackId),
-                    contributor=GLOBAL_CONTRIBUTOR,
-                    creator=GLOBAL_IMPORTER_REPO,
-                )
-
-                music_recording.title = "Muziekweb - de muziekbibliotheek van Nederland"
-                music_recording.publisher = GLOBAL_PUBLISHER
-                music_recording.description = 'Embed in frame using the following code: <iframe width="300" height="30" src="[url]" frameborder="no" scrolling="no" allowtransparency="true"></iframe>'
-
-                music_recordings.append(music_recording)
-
-                # append musicwork
-                unif_title = track.getElementsByTagName('UniformTitle')[0].attributes['Link'].value
-                unif_text = track.getElementsByTagName('UniformTitle')[0].firstChild.data.replace(' ', '-')
-                unif_style = track.getElementsByTagName('Catalogue')[0].firstChild.data.split(' ')[0]
-
-                music_work = CE_MusicComposition(
-                    identifier=None,
-                    name=track_name,
-                    url=MW_MUSIC_URL.format(unif_title, unif_style, unif_text),
-                    contributor=GLOBAL_CONTRIBUTOR,
-                    creator=GLOBAL_IMPORTER_REPO,
-                )
-
-                music_work.title = 'Muziekweb - de muziekbibliotheek van Nederland'
-                music_work.contributor = GLOBAL_CONTRIBUTOR
-                music_work.source = MW_MUSIC_URL.format(unif_title, unif_style, unif_text)
-                music_works.append(music_work)
-                # append persons
-                perf_link = track.getElementsByTagName('Performer')[0].attributes['Link'].value
-                doc_artist = get_artist_information(perf_link)
-                num_ext_links = int(doc_artist.getElementsByTagName('ExternalLinks')[0].attributes['Count'].value)
-                perf_name = doc_artist.getElementsByTagName('PresentationName')[0].firstChild.data
-                perf_text = perf_name.replace(' ', '-')
-                # check if person or musicgroup
-                prov_names = [doc_artist.getElementsByTagName('ExternalLink')[pers].attributes['Provider'].value for pers in range(num_ext_links)]
-                artist_type = None
-                if 'MUSICBRAINZ' in prov_names:
-                    ext_link = doc_artist.getElementsByTagName('ExternalLinks')[0].getElementsByTagName('Link')[prov_names.index('MUSICBRAINZ')].firstChild.data
-                    mbid = ext_link.split('/')[-1]
-                    artist = musicbrainz.get_artist_from_musicbrainz(mbid)
-                    artist_type = artist.get('type', None)
-
-                if artist_type == 'Group':
-                    music_groups, persons = get_music_group_information(doc_artist, music_groups, persons, num_ext_links, perf_name, perf_link, perf_text, unif_style)
-                else:
-                    persons = get_person_information(doc_artist, persons, num_ext_links, perf_name, perf_link, perf_text, unif_style)
-
-        return audio_objects, music_recordings, music_works, persons, music_groups
-
-    return None, None, None, None, None
-
-
-def get_person_information(doc_artist, persons, num_ext_links, perf_name, perf_link, perf_text, unif_style):
+    audio_object.title = "Muziekweb - de muziekbibliotheek van Nederland"
+    audio_object.publisher = GLOBAL_PUBLISHER
+    audio_object.description = 'Embed in frame using the following code: <iframe width="300" height="30" src="[url]" frameborder="no" scrolling="no" allowtransparency="true"></iframe>'
+
+    audio_objects.append(audio_object)
+
+    # append music recording object
+    music_recording = CE_MusicRecording(
+        identifier=None,
+        name=track_name,
+        url=MW_AUDIO_URL.format(trackId),
+        contributor=GLOBAL_CONTRIBUTOR,
+        creator=GLOBAL_IMPORTER_REPO,
+    )
+
+    music_recording.title = "Muziekweb - de muziekbibliotheek van Nederland"
+    music_recording.publisher = GLOBAL_PUBLISHER
+    music_recording.description = 'Embed in frame using the following code: <iframe width="300" height="30" src="[url]" frameborder="no" scrolling="no" allowtransparency="true"></iframe>'
+
+    music_recordings.append(music_recording)
+
+    # append musicwork
+    unif_title = track['uniform_title_link']
+    unif_text = track['uniform_title'].replace(' ', '-')
+    unif_style = track['catalogue'].split(' ')[0]
+
+    music_work = CE_MusicComposition(
+        identifier=None,
+        name=track_name,
+        url=MW_MUSIC_URL.format(unif_title, unif_style, unif_text),
+        contributor=GLOBAL_CONTRIBUTOR,
+        creator=GLOBAL_IMPORTER_REPO,
+    )
+
+    music_work.title = 'Muziekweb - de muziekbibliotheek van Nederland'
+    music_work.contributor = GLOBAL_CONTRIBUTOR
+    music_work.source = MW_MUSIC_URL.format(unif_title, unif_style, unif_text)
+    music_works.append(music_work)
+    # append persons
+    perf_link = track['performer_link']
+    persons, music_groups = resolver.resolve(perf_link, unif_style)
+
+    return audio_objects, music_recordings, music_works, persons, music_groups
+
+
+# Providers which we only link to, with the contributor to use for them
+LINKED_PROVIDERS = {
+    'ALLMUSIC': 'https://www.allmusic.com/',
+    'DISCOGS': 'https://www.discogs.com/',
+    'LASTFM': 'https://www.last.fm/',
+}
+
+
+def _external_link_lookup(prov_name, ext_link, perf_link, unif_style):
+    """The (host, function, args) lookup to load the data of an external link of a performer,
+    or None if we don't load data for this provider"""
+    if prov_name == 'ISNI':
+        return 'isni.org', load_person_from_isni, (MW_MUSIC_URL.format(perf_link, unif_style, ext_link), )
+    elif prov_name == 'VIAF':
+        return 'viaf.org', load_person_from_viaf, (ext_link, )
+    elif prov_name == 'MUSICBRAINZ':
+        return 'musicbrainz.org', musicbrainz.load_artist_from_musicbrainz, (ext_link.split('/')[-1], )
+    elif prov_name == 'WIKIDATA':
+        return 'wikidata.org', load_person_from_wikidata_url, (ext_link, )
+    elif prov_name == 'WIKIPEDIA_EN':
+        return 'en.wikipedia.org', load_person_from_wikipedia_url, ('https://en.wikipedia.org/wiki/{}'.format(ext_link), 'en')
+    elif prov_name == 'WIKIPEDIA_NL':
+        return 'nl.wikipedia.org', load_person_from_wikipedia_url, ('https://nl.wikipedia.org/wiki/{}'.format(ext_link), 'nl')
+    return None
+
+
+def _with_unif_style(prov_name, ext_link, ppl, perf_link, unif_style):
+    """The data of an external link for a track with the catalogue style `unif_style`. The ISNI data is
+    read from a Muziekweb link with the style of a track in it, and that link is its source"""
+    if prov_name == 'ISNI' and ppl:
+        return dict(ppl, source=MW_MUSIC_URL.format(perf_link, unif_style, ext_link))
+    return ppl
+
+
+def load_external_links(mw_artist, perf_name, perf_link, unif_style, kind):
+    """Load the data of all external links of a performer. Links to different sites are loaded
+    at the same time, links to the same site one after the other.
+    Returns:
+        a list of (provider, link, data) tuples, data is None for providers that we only link to
     """
+    links = []
+    lookups = []
+    for prov_name, ext_link in mw_artist['external_links']:
+        print('Searching for {}: {} - {}'.format(kind, perf_name, prov_name))
+        lookup = _external_link_lookup(prov_name, ext_link, perf_link, unif_style)
+        if lookup is not None:
+            links.append((prov_name, ext_link, len(lookups)))
+            lookups.append(lookup)
+        else:
+            links.append((prov_name, ext_link, None))
+
+    results = run_lookups_by_host(lookups)
+    return [(prov_name, ext_link, results[index] if index is not None else None)
+            for prov_name, ext_link, index in links]
+
+
+def _ce_object_from_external_link(ce_class, prov_name, ext_link, ppl, perf_name):
+    """Make a CE_Person or CE_MusicGroup for an external link, except MusicBrainz.
+    Returns None if there is no data for the link"""
+    if prov_name in ('ISNI', 'VIAF', 'WIKIDATA', 'WIKIPEDIA_EN', 'WIKIPEDIA_NL'):
+        if not ppl:
+            return None
+        ce_object = ce_class(
+            identifier=None,
+            name=ppl['name'] if prov_name.startswith('WIKIPEDIA') else ppl['title'],
+            url=ppl['source'],
+            contributor=ppl['contributor'],
+            creator=GLOBAL_IMPORTER_REPO,
+            title=ppl['title'],
+            source=ppl['source'],
+        )
+        if prov_name in ('WIKIDATA', 'WIKIPEDIA_EN', 'WIKIPEDIA_NL'):
+            ce_object.description = ppl['description']
+        return ce_object
+    elif prov_name in LINKED_PROVIDERS:
+        return ce_class(
+            identifier=None,
+            name='{} - {}'.format(perf_name, prov_name),
+            url=ext_link,
+            contributor=LINKED_PROVIDERS[prov_name],
+            creator=GLOBAL_IMPORTER_REPO,
+            title='{} - {}'.format(perf_name, prov_name),
+            source=ext_link,
+        )
+    return None
+
+
+def _ce_person_from_musicbrainz(ppl):
+    person = CE_Person(
+        identifier=None,
+        name=ppl['title'],
+        url=ppl['source'],
+        contributor=ppl['contributor'],
+        creator=GLOBAL_IMPORTER_REPO,
+        title=ppl['title'],
+        source=ppl['source'],
+    )
+    person.birthPlace = ppl['birthplace']
+    person.birthDate = ppl['birth_date']
+    person.deathPlace = ppl['deathplace']
+    person.deathDate = ppl['death_date']
+    return person
+
+
+def get_person_information(mw_artist, persons, perf_name, perf_link, perf_text, unif_style, external_links=None):
+    """
+    Arguments:
+        mw_artist: the performer from `get_artist_information`
+        external_links: the result of `load_external_links` for the performer, they are loaded if not set
     """
     # MW person
     person = CE_Person(
@@ -362,121 +537,27 @@ def get_person_information(doc_artist, persons, num_ext_links, perf_name, perf_l
     persons.append(person)
 
     # external links
-    for pers in range(num_ext_links):
-
-        prov_name = doc_artist.getElementsByTagName('ExternalLink')[pers].attributes['Provider'].value
-        print('Searching for person: {} - {}'.format(perf_name, prov_name))
-        ext_link = doc_artist.getElementsByTagName('ExternalLinks')[0].getElementsByTagName('Link')[
-            pers].firstChild.data
-        if prov_name == 'ISNI':
-            ext_link = MW_MUSIC_URL.format(perf_link, unif_style, ext_link)
-            ppl = load_person_from_isni(ext_link)
-            person = CE_Person(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-        elif prov_name == 'VIAF':
-            ppl = load_person_from_viaf(ext_link)
-            person = CE_Person(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-        elif prov_name == 'MUSICBRAINZ':
-            mbid = ext_link.split('/')[-1]
-            ppls = musicbrainz.load_artist_from_musicbrainz(mbid)
-            for ppl in ppls:
-                person = CE_Person(
-                    identifier=None,
-                    name=ppl['title'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                person.birthPlace = ppl['birthplace']
-                person.birthDate = ppl['birth_date']
-                person.deathPlace = ppl['deathplace']
-                person.deathDate = ppl['death_date']
-                persons.append(person)
-
-        elif prov_name == 'WIKIDATA':
-            ppl = load_person_from_wikidata_url(ext_link)
-            person = CE_Person(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-            person.description = ppl['description']
-        elif prov_name == 'WIKIPEDIA_EN':
-            en_wiki_link = 'https://en.wikipedia.org/wiki/{}'.format(ext_link)
-            ppl = load_person_from_wikipedia_url(en_wiki_link, 'en')
-            if ppl:
-                person = CE_Person(
-                    identifier=None,
-                    name=ppl['name'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                person.description = ppl['description']
-
-        elif prov_name == 'WIKIPEDIA_NL':
-            nl_wiki_link = 'https://nl.wikipedia.org/wiki/{}'.format(ext_link)
-            ppl = load_person_from_wikipedia_url(nl_wiki_link, 'nl')
-            if ppl:
-                person = CE_Person(
-                    identifier=None,
-                    name=ppl['name'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                person.description = ppl['description']
+    if external_links is None:
+        external_links = load_external_links(mw_artist, perf_name, perf_link, unif_style, 'person')
+    for prov_name, ext_link, ppl in external_links:
+        if prov_name == 'MUSICBRAINZ':
+            for mb_ppl in ppl:
+                persons.append(_ce_person_from_musicbrainz(mb_ppl))
         else:
-            if prov_name == 'ALLMUSIC':
-                contributor = 'https://www.allmusic.com/'
-            elif prov_name == 'DISCOGS':
-                contributor = 'https://www.discogs.com/'
-            elif prov_name == 'LASTFM':
-                contributor = 'https://www.last.fm/'
-            else:
+            person = _ce_object_from_external_link(CE_Person, prov_name, ext_link, ppl, perf_name)
+            if person is None:
                 continue
-
-            person = CE_Person(
-                identifier=None,
-                name='{} - {}'.format(perf_name, prov_name),
-                url=ext_link,
-                contributor=contributor,
-                creator=GLOBAL_IMPORTER_REPO,
-                title='{} - {}'.format(perf_name, prov_name),
-                source=ext_link,
-            )
-        persons.append(person)
+            persons.append(person)
         print('External link: {}'.format(ext_link))
     return persons
 
 
-def get_music_group_information(doc_artist, music_groups, persons, num_ext_links, perf_name, perf_link, perf_text, unif_style):
+def get_music_group_information(mw_artist, music_groups, persons, perf_name, perf_link, perf_text, unif_style,
+                                external_links=None):
     """
+    Arguments:
+        mw_artist: the performer from `get_artist_information`
+        external_links: the result of `load_external_links` for the performer, they are loaded if not set
     """
     # MW Music Group
     music_group = CE_MusicGroup(
@@ -491,39 +572,12 @@ def get_music_group_information(doc_artist, music_groups, persons, num_ext_links
     music_groups.append(music_group)
 
     # external links
-    for pers in range(num_ext_links):
-        prov_name = doc_artist.getElementsByTagName('ExternalLink')[pers].attributes['Provider'].value
-        print('Searching for music group: {} - {}'.format(perf_name, prov_name))
-        ext_link = doc_artist.getElementsByTagName('ExternalLinks')[0].getElementsByTagName('Link')[
-            pers].firstChild.data
-        if prov_name == 'ISNI':
-            ext_link = MW_MUSIC_URL.format(perf_link, unif_style, ext_link)
-            ppl = load_person_from_isni(ext_link)
-            music_group = CE_MusicGroup(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-        elif prov_name == 'VIAF':
-            ppl = load_person_from_viaf(ext_link)
-            music_group = CE_MusicGroup(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-        elif prov_name == 'MUSICBRAINZ':
-            mbid = ext_link.split('/')[-1]
-
-            ppls = musicbrainz.load_artist_from_musicbrainz(mbid)
-            ppl = ppls[0]
+    if external_links is None:
+        external_links = load_external_links(mw_artist, perf_name, perf_link, unif_style, 'music group')
+    for prov_name, ext_link, ppl in external_links:
+        if prov_name == 'MUSICBRAINZ':
+            # The first artist is the group, the others are its members
+            ppl, members = ppl[0], ppl[1:]
             music_group = CE_MusicGroup(
                 identifier=None,
                 name=ppl['title'],
@@ -533,83 +587,12 @@ def get_music_group_information(doc_artist, music_groups, persons, num_ext_links
                 title=ppl['title'],
                 source=ppl['source'],
             )
-
-            for ppl in ppls[1:]:
-                person = CE_Person(
-                    identifier=None,
-                    name=ppl['title'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                person.birthPlace = ppl['birthplace']
-                person.birthDate = ppl['birth_date']
-                person.deathPlace = ppl['deathplace']
-                person.deathDate = ppl['death_date']
-                persons.append(person)
-
-        elif prov_name == 'WIKIDATA':
-            ppl = load_person_from_wikidata_url(ext_link)
-            music_group = CE_MusicGroup(
-                identifier=None,
-                name=ppl['title'],
-                url=ppl['source'],
-                contributor=ppl['contributor'],
-                creator=GLOBAL_IMPORTER_REPO,
-                title=ppl['title'],
-                source=ppl['source'],
-            )
-            music_group.description = ppl['description']
-        elif prov_name == 'WIKIPEDIA_EN':
-            en_wiki_link = 'https://en.wikipedia.org/wiki/{}'.format(ext_link)
-            ppl = load_person_from_wikipedia_url(en_wiki_link, 'en')
-            if ppl:
-                music_group = CE_MusicGroup(
-                    identifier=None,
-                    name=ppl['name'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                music_group.description = ppl['description']
-
-        elif prov_name == 'WIKIPEDIA_NL':
-            nl_wiki_link = 'https://nl.wikipedia.org/wiki/{}'.format(ext_link)
-            ppl = load_person_from_wikipedia_url(nl_wiki_link, 'nl')
-            if ppl:
-                music_group = CE_MusicGroup(
-                    identifier=None,
-                    name=ppl['name'],
-                    url=ppl['source'],
-                    contributor=ppl['contributor'],
-                    creator=GLOBAL_IMPORTER_REPO,
-                    title=ppl['title'],
-                    source=ppl['source'],
-                )
-                music_group.description = ppl['description']
+            for member in members:
+                persons.append(_ce_person_from_musicbrainz(member))
         else:
-            if prov_name == 'ALLMUSIC':
-                contributor = 'https://www.allmusic.com/'
-            elif prov_name == 'DISCOGS':
-                contributor = 'https://www.discogs.com/'
-            elif prov_name == 'LASTFM':
-                contributor = 'https://www.last.fm/'
-            else:
+            music_group = _ce_object_from_external_link(CE_MusicGroup, prov_name, ext_link, ppl, perf_name)
+            if music_group is None:
                 continue
-
-            music_group = CE_MusicGroup(
-                identifier=None,
-                name='{} - {}'.format(perf_name, prov_name),
-                url=ext_link,
-                contributor=contributor,
-                creator=GLOBAL_IMPORTER_REPO,
-                title='{} - {}'.format(perf_name, prov_name),
-                source=ext_link,
-            )
         music_groups.append(music_group)
         print('External link: {}'.format(ext_link))
 
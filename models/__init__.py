@@ -1,23 +1,42 @@
 """
 Data models as described by the Trompa CE and Schema.org definitions.
 """
-# Import sdo items before ce items to prevent circular import issues
-from .sdo_thing import Thing
-from .sdo_organization import Organization
-from .sdo_person import Person
-from .sdo_place import Place
-from .sdo_creative_work import CreativeWork
-from .sdo_media_object import MediaObject
-from .sdo_audio_object import AudioObject
-from .sdo_music_recording import MusicRecording
-from .sdo_music_playlist import MusicPlaylist
-from .sdo_music_album import MusicAlbum
-from .sdo_music_group import MusicGroup
+import importlib
 
-from .ce_base import CE_BaseModel
-from .ce_audio_object import CE_AudioObject
-from .ce_music_album import CE_MusicAlbum
-from .ce_person import CE_Person
-from .ce_music_composition import CE_MusicComposition
-from .ce_music_group import CE_MusicGroup
-from .ce_music_recording import CE_MusicRecording
+# The module that defines each model. Models are imported the first time that they are used
+# (PEP 562), so that importing one model doesn't import all of them
+_MODEL_MODULES = {
+    "Thing": "sdo_thing",
+    "Organization": "sdo_organization",
+    "Person": "sdo_person",
+    "Place": "sdo_place",
+    "CreativeWork": "sdo_creative_work",
+    "MediaObject": "sdo_media_object",
+    "AudioObject": "sdo_audio_object",
+    "MusicRecording": "sdo_music_recording",
+    "MusicPlaylist": "sdo_music_playlist",
+    "MusicAlbum": "sdo_music_album",
+    "MusicGroup": "sdo_music_group",
+
+    "CE_BaseModel": "ce_base",
+    "CE_AudioObject": "ce_audio_object",
+    "CE_MusicAlbum": "ce_music_album",
+    "CE_Person": "ce_person",
+    "CE_MusicComposition": "ce_music_composition",
+    "CE_MusicGroup": "ce_music_group",
+    "CE_MusicRecording": "ce_music_recording",
+}
+
+__all__ = list(_MODEL_MODULES)
+
+
+def __getattr__(name):
+    if name not in _MODEL_MODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    model = getattr(importlib.import_module(f".{_MODEL_MODULES[name]}", __name__), name)
+    globals()[name] = model
+    return model
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,69 +1,165 @@
 """
 Basic use of the Muziekweb REST API.
+
+All requests go through one pooled, cached session. Responses are parsed with `iterparse`
+and only the fields that the importers use are kept.
 """
-import urllib.request
-from xml.dom import minidom
+import io
+import xml.etree.ElementTree as ET
+
+import requests_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from muziekweb_api.dump import MuziekwebDump
 
 """
 Constants for Muziekweb API
 """
 MW_API_HOST = "http://api.cdr.nl:8080"
+# Seconds to wait for a connection and for a response
+MW_API_TIMEOUT = (10, 60)
 
 _api_activated = False
+# If set, albums and performers are read from a local linked-data dump instead of the API
+_dump = None
+
+session = requests_cache.CachedSession()
+adapter = HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.5, status_forcelist=[500, 502, 503, 504]),
+                      pool_maxsize=10)
+session.mount("https://", adapter)
+session.mount("http://", adapter)
 
 
 def set_api_account(user, password):
     global _api_activated
 
-    passman = urllib.request.HTTPPasswordMgrWithDefaultRealm()
-    passman.add_password(None, MW_API_HOST, user, password)
-    authhandler = urllib.request.HTTPBasicAuthHandler(passman)
-    opener = urllib.request.build_opener(authhandler)
-    urllib.request.install_opener(opener)
+    session.auth = (user, password)
 
     _api_activated = True
 
 
+def use_dump(path):
+    """Read albums and performers from a Muziekweb linked-data dump (see `muziekweb_api.dump`)"""
+    global _dump
+
+    _dump = MuziekwebDump(path)
+
+
+def _get(path, params):
+    """Make a request to the Muziekweb API and return the body, or None if it's empty"""
+    r = session.get(f"{MW_API_HOST}{path}", params=params, timeout=MW_API_TIMEOUT)
+    r.raise_for_status()
+    if len(r.content) > 0:
+        return r.content
+    return None
+
+
+def parse_album_information(body):
+    """Parse the result of albumInformation.xml
+    Returns:
+        None if the result has an error, otherwise a list of tracks, each a dictionary with keys
+        track_id, title, uniform_title, uniform_title_link, catalogue and performer_link
+        (the values of the first element of each type in the track)
+    """
+    root = None
+    tracks = []
+    track = None
+    for event, elem in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+                if elem.tag != "Result" or elem.get("ErrorCode") != "0":
+                    return None
+            elif elem.tag == "Track":
+                track = {}
+            continue
+
+        if track is None:
+            continue
+        if elem.tag == "AlbumTrackID":
+            track.setdefault("track_id", elem.text)
+        elif elem.tag == "TrackTitle":
+            track.setdefault("title", elem.text)
+        elif elem.tag == "UniformTitle":
+            track.setdefault("uniform_title", elem.text)
+            track.setdefault("uniform_title_link", elem.get("Link"))
+        elif elem.tag == "Catalogue":
+            track.setdefault("catalogue", elem.text)
+        elif elem.tag == "Performer":
+            track.setdefault("performer_link", elem.get("Link"))
+        elif elem.tag == "Track":
+            tracks.append(track)
+            track = None
+            root.clear()
+
+    return tracks
+
+
+def parse_artist_information(body):
+    """Parse the result of performerInfo.xml
+    Returns:
+        a dictionary with the performer's `name` (PresentationName) and `external_links`, a list
+        of (provider, link) tuples
+    """
+    name = None
+    providers = []
+    links = []
+    in_external_links = False
+    for event, elem in ET.iterparse(io.BytesIO(body), events=("start", "end")):
+        if event == "start":
+            if elem.tag == "ExternalLinks":
+                in_external_links = True
+            continue
+
+        if elem.tag == "PresentationName" and name is None:
+            name = elem.text
+        elif elem.tag == "ExternalLink":
+            providers.append(elem.get("Provider"))
+        elif elem.tag == "Link" and in_external_links:
+            links.append(elem.text)
+        elif elem.tag == "ExternalLinks":
+            in_external_links = False
+
+    return {"name": name, "external_links": list(zip(providers, links))}
+
+
 def get_album_information(key: str):
-    # global _api_activated
+    """Get the tracks of an album, see `parse_album_information`"""
+    if _dump is not None:
+        return _dump.get_album_information(key)
 
     if _api_activated:
         # Use the Muziekweb API to retrieve all the tracks on the album
-        response = urllib.request.urlopen(f"{MW_API_HOST}/v2/search/albumInformation.xml?albumID={key}")
-        body = response.read()
+        body = _get("/v2/search/albumInformation.xml", {"albumID": key})
 
-        if len(body) > 0:
-            # Return the xml as object
-            return minidom.parseString(body)
+        if body is not None:
+            return parse_album_information(body)
 
     return None
 
 
 def get_track_information(key: str):
-    # global _api_activated
+    """Search for a track. Returns the root element of the result"""
 
     if _api_activated:
-        # Use the Muziekweb API to retrieve all the tracks on the album
-        response = urllib.request.urlopen(f"{MW_API_HOST}/singlesearch/singleSearch.xml?q={key}")
-        body = response.read()
+        body = _get("/singlesearch/singleSearch.xml", {"q": key})
 
-        if len(body) > 0:
-            # Return the xml as object
-            return minidom.parseString(body)
+        if body is not None:
+            return ET.fromstring(body)
 
     return None
 
 
 def get_artist_information(key: str):
-    # global _api_activated
+    """Get information about a performer, see `parse_artist_information`"""
+    if _dump is not None:
+        return _dump.get_artist_information(key)
 
     if _api_activated:
-        # Use the Muziekweb API to retrieve all the tracks on the album
-        response = urllib.request.urlopen(f"{MW_API_HOST}/ExtendedInfo/v3/performerInfo.xml?performerLink={key}")
-        body = response.read()
+        body = _get("/ExtendedInfo/v3/performerInfo.xml", {"performerLink": key})
 
-        if len(body) > 0:
-            # Return the xml as object
-            return minidom.parseString(body)
+        if body is not None:
+            return parse_artist_information(body)
 
     return None
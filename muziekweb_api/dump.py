@@ -0,0 +1,211 @@
+"""
+Read Muziekweb albums, tracks and performers from a local linked-data dump instead of the REST API.
+
+The dump can be N-Triples or Turtle, optionally gzipped. The first time that a dump is used we
+store the triples that we need in an index next to it (dump path + .index.sqlite). Only N-Triples
+are read as a stream, one triple at a time. A Turtle dump is loaded into an rdflib graph in memory
+to build the index, so convert large dumps to N-Triples first (e.g. with `riot --output=nt`).
+
+The predicates that we read for each field (`PREDICATES`) are based on the schema.org terms of
+the Muziekweb linked data, they haven't been checked against a full dump. Building the index
+warns about fields that no triple in the dump has a predicate for; pass `predicates` to
+`MuziekwebDump` to use other predicates.
+
+`get_album_information` and `get_artist_information` return the same structures as the functions
+with the same name in `muziekweb_api`, so the importers make the same CE objects from a dump.
+"""
+import gzip
+import threading
+from urllib.parse import unquote, urlparse
+
+import rdflib
+
+try:
+    from rdflib.plugins.parsers.ntriples import W3CNTriplesParser as NTriplesParser
+except ImportError:
+    # rdflib < 6
+    from rdflib.plugins.parsers.ntriples import NTriplesParser
+
+from ceimport import logger, open_sqlite_index
+
+MW_LINK_URL = "https://data.muziekweb.nl/Link/{}"
+
+SCHEMA = "http://schema.org/"
+VOCAB = "https://data.muziekweb.nl/vocab/"
+RDFS_LABEL = "http://www.w3.org/2000/01/rdf-schema#label"
+
+# The predicates that we read for each field, in order of preference
+PREDICATES = {
+    "title": [SCHEMA + "name", RDFS_LABEL],
+    "in_album": [SCHEMA + "inAlbum"],
+    "recording_of": [SCHEMA + "recordingOf"],
+    "performer": [SCHEMA + "byArtist", VOCAB + "performer"],
+    "catalogue": [VOCAB + "catalogue", SCHEMA + "genre"],
+    "same_as": [SCHEMA + "sameAs"],
+}
+
+# Hosts of external links, and the Muziekweb API provider name for them
+PROVIDERS = {
+    "isni.org": "ISNI",
+    "viaf.org": "VIAF",
+    "musicbrainz.org": "MUSICBRAINZ",
+    "www.wikidata.org": "WIKIDATA",
+    "wikidata.org": "WIKIDATA",
+    "en.wikipedia.org": "WIKIPEDIA_EN",
+    "nl.wikipedia.org": "WIKIPEDIA_NL",
+    "www.allmusic.com": "ALLMUSIC",
+    "www.discogs.com": "DISCOGS",
+    "www.last.fm": "LASTFM",
+}
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS triples (
+    subject TEXT,
+    predicate TEXT,
+    object TEXT
+);
+CREATE INDEX IF NOT EXISTS triples_subject ON triples (subject, predicate);
+CREATE INDEX IF NOT EXISTS triples_object ON triples (predicate, object);
+"""
+
+
+def key_from_link(link):
+    return link.rstrip("/").rsplit("/", 1)[-1]
+
+
+def external_link(url):
+    """Convert a sameAs url to a (provider, link) tuple in the format of the Muziekweb API, or None
+    if it's not a provider that the importers know"""
+    parts = urlparse(url)
+    provider = PROVIDERS.get(parts.netloc)
+    if provider is None:
+        return None
+    if provider in ("WIKIPEDIA_EN", "WIKIPEDIA_NL"):
+        # The API only gives the title of the page
+        return provider, unquote(parts.path[len("/wiki/"):])
+    if provider == "ISNI":
+        return provider, key_from_link(parts.path)
+    return provider, url
+
+
+class _IndexSink:
+    """Receives triples from the N-Triples parser and stores those with one of `predicates`"""
+
+    def __init__(self, conn, predicates):
+        self.conn = conn
+        self.predicates = predicates
+        self.rows = []
+        self.count = 0
+
+    def triple(self, s, p, o):
+        if str(p) not in self.predicates:
+            return
+        self.rows.append((str(s), str(p), str(o)))
+        if len(self.rows) == 10000:
+            self.flush()
+
+    def flush(self):
+        self.conn.executemany("INSERT INTO triples (subject, predicate, object) VALUES (?, ?, ?)", self.rows)
+        self.count += len(self.rows)
+        self.rows = []
+        logger.info("Indexed %s triples", self.count)
+
+
+class MuziekwebDump:
+
+    def __init__(self, path, index_path=None, predicates=None):
+        """
+        Arguments:
+            predicates: {field: [predicate, ...]} for fields which use other predicates than in `PREDICATES`
+        """
+        self.path = path
+        self.index_path = index_path or path + ".index.sqlite"
+        self.predicates = dict(PREDICATES, **(predicates or {}))
+        self._lock = threading.Lock()
+        self._connection = None
+
+    def _get_connection(self):
+        with self._lock:
+            if self._connection is None:
+                self._connection = open_sqlite_index(self.index_path, INDEX_SCHEMA, self._build_index)
+            return self._connection
+
+    def _open(self):
+        if self.path.endswith(".gz"):
+            return gzip.open(self.path, "rt", encoding="utf-8")
+        return open(self.path, "rt", encoding="utf-8")
+
+    def _build_index(self, conn):
+        logger.info("Indexing Muziekweb dump %s", self.path)
+        sink = _IndexSink(conn, {p for predicates in self.predicates.values() for p in predicates})
+        with self._open() as fp:
+            name = self.path[:-3] if self.path.endswith(".gz") else self.path
+            if name.endswith(".nt"):
+                NTriplesParser(sink).parse(fp)
+            else:
+                logger.warning("Loading Turtle dump %s into memory, use N-Triples to read it as a stream", self.path)
+                graph = rdflib.Graph()
+                graph.parse(fp, format="turtle")
+                for s, p, o in graph:
+                    sink.triple(s, p, o)
+            sink.flush()
+        found = {r[0] for r in conn.execute("SELECT DISTINCT predicate FROM triples")}
+        for field, predicates in self.predicates.items():
+            if not found.intersection(predicates):
+                logger.warning("No triples in the dump for %s, expected one of the predicates %s",
+                               field, ", ".join(predicates))
+
+    def build_index(self):
+        """Build the index of this dump if it doesn't exist yet"""
+        self._get_connection()
+
+    def _objects(self, subject, field):
+        """All values of `field` for `subject`, using the first predicate of the field that has values"""
+        conn = self._get_connection()
+        with self._lock:
+            for predicate in self.predicates[field]:
+                rows = conn.execute("SELECT object FROM triples WHERE subject = ? AND predicate = ? ORDER BY rowid",
+                                    (subject, predicate)).fetchall()
+                if rows:
+                    return [r[0] for r in rows]
+        return []
+
+    def _first(self, subject, field):
+        values = self._objects(subject, field)
+        return values[0] if values else None
+
+    def _subjects(self, field, obj):
+        conn = self._get_connection()
+        with self._lock:
+            rows = conn.execute("SELECT DISTINCT subject FROM triples WHERE object = ? AND predicate IN ({})".format(
+                ", ".join("?" for _ in self.predicates[field])), [obj] + self.predicates[field]).fetchall()
+        return [r[0] for r in rows]
+
+    def get_album_information(self, key):
+        """The tracks of an album, in the same format as `muziekweb_api.get_album_information`,
+        or None if the album isn't in the dump"""
+        tracks = []
+        for track_url in sorted(self._subjects("in_album", MW_LINK_URL.format(key))):
+            track = {"track_id": key_from_link(track_url), "title": self._first(track_url, "title")}
+            uniform_title = self._first(track_url, "recording_of")
+            if uniform_title:
+                track["uniform_title_link"] = key_from_link(uniform_title)
+                track["uniform_title"] = self._first(uniform_title, "title")
+            catalogue = self._first(track_url, "catalogue") or self._first(MW_LINK_URL.format(key), "catalogue")
+            if catalogue:
+                track["catalogue"] = catalogue
+            performer = self._first(track_url, "performer")
+            if performer:
+                track["performer_link"] = key_from_link(performer)
+            tracks.append(track)
+        return tracks or None
+
+    def get_artist_information(self, key):
+        """A performer, in the same format as `muziekweb_api.get_artist_information`,
+        or None if the performer isn't in the dump"""
+        url = MW_LINK_URL.format(key)
+        name = self._first(url, "title")
+        if name is None:
+            return None
+        links = [external_link(link) for link in self._objects(url, "same_as")]
+        return {"name": name, "external_links": [link for link in links if link is not None]}
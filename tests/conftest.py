@@ -0,0 +1,11 @@
+import os
+
+import pytest
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+@pytest.fixture(autouse=True)
+def _working_directory(tmp_path, monkeypatch):
+    # The site modules make a requests_cache http_cache.sqlite in the working directory
+    monkeypatch.chdir(tmp_path)
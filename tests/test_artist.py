@@ -0,0 +1,109 @@
+import asyncio
+import os
+import threading
+
+from tests.conftest import FIXTURES
+
+CSV_RESPONSE = os.path.join(FIXTURES, "muziekweb-artists.csv")
+
+
+class StubEndpoint:
+    """Stands in for the SPARQLWrapper of the Muziekweb endpoint, and answers every query with the same CSV"""
+
+    def __init__(self):
+        self.queries = []
+        self.threads = []
+        self.responses = []
+
+    def setQuery(self, query):
+        self.queries.append(query)
+
+    def setReturnFormat(self, return_format):
+        assert return_format == "csv"
+
+    def query(self):
+        self.threads.append(threading.current_thread())
+        result = Result(open(CSV_RESPONSE, "rb"))
+        self.responses.append(result.response)
+        return result
+
+
+class Result:
+    def __init__(self, response):
+        self.response = response
+
+
+def test_get_mw_artists_in_batches():
+    from importers import artist
+
+    endpoint = StubEndpoint()
+    artists = artist.get_mw_artists(["M00000001", "M00000002", "M00000003"], endpoint=endpoint, batch_size=2)
+
+    assert len(endpoint.queries) == 2
+    assert "<https://data.muziekweb.nl/Link/M00000001> <https://data.muziekweb.nl/Link/M00000002>" in endpoint.queries[0]
+    assert all(response.closed for response in endpoint.responses)
+    assert sorted(artists) == ["M00000001", "M00000002"]
+    bach = artists["M00000001"]
+    assert bach.name == "Johann Sebastian Bach"
+    assert bach.source == "https://data.muziekweb.nl/Link/M00000001"
+    assert bach.title == "Johann Sebastian Bach - Muziekweb"
+    assert (bach.birthDate, bach.deathDate) == ("1685", "1750")
+
+
+def test_import_artist(monkeypatch):
+    from importers import artist
+
+    endpoint = StubEndpoint()
+    mutations = []
+
+    async def lookupIdentifier(data_type, source):
+        return "existing-id" if source.endswith("M00000002") else None
+
+    async def submit_query_async(query):
+        mutations.append(query)
+        if "UpdatePerson" in query:
+            return {"data": {"UpdatePerson": {"identifier": "existing-id"}}}
+        return {"data": {"CreatePerson": {"identifier": "new-id"}}}
+
+    monkeypatch.setattr(artist, "get_sparql_endpoint", lambda: endpoint)
+    monkeypatch.setattr(artist, "lookupIdentifier", lookupIdentifier)
+    monkeypatch.setattr(artist, "submit_query_async", submit_query_async)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(artist.import_artist(["M00000001", "M00000002", "M00000009"]))
+    finally:
+        loop.close()
+
+    # The SPARQL query ran outside of the event loop's thread
+    assert endpoint.threads and threading.main_thread() not in endpoint.threads
+    assert len(mutations) == 2
+    assert "CreatePerson" in mutations[0] and "Johann Sebastian Bach" in mutations[0]
+    assert "UpdatePerson" in mutations[1] and "existing-id" in mutations[1]
+
+
+ARTISTS_TURTLE = """
+@prefix vocab: <https://data.muziekweb.nl/vocab/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+<https://data.muziekweb.nl/Link/M00000001> vocab:beginYear "1685" ; vocab:endYear "1750" ;
+    rdfs:label "Johann Sebastian Bach" .
+<https://data.muziekweb.nl/Link/M00000002> vocab:beginYear "1770" ; vocab:endYear "1827" ;
+    rdfs:label "Ludwig van Beethoven" .
+<https://data.muziekweb.nl/Link/M00000003> rdfs:label "Without dates" .
+"""
+
+
+def test_get_mw_artists_from_graph():
+    from rdflib import Graph
+    from importers import artist
+
+    graph = Graph()
+    graph.parse(data=ARTISTS_TURTLE, format="turtle")
+    rows = list(artist.run_sparql_query(graph, artist.build_artists_query(["M00000001"])))
+    assert rows == [{"url": "https://data.muziekweb.nl/Link/M00000001", "name": "Johann Sebastian Bach",
+                     "birthYear": "1685", "deathYear": "1750"}]
+
+    artists = artist.get_mw_artists(["M00000001", "M00000002", "M00000003"], endpoint=graph, batch_size=2)
+    assert sorted(artists) == ["M00000001", "M00000002"]
+    assert artists["M00000002"].name == "Ludwig van Beethoven"
+    assert (artists["M00000002"].birthDate, artists["M00000002"].deathDate) == ("1770", "1827")
@@ -0,0 +1,32 @@
+PERFORMER = {"name": "Jan Smit", "external_links": [("ISNI", "0000000123"), ("DISCOGS", "https://www.discogs.com/artist/1")]}
+
+
+def test_performer_looked_up_once(monkeypatch):
+    from importers import audio_object
+
+    calls = []
+
+    def get_artist_information(perf_link):
+        calls.append(("artist", perf_link))
+        return PERFORMER
+
+    def run_lookups_by_host(lookups):
+        calls.append(("lookups", [args for _, _, args in lookups]))
+        return [{"title": "Jan Smit", "contributor": "https://isni.org", "source": lookups[0][2][0],
+                 "format_": "text/html"}]
+
+    monkeypatch.setattr(audio_object, "get_artist_information", get_artist_information)
+    monkeypatch.setattr(audio_object, "run_lookups_by_host", run_lookups_by_host)
+
+    resolver = audio_object.PerformerResolver()
+    classical, _ = resolver.resolve("M00000123", "Klassiek")
+    pop, _ = resolver.resolve("M00000123", "Pop")
+
+    assert calls == [("artist", "M00000123"),
+                     ("lookups", [("https://www.muziekweb.nl/en/Link/M00000123/Klassiek/0000000123", )])]
+    assert [p.source for p in classical] == ["https://www.muziekweb.nl/en/Link/M00000123/Klassiek/Jan-Smit",
+                                             "https://www.muziekweb.nl/en/Link/M00000123/Klassiek/0000000123",
+                                             "https://www.discogs.com/artist/1"]
+    assert [p.source for p in pop] == ["https://www.muziekweb.nl/en/Link/M00000123/Pop/Jan-Smit",
+                                       "https://www.muziekweb.nl/en/Link/M00000123/Pop/0000000123",
+                                       "https://www.discogs.com/artist/1"]
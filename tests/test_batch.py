@@ -0,0 +1,83 @@
+import datetime
+
+import pytest
+from trompace.exceptions import NotAMimeTypeException, UnsupportedLanguageException
+from trompace.mutations import mediaobject as mutation_mediaobject
+
+from ceimport.batch import MediaObjectBatch, PersonBatch
+
+MEDIAOBJECT = {"title": "Ave Maria (xml)", "contributor": "https://cpdl.org", "creator": "https://example.com",
+               "source": "https://cpdl.org/wiki/images/a/a1/Ave.xml", "format_": "text/html",
+               "encodingformat": "application/xml", "contenturl": "https://cpdl.org/wiki/images/a/a1/Ave.xml",
+               "name": "Ave Maria", "language": "en"}
+
+
+def test_mutation_is_the_same_as_trompace():
+    batch = MediaObjectBatch.from_rows([MEDIAOBJECT, dict(MEDIAOBJECT, source="https://cpdl.org/other.xml")])
+    documents = list(batch.mutations())
+
+    assert [indexes for _, indexes in documents] == [[0, 1]]
+    single = mutation_mediaobject.mutation_create_media_object(**MEDIAOBJECT)
+    # The aliased mutation e0 has the same arguments as the trompace mutation
+    assert single.split("CreateMediaObject")[1].split("identifier")[0] in documents[0][0]
+
+
+def test_columns_and_constants():
+    batch = PersonBatch.from_columns(title=["Bach", "Byrd"], source=["https://a", "https://b"],
+                                     birth_date=[datetime.date(1685, 3, 31), "1540"],
+                                     contributor="https://cpdl.org", creator="https://example.com",
+                                     format_="text/html", language="EN")
+    rows = batch.variables()
+
+    assert set(rows[0]) == {"title", "contributor", "creator", "source", "format", "language", "birthDate"}
+    assert rows[0]["birthDate"] == {"year": 1685, "month": 3, "day": 31}
+    assert rows[1]["birthDate"] == {"year": 1540}
+    assert rows[1]["language"] == "en"
+    assert batch.select([1]).rows() == [{"title": "Byrd", "source": "https://b", "birth_date": "1540",
+                                         "contributor": "https://cpdl.org", "creator": "https://example.com",
+                                         "format_": "text/html", "language": "EN"}]
+
+    with pytest.raises(ValueError):
+        PersonBatch.from_columns(title=["Bach"], source=["https://a", "https://b"])
+
+
+def test_validate_raises_trompace_exceptions():
+    with pytest.raises(UnsupportedLanguageException):
+        MediaObjectBatch.from_rows([dict(MEDIAOBJECT, language="xx")]).validate()
+    with pytest.raises(NotAMimeTypeException):
+        MediaObjectBatch.from_rows([dict(MEDIAOBJECT, encodingformat="xml")]).validate()
+    with pytest.raises(ValueError, match="required argument 'title'"):
+        MediaObjectBatch.from_rows([dict(MEDIAOBJECT, title=None)]).validate()
+    with pytest.raises(ValueError, match="gender"):
+        PersonBatch.from_rows([{"title": "Bach", "contributor": "c", "creator": "c", "source": "s",
+                                "format_": "text/html", "gender": "x"}]).validate()
+    with pytest.raises(ValueError, match="not an argument"):
+        MediaObjectBatch.from_rows([dict(MEDIAOBJECT, birth_date="1685")], strict=True)
+
+
+def test_get_or_create_batch(monkeypatch):
+    from ceimport import connection, loader
+
+    lookups = []
+    created = []
+
+    def lookup_by_source(pairs):
+        lookups.append(pairs)
+        return {"data": {f"q{i}": [{"identifier": "existing"}] if source.endswith("Ave.xml") else []
+                         for i, (_, source) in enumerate(pairs)}}
+
+    def create_batch(batch):
+        created.extend(batch.column("source"))
+        return [f"new-{i}" for i in range(len(batch))]
+
+    monkeypatch.setattr(connection, "lookup_by_source", lookup_by_source)
+    monkeypatch.setattr(loader, "create_batch", create_batch)
+
+    pdf = dict(MEDIAOBJECT, source="https://cpdl.org/a.pdf")
+    rows = [MEDIAOBJECT, pdf, pdf]
+    identifiers = loader.get_or_create_batch(MediaObjectBatch.from_rows(rows))
+
+    # All sources are looked up in one request, and each missing source is created once
+    assert lookups == [[("MediaObject", MEDIAOBJECT["source"]), ("MediaObject", "https://cpdl.org/a.pdf")]]
+    assert created == ["https://cpdl.org/a.pdf"]
+    assert identifiers == ["existing", "new-0", "new-0"]
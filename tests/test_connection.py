@@ -0,0 +1,82 @@
+import pytest
+
+from ceimport import connection
+
+SCHEMA = {
+    "data": {
+        "__schema": {
+            "queryType": {"fields": [
+                {"name": "Person", "args": [
+                    {"name": "source", "type": {"kind": "SCALAR", "name": "String", "ofType": None}},
+                ]},
+            ]},
+            "mutationType": {"fields": [
+                {"name": "CreatePerson", "args": [
+                    {"name": "title", "type": {"kind": "NON_NULL", "name": None,
+                                               "ofType": {"kind": "SCALAR", "name": "String", "ofType": None}}},
+                    {"name": "gender", "type": {"kind": "ENUM", "name": "GenderType", "ofType": None}},
+                    {"name": "birthDate", "type": {"kind": "INPUT_OBJECT", "name": "_Neo4jDateInput",
+                                                   "ofType": None}},
+                ]},
+            ]},
+        }
+    }
+}
+
+
+@pytest.fixture
+def schema(monkeypatch):
+    monkeypatch.setattr(connection, "_argument_types", None)
+    monkeypatch.setattr(connection, "execute", lambda operation, variables=None, auth_required=True: SCHEMA)
+    yield
+    connection.query_operation.cache_clear()
+    connection.lookup_operation.cache_clear()
+    connection.create_operation.cache_clear()
+
+
+def test_types_from_schema(schema):
+    operation = connection.create_operation("CreatePerson", ("title", "gender", "birthDate"), 2)
+    assert operation.document.startswith(
+        "mutation CreatePerson2($title0: String!, $gender0: GenderType, $birthDate0: _Neo4jDateInput, "
+        "$title1: String!, $gender1: GenderType, $birthDate1: _Neo4jDateInput) {")
+    assert "e1: CreatePerson(title: $title1, gender: $gender1, birthDate: $birthDate1)" in operation.document
+
+    operation = connection.lookup_operation(("Person", "Person"))
+    assert operation.document.startswith("query LookupBySource($s0: String, $s1: String) {")
+
+
+def test_unknown_arguments(schema):
+    assert connection.create_operation("CreatePerson", ("title", "language")) is None
+    assert connection.create_operation("CreatePlace", ("title", )) is None
+    assert connection.query_operation("MusicComposition", "source") is None
+
+
+def test_schema_not_readable(monkeypatch):
+    def fail(operation, variables=None, auth_required=True):
+        raise connection.trompace_exceptions.QueryException([{"message": "introspection is disabled"}])
+    monkeypatch.setattr(connection, "_argument_types", None)
+    monkeypatch.setattr(connection, "execute", fail)
+    assert connection.get_argument_types("Mutation", "CreatePerson") is None
+
+
+def test_create_many_fixed_sizes(schema, monkeypatch):
+    requests = []
+
+    def execute(operation, variables=None, auth_required=True):
+        if operation.name == "RootFieldArguments":
+            return SCHEMA
+        requests.append((operation, variables))
+        count = len([v for v in variables if v.startswith("title")])
+        return {"data": {f"e{n}": {"identifier": f"{len(requests)}-{n}"} for n in range(count)}}
+
+    monkeypatch.setattr(connection, "execute", execute)
+    rows = [{"title": f"Person {i}"} for i in range(53)]
+    rows[52]["gender"] = "female"
+    identifiers = connection.create_many("CreatePerson", ("title", "gender", "birthDate"), rows)
+
+    # 50 + 2 + 1, and the same document for every request of the same size
+    assert [operation.name for operation, _ in requests] == ["CreatePerson50", "CreatePerson2", "CreatePerson1"]
+    assert requests[2][1] == {"title0": "Person 52", "gender0": "female"}
+    assert identifiers[49:] == ["1-49", "2-0", "2-1", "3-0"]
+    assert connection.create_many("CreatePerson", ("title", "gender", "birthDate"), rows[:1])
+    assert requests[-1][0] is requests[2][0]
@@ -0,0 +1,58 @@
+import requests
+
+
+class Response:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"query": {"pages": self.pages}}
+
+
+def page(title):
+    return {"title": title, "revisions": [{"slots": {"main": {"content": f"{{{{Composer|{title}}}}}"}}}]}
+
+
+def test_fill_wikitext_pool_per_title_after_failed_batch(monkeypatch):
+    from ceimport.sites import cpdl
+
+    requested = []
+
+    def get(url, params):
+        titles = params["titles"].split("|")
+        requested.append(titles)
+        if len(titles) > 1 or titles == ["Unreachable"]:
+            raise requests.exceptions.ConnectionError("connection reset")
+        if titles == ["Missing page"]:
+            return Response([{"title": "Missing page", "missing": True}])
+        return Response([page(titles[0])])
+
+    monkeypatch.setattr(cpdl, "dump", None)
+    monkeypatch.setattr(cpdl.session, "get", get)
+    pool = cpdl.fill_wikitext_pool({}, ["William_Byrd", "Missing page", "Unreachable"])
+
+    assert requested == [["William Byrd", "Missing page", "Unreachable"],
+                         ["William Byrd"], ["Missing page"], ["Unreachable"]]
+    assert pool["William Byrd"]["content"] == "{{Composer|William Byrd}}"
+    # Doesn't exist, so it isn't requested again
+    assert pool["Missing page"] is None
+    # Failed, so it's requested again the next time
+    assert "Unreachable" not in pool
+
+
+def test_fill_composer_pool_skips_composers_in_the_ce(monkeypatch):
+    from ceimport import connection, loader
+
+    def lookup_by_source(pairs):
+        return {"data": {f"q{i}": [{"identifier": "byrd-id"}] if source.endswith("William_Byrd") else []
+                         for i, (_, source) in enumerate(pairs)}}
+
+    filled = []
+    monkeypatch.setattr(connection, "lookup_by_source", lookup_by_source)
+    monkeypatch.setattr(loader.cpdl, "fill_wikitext_pool", lambda pool, titles: filled.extend(titles) or pool)
+
+    loader.fill_cpdl_composer_pool({"Thomas Tallis": None}, ["William Byrd", "Thomas Tallis", "Orlando Gibbons"])
+    assert filled == ["Orlando Gibbons"]
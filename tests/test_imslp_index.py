@@ -0,0 +1,175 @@
+import json
+import os
+
+import pytest
+
+from tests.conftest import FIXTURES
+
+WORKLIST = os.path.join(FIXTURES, "imslp-worklist-people.json")
+BYRD = os.path.join(FIXTURES, "imslp-api-byrd.json")
+
+
+class Response:
+    def __init__(self, path):
+        with open(path) as fp:
+            self.data = json.load(fp)
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class DataResponse(Response):
+    def __init__(self, data):
+        self.data = data
+
+
+@pytest.fixture
+def imslp(monkeypatch):
+    from ceimport.sites import imslp, imslp_index
+    monkeypatch.delenv("CEIMPORT_IMSLP_INDEX", raising=False)
+    monkeypatch.setattr(imslp_index, "_connection", None)
+    monkeypatch.setattr(imslp_index, "_path", None)
+    monkeypatch.setattr(imslp, "_people_from_api", set())
+    queries = []
+
+    def imslp_api_raw_query(page_name):
+        queries.append(page_name)
+        return Response(BYRD).json() if page_name.replace("_", " ") == "Category:Byrd, William" else {}
+
+    monkeypatch.setattr(imslp, "imslp_api_raw_query", imslp_api_raw_query)
+    imslp.queries = queries
+    yield imslp
+    if imslp_index._connection is not None:
+        imslp_index._connection.close()
+
+
+def test_worklist_people_without_details_are_loaded_from_the_api(imslp, monkeypatch, tmp_path):
+    imslp.use_index(str(tmp_path / "index.sqlite"))
+    monkeypatch.setattr(imslp.session, "get", lambda url: Response(WORKLIST))
+    imslp.update_people_index()
+
+    composer = imslp.get_composer("Category:Byrd,_William")
+    assert imslp.queries == ["Category:Byrd,_William"]
+    assert composer["name"] == "William Byrd"
+    assert (composer["birth_date"], composer["death_date"]) == (None, "1623-07-04")
+    assert imslp.api_composer_get_relations("Category:Byrd, William") == {
+        "viaf": "https://viaf.org/viaf/100218681",
+        "musicbrainz": "de3f8b44-6d04-4ba9-a2a3-d4dbff8d7ebf",
+        "wikipedia": "https://en.wikipedia.org/wiki/William_Byrd",
+    }
+    # Now complete in the index
+    assert len(imslp.queries) == 1
+
+    # Updating the index again doesn't lose what was loaded from the api
+    imslp.update_people_index(full=True)
+    imslp._people_from_api.clear()
+    assert imslp.get_composer("Category:Byrd, William")["death_date"] == "1623-07-04"
+    assert len(imslp.queries) == 1
+
+    # Not on the api either: the indexed row is used, and the api is only asked once
+    assert imslp.get_composer("Category:Tallis, Thomas")["name"] == "Thomas Tallis"
+    assert imslp.get_composer("Category:Tallis, Thomas")["name"] == "Thomas Tallis"
+    assert imslp.queries[1:] == ["Category:Tallis, Thomas"]
+
+
+def test_no_index_is_created_by_lookups(imslp, tmp_path):
+    composer = imslp.get_composer("Category:Byrd, William")
+    assert composer["birth_date"] is None and composer["death_date"] == "1623-07-04"
+    assert imslp.get_composer("Category:Nobody") is None
+    assert not os.path.exists(tmp_path / "imslp-index.sqlite")
+
+
+def worklist_page(start, count):
+    return {**{str(i): {"id": f"Work {start + i} (Byrd, William)", "parent": "Category:Byrd, William",
+                        "intvals": {"pageid": start + i}} for i in range(count)},
+            "metadata": {"moreresultsavailable": count == 1000}}
+
+
+def test_update_work_index_continues_after_the_last_work(imslp, monkeypatch, tmp_path):
+    imslp.use_index(str(tmp_path / "index.sqlite"))
+    pages = {0: worklist_page(0, 1000), 1000: worklist_page(1000, 400), 1400: worklist_page(1400, 2)}
+    requested = []
+
+    def get(url):
+        start = int(url.split("/start=")[1].split("/")[0])
+        requested.append(start)
+        return DataResponse(pages.get(start, {"metadata": {"moreresultsavailable": False}}))
+
+    monkeypatch.setattr(imslp.session, "get", get)
+    imslp.update_work_index()
+    assert requested == [0, 1000]
+    imslp.update_work_index()
+    assert requested == [0, 1000, 1400]
+    assert imslp.imslp_index.get_composer_for_work("Work 1401 (Byrd, William)") == "Category:Byrd, William"
+    imslp.update_work_index()
+    assert requested[3:] == [1402]
+
+
+WORK_WIKITEXT = """{{#fte:imslppage
+| *****FILES***** =
+{{#fte:imslpfile
+|File Name 1=PMLP1-Ave_verum.pdf
+}}
+| *****WORK INFO*****
+|Work Title=Ave verum corpus
+|Alternative Title=
+|Language=Latin
+}}"""
+
+
+def test_api_work_uses_the_index(imslp, monkeypatch, tmp_path):
+    imslp.use_index(str(tmp_path / "index.sqlite"))
+    imslp.imslp_index.store_works([{"id": "Ave verum corpus (Byrd, William)", "parent": "Category:Byrd, William",
+                                    "intvals": {"pageid": 1}}])
+    monkeypatch.setattr(imslp, "get_page_metadata", lambda url: {"title": "Ave verum corpus (Byrd, William) - IMSLP"})
+    monkeypatch.setattr(imslp, "get_wiki_content_for_pages", lambda pages: [{"content": WORK_WIKITEXT}])
+
+    work = imslp.api_work("Ave_verum_corpus_(Byrd,_William)")
+    assert imslp.queries == []
+    assert work["composer"] == "Category:Byrd, William"
+    assert work["work"]["name"] == "Ave verum corpus"
+    assert work["work"]["title"] == "Ave verum corpus (Byrd, William) - IMSLP"
+
+    # Not in the index, the api is asked
+    imslp.api_work("Ave Maria (Byrd, William)")
+    assert imslp.queries == ["Ave Maria (Byrd, William)"]
+
+
+class StreamedPage:
+    """A page whose <head> ends with a </HEAD> tag that is split between two chunks"""
+    url = "https://imslp.org/wiki/Ave_verum_corpus_(Byrd,_William)"
+    encoding = "utf-8"
+
+    def __init__(self):
+        self.read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        chunks = [b"<html><HEAD><title>Ave verum corpus (Byrd, William) - IMSLP</title>",
+                  b'<link rel="canonical" href="https://imslp.org/wiki/Ave_verum_corpus"></HE',
+                  b"AD><body>", b"never read"]
+        for chunk in chunks:
+            self.read += 1
+            yield chunk
+
+
+def test_page_metadata_reads_up_to_the_end_of_head(imslp, monkeypatch):
+    page = StreamedPage()
+    monkeypatch.setattr(imslp.head_session, "get", lambda url, headers, stream: page)
+    monkeypatch.setattr(imslp, "_page_metadata", {})
+
+    metadata = imslp.get_page_metadata("https://imslp.org/wiki/Ave_verum_corpus_(Byrd,_William)")
+    assert page.read == 3
+    assert metadata["title"] == "Ave verum corpus (Byrd, William) - IMSLP"
+    assert metadata["meta"] == {"canonical": "https://imslp.org/wiki/Ave_verum_corpus"}
@@ -0,0 +1,35 @@
+import sys
+import threading
+
+from ceimport import lazy_import
+
+SLOW_MODULE = """
+import time
+RUNS.append(1)
+time.sleep(0.2)
+VALUE = 42
+"""
+
+
+def test_first_use_in_threads(tmp_path, monkeypatch):
+    (tmp_path / "slow_lazy_module.py").write_text("from tests.test_lazy_import import RUNS\n" + SLOW_MODULE)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.delitem(sys.modules, "slow_lazy_module", raising=False)
+
+    module = lazy_import("slow_lazy_module")
+    assert RUNS == []
+    values = []
+    threads = [threading.Thread(target=lambda: values.append(module.VALUE)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert values == [42] * 8
+    assert RUNS == [1]
+    import slow_lazy_module
+    assert slow_lazy_module.VALUE == 42
+    sys.modules.pop("slow_lazy_module")
+
+
+RUNS = []
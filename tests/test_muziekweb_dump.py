@@ -0,0 +1,78 @@
+import gzip
+import logging
+import os
+import shutil
+
+import pytest
+import rdflib
+
+from tests.conftest import FIXTURES
+
+
+def MuziekwebDump(*args, **kwargs):
+    # Imported here, so that the http cache of muziekweb_api is made in the temporary working directory
+    from muziekweb_api.dump import MuziekwebDump
+    return MuziekwebDump(*args, **kwargs)
+
+
+@pytest.fixture
+def dump_path(tmp_path):
+    path = str(tmp_path / "muziekweb.nt")
+    shutil.copy(os.path.join(FIXTURES, "muziekweb.nt"), path)
+    return path
+
+
+def test_get_album_information(dump_path):
+    tracks = MuziekwebDump(dump_path).get_album_information("JK100001")
+    assert tracks == [
+        {"track_id": "JK100001-0001", "title": "Eine kleine Nachtmusik: Allegro",
+         "uniform_title_link": "AAAA1234", "uniform_title": "Eine kleine Nachtmusik",
+         "catalogue": "KLASSIEK Orkestmuziek", "performer_link": "M00000123"},
+        {"track_id": "JK100001-0002", "title": "Eine kleine Nachtmusik: Romanze",
+         "uniform_title_link": "AAAA1234", "uniform_title": "Eine kleine Nachtmusik",
+         "catalogue": "KLASSIEK Orkestmuziek"},
+    ]
+    assert MuziekwebDump(dump_path).get_album_information("JK999999") is None
+
+
+def test_get_artist_information(dump_path):
+    artist = MuziekwebDump(dump_path).get_artist_information("M00000123")
+    assert artist["name"] == "Academy of St Martin in the Fields"
+    assert sorted(artist["external_links"]) == [
+        ("MUSICBRAINZ", "https://musicbrainz.org/artist/3d5fc8f7-3ae3-4e2e-8a71-6c1b3c18fb8c"),
+        ("WIKIPEDIA_EN", "Academy_of_St_Martin_in_the_Fields"),
+    ]
+
+
+def test_turtle_and_gzip(dump_path, tmp_path):
+    graph = rdflib.Graph()
+    graph.parse(dump_path, format="nt")
+    ttl_path = str(tmp_path / "muziekweb.ttl.gz")
+    with gzip.open(ttl_path, "wb") as fp:
+        turtle = graph.serialize(format="turtle")
+        # rdflib < 6 returns bytes
+        fp.write(turtle.encode("utf-8") if isinstance(turtle, str) else turtle)
+    assert MuziekwebDump(ttl_path).get_album_information("JK100001") == \
+        MuziekwebDump(dump_path).get_album_information("JK100001")
+
+
+def test_unknown_predicates_are_reported(dump_path, caplog):
+    with caplog.at_level(logging.WARNING, logger="ceimport"):
+        dump = MuziekwebDump(dump_path, predicates={"performer": ["https://example.com/performer"]})
+        dump.build_index()
+    assert "No triples in the dump for performer" in caplog.text
+    assert "performer_link" not in dump.get_album_information("JK100001")[0]
+
+
+def test_tracks_without_performer_are_skipped(dump_path, monkeypatch):
+    import muziekweb_api
+    from importers import audio_object
+
+    class Resolver:
+        def resolve(self, perf_link, unif_style):
+            return [], []
+
+    monkeypatch.setattr(muziekweb_api, "_dump", MuziekwebDump(dump_path))
+    objects = audio_object.get_mw_audio_tracks("JK100001", ["JK100001-0001", "JK100001-0002"], Resolver())
+    assert objects["JK100001-0001"][0][0].name == "Eine kleine Nachtmusik: Allegro"
+    assert objects["JK100001-0002"] == (None, None, None, None, None)
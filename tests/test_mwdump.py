@@ -0,0 +1,73 @@
+import bz2
+import os
+import shutil
+
+import pytest
+
+from ceimport.sites import mwdump
+from tests.conftest import FIXTURES
+
+
+@pytest.fixture
+def dump_path(tmp_path):
+    path = str(tmp_path / "cpdl-pages-articles.xml")
+    shutil.copy(os.path.join(FIXTURES, "cpdl-pages-articles.xml"), path)
+    return path
+
+
+def test_get_pages(dump_path):
+    dump = mwdump.MediaWikiDump(dump_path)
+    pages = dump.get_pages(["William_Byrd", "Ave verum corpus (William Byrd)", "Not in the dump"])
+    assert [p["title"] for p in pages] == ["Ave verum corpus (William Byrd)", "William Byrd"]
+    assert "{{XML}}" in pages[0]["content"]
+    assert os.path.exists(dump_path + ".index.sqlite")
+
+
+def test_titles_in_category(dump_path):
+    dump = mwdump.MediaWikiDump(dump_path)
+    assert dump.titles_in_category("Category:Sheet music") == ["Ave verum corpus (William Byrd)",
+                                                               "Sing joyfully (William Byrd)"]
+    assert dump.titles_in_category("Motets") == ["Ave verum corpus (William Byrd)"]
+    # Only pages in the main namespace
+    assert dump.titles_in_category("Templates") == []
+
+
+def test_compressed_dump(dump_path):
+    bz2_path = dump_path + ".bz2"
+    with open(dump_path, "rb") as fp, bz2.open(bz2_path, "wb") as out:
+        out.write(fp.read())
+    dump = mwdump.MediaWikiDump(bz2_path)
+    assert [p["title"] for p in dump.get_pages(["Sing joyfully (William Byrd)"])] == ["Sing joyfully (William Byrd)"]
+    assert len(list(dump.iter_pages())) == 4
+
+
+def test_interrupted_index_is_rebuilt(dump_path, monkeypatch):
+    parse_page = mwdump.parse_page
+
+    def fail(fragment):
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(mwdump, "parse_page", fail)
+    with pytest.raises(KeyboardInterrupt):
+        mwdump.MediaWikiDump(dump_path).build_index()
+    assert not os.path.exists(dump_path + ".index.sqlite")
+
+    monkeypatch.setattr(mwdump, "parse_page", parse_page)
+    assert len(mwdump.MediaWikiDump(dump_path).page_titles()) == 4
+
+
+def test_cpdl_works_with_xml(dump_path, monkeypatch):
+    # Imported here, so that its http cache is made in the temporary working directory
+    from ceimport.sites import cpdl
+    monkeypatch.setattr(cpdl, "dump", mwdump.MediaWikiDump(dump_path))
+    pages = cpdl.get_wiki_content_for_pages(cpdl.get_titles_in_category("Sheet music"))
+    assert [p["title"] for p in cpdl.get_works_with_xml(pages)] == ["Ave verum corpus (William Byrd)"]
+
+
+def test_imslp_category_not_in_dump_uses_api(dump_path, monkeypatch):
+    from ceimport.sites import imslp
+    monkeypatch.setattr(imslp.mediawiki, "MediaWiki", lambda **kwargs: None)
+    monkeypatch.setattr(imslp, "dump", mwdump.MediaWikiDump(dump_path))
+    monkeypatch.setattr(imslp, "get_pages_for_category", lambda mw, category: ["Work (Composer)"])
+    assert imslp.category_pagelist("For unaccompanied chorus") == ["Work (Composer)"]
+    assert imslp.category_pagelist("Motets") == ["Ave verum corpus (William Byrd)"]
@@ -0,0 +1,148 @@
+import concurrent.futures
+import io
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+MXML_TO_MEI = os.path.join(os.path.dirname(__file__), "..", "algorithms", "mxml-to-mei")
+
+
+@pytest.fixture
+def mxml_to_mei(monkeypatch):
+    pytest.importorskip("boto3")
+    monkeypatch.syspath_prepend(MXML_TO_MEI)
+    import mxml_to_mei
+    return mxml_to_mei
+
+
+def test_convert_ce_nodes_reports_failures(mxml_to_mei, monkeypatch):
+    stored = []
+
+    def get_mediaobject_to_convert(mediaobject_id):
+        if mediaobject_id == "converted":
+            return None
+        if mediaobject_id == "unreachable":
+            raise ConnectionError("connection reset")
+        return {"identifier": mediaobject_id, "contentUrl": f"https://cpdl.org/{mediaobject_id}.xml"}, "work"
+
+    class Pool:
+        def __init__(self, workers, use_toolkit):
+            pass
+
+        def convert(self, inputdata, inputname):
+            if inputname.endswith("broken.xml"):
+                raise mxml_to_mei.FailedToConvertXml("not musicxml")
+            return f"<mei>{inputdata.read().decode()}</mei>", False, "Verovio 3.0"
+
+        def shutdown(self):
+            pass
+
+    def store_mei(mediaobject, work_id, mei_content, used_musescore, verovio_version, applications=None):
+        if mediaobject["identifier"] == "rejected":
+            raise ValueError("upload failed")
+        stored.append((mediaobject["identifier"], mei_content, applications))
+        return "mei-" + mediaobject["identifier"]
+
+    monkeypatch.setattr(mxml_to_mei, "get_mediaobject_to_convert", get_mediaobject_to_convert)
+    monkeypatch.setattr(mxml_to_mei, "download_mediaobject_file", lambda mo: io.BytesIO(mo["identifier"].encode()))
+    monkeypatch.setattr(mxml_to_mei, "store_mei", store_mei)
+    monkeypatch.setattr(mxml_to_mei, "get_verovio_toolkit_version", lambda: "Verovio 3.0")
+    monkeypatch.setattr(mxml_to_mei, "get_application_ids", lambda versions, musescore=False: {"Verovio 3.0": "app"})
+    monkeypatch.setattr(mxml_to_mei.shutil, "which", lambda command: None)
+    monkeypatch.setattr(mxml_to_mei, "_ConversionPool", Pool)
+
+    ids = ["a", "converted", "unreachable", "broken", "rejected", "b", "a"]
+    results, failures = mxml_to_mei.convert_ce_nodes(ids, workers=2, downloaders=2, uploaders=2)
+
+    assert sorted(results) == [("a", "mei-a"), ("b", "mei-b")]
+    assert sorted(stored) == [("a", "<mei>a</mei>", {"Verovio 3.0": "app"}),
+                              ("b", "<mei>b</mei>", {"Verovio 3.0": "app"})]
+    assert sorted((mediaobject_id, stage) for mediaobject_id, stage, _ in failures) == [
+        ("broken", "convert"), ("rejected", "upload"), ("unreachable", "download")]
+
+
+@pytest.fixture
+def engines(mxml_to_mei, monkeypatch):
+    """The verovio toolkit fails on files named toolkit-error.xml, the verovio command converts everything"""
+    def run_mxml_to_mei_toolkit(data):
+        if data == "toolkit-error":
+            raise mxml_to_mei.VerovioToolkitError("verovio couldn't load the file")
+        return "<mei toolkit/>"
+
+    def run_mxml_to_mei_verovio(inputname, outputname):
+        return "<mei command/>"
+
+    monkeypatch.setattr(mxml_to_mei, "run_mxml_to_mei_toolkit", run_mxml_to_mei_toolkit)
+    monkeypatch.setattr(mxml_to_mei, "run_mxml_to_mei_verovio", run_mxml_to_mei_verovio)
+    monkeypatch.setattr(mxml_to_mei, "get_verovio_toolkit_version", lambda: "Verovio toolkit")
+    monkeypatch.setattr(mxml_to_mei, "get_verovio_command_version", lambda: "Verovio command")
+    monkeypatch.setattr(mxml_to_mei.shutil, "which", lambda command: "/usr/bin/verovio")
+
+
+class Executors(list):
+    def __init__(self):
+        super().__init__()
+        # (executor, inputname, use_toolkit) of each conversion
+        self.submitted = []
+
+
+class Executor:
+    """Runs conversions in this process. Toolkit conversions of files named crash.xml break the pool,
+    like a worker process that segfaults"""
+
+    def __init__(self, submitted):
+        self.submitted = submitted
+        self.broken = False
+        self.was_shutdown = False
+
+    def submit(self, function, inputdata, inputname, use_toolkit):
+        self.submitted.append((self, inputname, use_toolkit))
+        future = concurrent.futures.Future()
+        if self.broken or (use_toolkit and inputname == "crash.xml"):
+            self.broken = True
+            future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        else:
+            future.set_result(function(inputdata, inputname, use_toolkit))
+        return future
+
+    def shutdown(self, wait=True):
+        self.was_shutdown = True
+
+
+@pytest.fixture
+def executors(mxml_to_mei, monkeypatch):
+    executors = Executors()
+
+    def new_pool(pool):
+        executors.append(Executor(executors.submitted))
+        return executors[-1]
+
+    monkeypatch.setattr(mxml_to_mei._ConversionPool, "_new_pool", new_pool)
+    return executors
+
+
+def test_conversion_pool_falls_back_to_the_command(mxml_to_mei, engines, executors):
+    pool = mxml_to_mei._ConversionPool(2, use_toolkit=True)
+
+    assert pool.convert(io.BytesIO(b"notes"), "ok.xml") == ("<mei toolkit/>", False, "Verovio toolkit")
+    # The toolkit fails, the worker converts the file with the command
+    assert pool.convert(io.BytesIO(b"toolkit-error"), "toolkit-error.xml") == (
+        "<mei command/>", False, "Verovio command")
+    assert len(executors) == 1
+
+    # The worker dies, the pool is replaced and the file is converted again with the command
+    assert pool.convert(io.BytesIO(b"notes"), "crash.xml") == ("<mei command/>", False, "Verovio command")
+    assert len(executors) == 2 and executors[0].was_shutdown
+    assert [(executors.index(e), name, toolkit) for e, name, toolkit in executors.submitted[-2:]] == [
+        (0, "crash.xml", True), (1, "crash.xml", False)]
+    # The new pool keeps using the toolkit
+    assert pool.convert(io.BytesIO(b"notes"), "ok.xml") == ("<mei toolkit/>", False, "Verovio toolkit")
+
+
+def test_conversion_pool_without_toolkit_raises(mxml_to_mei, engines, executors):
+    pool = mxml_to_mei._ConversionPool(2, use_toolkit=False)
+    executors[0].broken = True
+    with pytest.raises(BrokenProcessPool):
+        pool.convert(io.BytesIO(b"notes"), "ok.xml")
+    assert len(executors) == 1
@@ -0,0 +1,40 @@
+import threading
+
+import pytest
+
+from ceimport import prefetch
+
+
+def test_prefetch_order_and_errors():
+    assert list(prefetch(iter(range(10)), 2)) == list(range(10))
+
+    def fail():
+        yield 1
+        raise ValueError("page 2 failed")
+
+    items = prefetch(fail(), 2)
+    assert next(items) == 1
+    with pytest.raises(ValueError):
+        next(items)
+
+
+def test_producer_stops_when_the_consumer_stops():
+    produced = []
+
+    def pages():
+        while True:
+            produced.append(len(produced))
+            yield produced[-1]
+
+    items = prefetch(pages(), 2)
+    for item in items:
+        if item == 3:
+            break
+    items.close()
+
+    threads = [t for t in threading.enumerate() if t.name == "prefetch"]
+    for thread in threads:
+        thread.join(timeout=2)
+    assert not any(thread.is_alive() for thread in threads)
+    # The items that were read, the buffer, and the item that was waiting for space
+    assert len(produced) <= 4 + 2 + 1
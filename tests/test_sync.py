@@ -0,0 +1,43 @@
+from ceimport import sync
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class Session:
+    def __init__(self, responses):
+        self.responses = responses
+        self.params = []
+
+    def get(self, url, params):
+        self.params.append(dict(params))
+        return Response(self.responses.pop(0))
+
+
+def test_titles_changed_since_include_moves():
+    session = Session([
+        {"continue": {"rccontinue": "20260101000000|2", "continue": "-||"},
+         "query": {"recentchanges": [
+             {"type": "edit", "ns": 0, "title": "Ave Maria (Tomás Luis de Victoria)"},
+             {"type": "log", "ns": 0, "title": "Ave verum corpus (Byrd)", "logtype": "move",
+              "logaction": "move", "logparams": {"target_ns": 0, "target_title": "Ave verum corpus (William Byrd)"}},
+         ]}},
+        {"query": {"recentchanges": [
+            {"type": "new", "ns": 0, "title": "Laudate Dominum (Tallis)"},
+            {"type": "log", "ns": 0, "title": "Spam", "logtype": "delete", "logaction": "delete", "logparams": {}},
+        ]}},
+    ])
+    titles = sync.get_titles_changed_since(session, "https://cpdl.org/wiki/api.php", "2026-01-01T00:00:00Z")
+
+    assert titles == {"Ave Maria (Tomás Luis de Victoria)", "Ave verum corpus (Byrd)",
+                      "Ave verum corpus (William Byrd)", "Laudate Dominum (Tallis)"}
+    assert session.params[0]["rctype"] == "new|edit|log"
+    assert session.params[1]["rccontinue"] == "20260101000000|2"
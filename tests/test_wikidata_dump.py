@@ -0,0 +1,84 @@
+import bz2
+import os
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from ceimport.sites import wikidata_dump
+from tests.conftest import FIXTURES
+
+DUMP = os.path.join(FIXTURES, "wikidata-dump.json")
+
+
+@pytest.fixture(autouse=True)
+def index(tmp_path, monkeypatch):
+    monkeypatch.setenv("CEIMPORT_WIKIDATA_INDEX", str(tmp_path / "wikidata-index.sqlite"))
+    monkeypatch.setattr(wikidata_dump, "_connection", None)
+    yield
+    if wikidata_dump._connection is not None:
+        wikidata_dump._connection.close()
+
+
+def test_extract_dump(tmp_path):
+    bz2_path = str(tmp_path / "wikidata-dump.json.bz2")
+    with open(DUMP, "rb") as fp, bz2.open(bz2_path, "wb") as out:
+        out.write(fp.read())
+    wikidata_dump.extract_dump(bz2_path)
+
+    bach = wikidata_dump.get_entity("Q1339")
+    assert bach["labels"] == {"en": "Johann Sebastian Bach", "nl": "Johann Sebastian Bach"}
+    assert bach["descriptions"]["en"] == "German composer (1685–1750)"
+    assert bach["identifiers"] == {"musicbrainz_artist": ["24f1766e-9635-4d58-a4d4-9413f9f98a4c"],
+                                   "viaf": ["12304462"]}
+    assert bach["sitelinks"]["enwiki"]["url"] == "https://en.wikipedia.org/wiki/Johann_Sebastian_Bach"
+    assert set(bach["sitelinks"]) == {"enwiki", "nlwiki"}
+    # Entities without one of the identifiers are not kept
+    assert wikidata_dump.get_entity("Q90") is None
+    assert wikidata_dump.get_qid_by_identifier("imslp", "Category:Haydn, Joseph") == "Q7349"
+    assert wikidata_dump.get_qid_by_sitelink("enwiki", "Joseph_Haydn") == "Q7349"
+
+
+def test_offline_enrichment(monkeypatch):
+    # Imported here, so that its http cache is made in the temporary working directory
+    from ceimport.sites import wikidata
+
+    requested = []
+
+    def no_network(*args, **kwargs):
+        raise AssertionError("used the network")
+
+    def wikipedia_api(url):
+        requested.append(url)
+        title = parse_qs(urlparse(url).query)["titles"][0]
+        return Response({"query": {"normalized": [{"from": title, "to": "Paris"}],
+                                   "pages": {"22989": {"pageid": 22989, "title": "Paris",
+                                                       "pageprops": {"wikibase_item": "Q90"}}}}})
+
+    monkeypatch.setattr(wikidata.session, "get", no_network)
+    monkeypatch.setattr(wikidata, "Client", no_network)
+    # Wikipedia introductions aren't in the dump, they're still loaded from Wikipedia
+    monkeypatch.setattr(wikidata, "get_description_from_wikipedia", lambda title: f"<p>Intro of {title}</p>")
+    wikidata_dump.extract_dump(DUMP)
+
+    person = wikidata.load_person_from_wikidata_url("https://www.wikidata.org/wiki/Q1339")
+    assert person["name"] == "Johann Sebastian Bach"
+    assert person["description"] == "German composer (1685–1750)"
+
+    person = wikidata.load_person_from_wikipedia_wikidata_url("https://www.wikidata.org/wiki/Q1339", "nl")
+    assert person["source"] == "https://nl.wikipedia.org/wiki/Johann_Sebastian_Bach"
+    assert person["description"] == "<p>Intro of Johann Sebastian Bach</p>"
+
+    assert wikidata.get_wikidata_id_from_wikipedia_url("https://en.wikipedia.org/wiki/Joseph_Haydn") == "Q7349"
+
+    # Pages that aren't in the index are looked up on Wikipedia
+    monkeypatch.setattr(wikidata.session, "get", wikipedia_api)
+    assert wikidata.get_wikidata_id_from_wikipedia_url("https://en.wikipedia.org/wiki/Paris") == "Q90"
+    assert len(requested) == 1
+
+
+class Response:
+    def __init__(self, data):
+        self.data = data
+
+    def json(self):
+        return self.data
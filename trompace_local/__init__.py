@@ -1,9 +1,14 @@
 """
 Local functions to select data from the Trompa CE.
 """
+import asyncio
+import functools
+
 import trompace as ce
 from trompace.connection import submit_query
 
+from ceimport import connection
+
 """
 Constants for registry in Trompa
 """
@@ -12,24 +17,31 @@ GLOBAL_PUBLISHER = "https://www.muziekweb.nl"  # CE Publisher id????
 GLOBAL_IMPORTER_REPO = "https://github.com/trompamusic/ce-data-import"
 
 
-async def queryFor(dataType, field, value):
+async def submit_query_async(querystr, auth_required=False):
     """
-    Queries CE for objects by type and identifying field value.
+    Submits a query to the CE without blocking the event loop. The query is run
+    in the loop's default executor, so that many queries can be in flight at once.
+    (trompace's own submit_query_async makes a blocking request)
     """
-    search_query = f"""
-    query {{
-        {dataType}({field} : \"{value}\") {{
-            identifier
-            name
-            source
-            contributor
-            publisher
-        }}
-    }}
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(submit_query, querystr, auth_required))
+
+
+async def run_async(function, *args, **kwargs):
+    """
+    Runs a blocking `ceimport.connection` function in the loop's default executor, like
+    `submit_query_async`.
     """
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(None, functools.partial(function, *args, **kwargs))
 
-    resultset = ce.connection.submit_query(search_query)
-    # resultset = await ce.connection.submit_query_async(search_query)
+
+async def queryFor(dataType, field, value):
+    """
+    Queries CE for objects by type and identifying field value.
+    """
+    resultset = await run_async(connection.query_by_field, dataType, field, value,
+                                ("identifier", "name", "source", "contributor", "publisher"), auth_required=False)
 
     return resultset["data"][dataType]
 
@@ -45,3 +57,27 @@ async def lookupIdentifier(dataType, source):
         return objects[0]["identifier"]
 
     return None
+
+
+async def lookupIdentifiers(pairs, batch_size=100):
+    """
+    Lookup the identifiers of many objects by their source link, with one query
+    for up to `batch_size` objects.
+
+    Arguments:
+        pairs: an iterable of (dataType, source) tuples
+    Returns:
+        a dictionary of {(dataType, source): identifier}. The identifier is None
+        for objects that aren't in the CE
+    """
+    pairs = list(dict.fromkeys(pairs))
+    identifiers = {}
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        # Each lookup gets an alias, so that the same type can be queried more than once
+        resultset = await run_async(connection.lookup_by_source, batch, auth_required=False)
+        for i, pair in enumerate(batch):
+            objects = resultset["data"][f"q{i}"]
+            identifiers[pair] = objects[0]["identifier"] if isinstance(objects, list) and objects else None
+
+    return identifiers